@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+# Usage: python -m benchmarks [--sizes 100,1000,10000] [--files 10000]
+#                             [--case NAME]... [--repeat N] [--json] [--save FILE]
+#                             [--baseline FILE] [--tolerance 0.25]
+#
+# Each case is timed --repeat times and the best run is kept; peak memory is
+# taken from a separate run under tracemalloc so tracing doesn't skew the
+# timings. With --baseline, exits 1 when throughput drops, or peak memory
+# grows, by more than --tolerance against the saved results.
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from rmm import fileops
+from rmm.cache import JsonCache
+from rmm.mod import ModFolder
+from rmm.modlist import ModListFile, ModListV2Format
+from rmm.modsconfig import ModsConfig
+from rmm.steam import WorkshopWebScraper
+
+from . import fixtures
+from .server import workshop_server
+
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_FILES = 10000
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+
+
+class Fixture:
+    def __init__(self, root: Path, size: int, seed: int = 0):
+        self.size = size
+        self.specs = fixtures.mod_specs(size, seed)
+        self.mods = fixtures.to_mods(self.specs)
+        self.mod_path = fixtures.write_mods(root, self.specs)
+        self.rules_path = fixtures.write_community_rules(
+            root / "communityRules.json", self.specs, seed
+        )
+        self.community_db = json.loads(self.rules_path.read_text())
+        self.modsconfig_path = fixtures.write_modsconfig(
+            root / "Config" / "ModsConfig.xml", self.specs
+        )
+        self.modlists = fixtures.write_modlists(root, self.specs)
+        self.out = root / "out"
+        self.out.mkdir()
+        # Keep the About.xml metadata cache out of the user's cache dir.
+        os.environ["RMM_CACHE_PATH"] = str(root / "cache")
+        ModFolder._cache = JsonCache("mods")
+
+
+def _cold_modfolder():
+    ModFolder._cache = JsonCache("mods")
+    with contextlib.suppress(OSError):
+        ModFolder._cache.path.unlink()
+
+
+class Case(NamedTuple):
+    run: Callable[[object], object]
+    setup: Callable[[], object] = lambda: None
+    items: int = 1
+
+
+def _reordered_modsconfig(fx: Fixture) -> ModsConfig:
+    # ModsConfig.write skips unchanged lists, so give it something to write.
+    config = ModsConfig(fx.modsconfig_path)
+    config.mods = dict.fromkeys(reversed(list(config.mods)))
+    return config
+
+
+def _autosort(fx: Fixture, config: ModsConfig):
+    with contextlib.redirect_stdout(io.StringIO()):
+        config.autosort(fx.mods, None, fx.community_db)
+
+
+# Cases whose cost depends on the number of mods; they run at every size.
+SCALED_CASES: Dict[str, Callable[[Fixture], Case]] = {
+    "modfolder.read": lambda fx: Case(
+        lambda _: ModFolder.read(fx.mod_path), _cold_modfolder, items=fx.size
+    ),
+    "modfolder.read.cached": lambda fx: Case(
+        lambda _: ModFolder.read(fx.mod_path),
+        lambda: ModFolder.read(fx.mod_path),
+        items=fx.size,
+    ),
+    "modlist.read.v2": lambda fx: Case(
+        lambda _: ModListFile.read(fx.modlists["v2"]), items=fx.size
+    ),
+    "modlist.read.v3": lambda fx: Case(
+        lambda _: ModListFile.read(fx.modlists["v3"]), items=fx.size
+    ),
+    "modlist.write.v2": lambda fx: Case(
+        lambda _: ModListFile.write(fx.out / "modlist.csv", fx.mods, ModListV2Format()),
+        items=fx.size,
+    ),
+    "modsconfig.write": lambda fx: Case(
+        lambda config: config.write(),
+        lambda: _reordered_modsconfig(fx),
+        items=fx.size,
+    ),
+    "autosort": lambda fx: Case(
+        lambda config: _autosort(fx, config),
+        lambda: ModsConfig(fx.modsconfig_path),
+        items=fx.size,
+    ),
+}
+
+# Workshop pages have a fixed size, so these run once.
+WORKSHOP_CASES: Dict[str, Callable[[Fixture], Case]] = {
+    "workshop.search": lambda fx: Case(
+        lambda _: WorkshopWebScraper.search("bench"), items=1
+    ),
+    "workshop.detail": lambda fx: Case(
+        lambda _: WorkshopWebScraper.detail(fx.specs[0].steamid), items=1
+    ),
+}
+
+
+class TreeFixture:
+    def __init__(self, root: Path, files: int):
+        self.size = files
+        self.source = fixtures.write_file_tree(root / "source", files)
+        self.root = root
+        self.count = 0
+
+    def destination(self) -> Path:
+        # A fresh path per run; copies are cleaned up with the fixture.
+        self.count += 1
+        return self.root / f"copy{self.count}"
+
+    def copied(self) -> Path:
+        path = self.destination()
+        shutil.copytree(self.source, path)
+        return path
+
+
+# One synthetic mod with many small files; stdlib cases are the reference.
+TREE_CASES: Dict[str, Callable[[TreeFixture], Case]] = {
+    "tree.copy": lambda fx: Case(
+        lambda dst: fileops.copy_tree(fx.source, dst), fx.destination, fx.size
+    ),
+    "tree.copy.shutil": lambda fx: Case(
+        lambda dst: shutil.copytree(fx.source, dst), fx.destination, fx.size
+    ),
+    "tree.remove": lambda fx: Case(fileops.remove_tree, fx.copied, fx.size),
+    "tree.remove.shutil": lambda fx: Case(shutil.rmtree, fx.copied, fx.size),
+}
+
+
+def measure(case: Case, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        state = case.setup()
+        start = time.perf_counter()
+        case.run(state)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    state = case.setup()
+    tracemalloc.start()
+    try:
+        case.run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = max(best or 0.0, 1e-9)
+    return {
+        "seconds": round(best, 6),
+        "items_per_s": round(case.items / best, 2),
+        "peak_bytes": peak,
+    }
+
+
+@contextlib.contextmanager
+def local_workshop(fx: Fixture):
+    pages = {"search": fixtures.workshop_search_page(fx.specs)}
+    for spec in fx.specs[: fixtures.WORKSHOP_RESULTS]:
+        pages[f"detail:{spec.steamid}"] = fixtures.workshop_detail_page(spec)
+    saved = (WorkshopWebScraper.index_query, WorkshopWebScraper.detail_query)
+    with workshop_server(pages) as url:
+        WorkshopWebScraper.index_query = url + "/workshop/browse/?searchtext={}"
+        WorkshopWebScraper.detail_query = url + "/sharedfiles/filedetails/?id={}"
+        try:
+            yield
+        finally:
+            WorkshopWebScraper.index_query, WorkshopWebScraper.detail_query = saved
+
+
+def run(sizes: List[int], files: int, cases: List[str], repeat: int) -> List[dict]:
+    results = []
+    if files and (not cases or set(cases) & set(TREE_CASES)):
+        with tempfile.TemporaryDirectory(prefix="rmm-bench-") as tmp:
+            tree = TreeFixture(Path(tmp), files)
+            for name, make in TREE_CASES.items():
+                if not cases or name in cases:
+                    results.append(
+                        {"case": name, "size": files, **measure(make(tree), repeat)}
+                    )
+                    print_progress(results[-1])
+    for n, size in enumerate(sizes):
+        with tempfile.TemporaryDirectory(prefix="rmm-bench-") as tmp:
+            fx = Fixture(Path(tmp), size)
+            for name, make in SCALED_CASES.items():
+                if not cases or name in cases:
+                    results.append(
+                        {"case": name, "size": size, **measure(make(fx), repeat)}
+                    )
+                    print_progress(results[-1])
+            if n:
+                continue
+            with local_workshop(fx):
+                for name, make in WORKSHOP_CASES.items():
+                    if not cases or name in cases:
+                        results.append(
+                            {"case": name, "size": 0, **measure(make(fx), repeat)}
+                        )
+                        print_progress(results[-1])
+    return results
+
+
+def print_progress(result: dict):
+    print(f"{result['case']} [{result['size']}] {result['seconds']}s", file=sys.stderr)
+
+
+def regressions(results: List[dict], baseline: List[dict], tolerance: float):
+    saved = {(n["case"], n["size"]): n for n in baseline}
+    for result in results:
+        base = saved.get((result["case"], result["size"]))
+        if not base:
+            continue
+        if result["items_per_s"] < base["items_per_s"] * (1 - tolerance):
+            yield (
+                f"{result['case']} [{result['size']}]: throughput "
+                f"{result['items_per_s']}/s, baseline {base['items_per_s']}/s"
+            )
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + tolerance):
+            yield (
+                f"{result['case']} [{result['size']}]: peak memory "
+                f"{result['peak_bytes']} bytes, baseline {base['peak_bytes']} bytes"
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(n) for n in DEFAULT_SIZES),
+        help="comma separated mod counts",
+    )
+    parser.add_argument(
+        "--case",
+        action="append",
+        default=[],
+        choices=list(SCALED_CASES) + list(WORKSHOP_CASES) + list(TREE_CASES),
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=DEFAULT_FILES,
+        help="files in the synthetic mod for tree cases, 0 to skip",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--save", type=Path, help="write results to this file")
+    parser.add_argument("--baseline", type=Path, help="compare against this file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    sizes = [int(n) for n in args.sizes.split(",") if n]
+    results = run(sizes, args.files, args.case, max(args.repeat, 1))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        from tabulate import tabulate
+
+        print(tabulate(results, headers="keys"))
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.baseline:
+        try:
+            baseline = json.loads(args.baseline.read_text())
+        except OSError:
+            print(f"No baseline at {args.baseline}; skipping comparison")
+            return 0
+        failures = list(regressions(results, baseline, args.tolerance))
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+# Synthetic inputs for the benchmarks: a Mods folder, communityRules.json,
+# ModsConfig.xml, mod lists and Workshop pages. Everything is derived from a
+# seed so runs on the same machine are comparable.
+
+from __future__ import annotations
+
+import json
+import random
+from html import escape
+from pathlib import Path
+from typing import List, NamedTuple
+
+from rmm.mod import Mod
+from rmm.modlist import ModListEntry, ModListFile, ModListV2Format, ModListV3Format
+
+WORDS = (
+    "adds new weapons armor factions animals plants research projects quests "
+    "traits genes xenotypes furniture buildings hediffs incidents storytellers "
+    "balance patch compatibility framework textures sounds translations ui"
+).split()
+VERSIONS = ["1.1", "1.2", "1.3", "1.4", "1.5"]
+STEAMID_BASE = 2000000000
+# Real About.xml descriptions range from a line to several kilobytes.
+DESCRIPTION_WORDS = (20, 600)
+MAX_LOAD_AFTER = 6
+WORKSHOP_RESULTS = 30
+
+
+class ModSpec(NamedTuple):
+    packageid: str
+    name: str
+    author: str
+    steamid: int
+    load_after: List[str]
+    load_before: List[str]
+    versions: List[str]
+    description: str
+
+
+def mod_specs(count: int, seed: int = 0) -> List[ModSpec]:
+    # Dependencies only point at lower indexes (loadAfter) or higher ones
+    # (loadBefore), so the graph is a DAG like a sane real mod list.
+    rng = random.Random(seed)
+    pids = [f"bench.author{n % 97}.mod{n}" for n in range(count)]
+    specs = []
+    for n, pid in enumerate(pids):
+        after = rng.sample(pids[:n], min(n, rng.randint(0, MAX_LOAD_AFTER)))
+        before = []
+        if n + 1 < count and rng.random() < 0.1:
+            before = [pids[rng.randrange(n + 1, count)]]
+        words = rng.randint(*DESCRIPTION_WORDS)
+        specs.append(
+            ModSpec(
+                packageid=pid,
+                name=f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {n}",
+                author=f"Author{n % 97}",
+                steamid=STEAMID_BASE + n,
+                load_after=after,
+                load_before=before,
+                versions=VERSIONS[rng.randrange(len(VERSIONS)) :],
+                description=" ".join(rng.choice(WORDS) for _ in range(words)),
+            )
+        )
+    return specs
+
+
+def _li(items: List[str]) -> str:
+    return "".join(f"<li>{escape(n)}</li>" for n in items)
+
+
+def about_xml(spec: ModSpec) -> str:
+    dependencies = "".join(
+        "<li>"
+        f"<packageId>{pid}</packageId>"
+        f"<displayName>{pid}</displayName>"
+        f"<steamWorkshopUrl>steam://url/CommunityFilePage/{STEAMID_BASE}</steamWorkshopUrl>"
+        "</li>"
+        for pid in spec.load_after[:2]
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<ModMetaData>\n"
+        f"  <name>{escape(spec.name)}</name>\n"
+        f"  <author>{spec.author}</author>\n"
+        f"  <packageId>{spec.packageid}</packageId>\n"
+        f"  <supportedVersions>{_li(spec.versions)}</supportedVersions>\n"
+        f"  <modDependencies>{dependencies}</modDependencies>\n"
+        f"  <loadAfter>{_li(spec.load_after)}</loadAfter>\n"
+        f"  <loadBefore>{_li(spec.load_before)}</loadBefore>\n"
+        f"  <description>{escape(spec.description)}</description>\n"
+        "</ModMetaData>\n"
+    )
+
+
+def write_mods(root: Path, specs: List[ModSpec]) -> Path:
+    mod_path = root / "Mods"
+    for spec in specs:
+        about = mod_path / spec.packageid / "About"
+        about.mkdir(parents=True)
+        (about / "About.xml").write_text(about_xml(spec), encoding="utf-8")
+        (about / "PublishedFileId.txt").write_text(str(spec.steamid))
+    return mod_path
+
+
+def community_rules(specs: List[ModSpec], seed: int = 0) -> dict:
+    # Roughly a fifth of mods get an extra community loadAfter rule.
+    rng = random.Random(seed + 1)
+    rules = {}
+    for n, spec in enumerate(specs):
+        if n and rng.random() < 0.2:
+            target = specs[rng.randrange(n)].packageid
+            rules[spec.packageid] = {"loadAfter": {target: ["bench"]}}
+    return {"timestamp": 0, "rules": rules}
+
+
+def write_community_rules(path: Path, specs: List[ModSpec], seed: int = 0) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(community_rules(specs, seed)), encoding="utf-8")
+    return path
+
+
+def write_modsconfig(path: Path, specs: List[ModSpec]) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    active = ["ludeon.rimworld"] + [n.packageid for n in specs]
+    path.write_text(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<ModsConfigData>\n"
+        "  <version>1.4.3901 rev20</version>\n"
+        f"  <activeMods>{_li(active)}</activeMods>\n"
+        "  <knownExpansions><li>ludeon.rimworld.royalty</li></knownExpansions>\n"
+        "</ModsConfigData>\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+def to_mods(specs: List[ModSpec]) -> List[Mod]:
+    return [
+        Mod(
+            packageid=n.packageid,
+            name=n.name,
+            author=n.author,
+            steamid=n.steamid,
+            before=n.load_after,
+            after=n.load_before,
+            versions=n.versions,
+        )
+        for n in specs
+    ]
+
+
+def write_modlists(root: Path, specs: List[ModSpec]) -> dict:
+    mods = to_mods(specs)
+    entries = [
+        ModListEntry(
+            packageid=n.packageid,
+            steamid=n.steamid,
+            name=n.name,
+            author=n.author,
+            revision="1700000000",
+            size=4096,
+            hash=f"{n.steamid:064x}",
+        )
+        for n in specs
+    ]
+    paths = {"v2": root / "modlist.csv", "v3": root / "modlist.lock"}
+    ModListFile.write(paths["v2"], mods, ModListV2Format())
+    ModListFile.write(paths["v3"], entries, ModListV3Format())
+    return paths
+
+
+def workshop_search_page(specs: List[ModSpec]) -> bytes:
+    items = "".join(
+        '<div class="workshopItem">'
+        f'<a class="ugc" href="https://steamcommunity.com/sharedfiles/filedetails/?id={n.steamid}">'
+        '<img class="workshopItemPreviewImage" src="preview.jpg"></a>'
+        f'<div class="workshopItemTitle">{escape(n.name)}</div>'
+        f'<div class="workshopItemAuthorName">by {n.author}</div>'
+        "</div>"
+        for n in specs[:WORKSHOP_RESULTS]
+    )
+    return _page(f'<div class="workshopBrowseItems">{items}</div>')
+
+
+def workshop_detail_page(spec: ModSpec) -> bytes:
+    return _page(
+        f'<div class="workshopItemTitle">{escape(spec.name)}</div>'
+        '<div class="detailsStatsContainerRight">'
+        '<div class="detailsStatRight">1.234 MB</div>'
+        '<div class="detailsStatRight">3 Jan, 2021 @ 1:23pm</div>'
+        '<div class="detailsStatRight">4 Feb, 2023 @ 4:56pm</div>'
+        "</div>"
+        f'<div class="workshopItemDescription">{escape(spec.description)}</div>'
+        '<div class="numRatings">1,234 ratings</div>'
+        '<div class="fileRatingDetails"><img src="4-star_large.png"></div>'
+    )
+
+
+def _page(body: str) -> bytes:
+    # Steam pages carry a lot of markup around the parts rmm reads.
+    chrome = "".join(
+        f'<div class="responsive_menu_{n}"><a href="#">{w}</a></div>'
+        for n, w in enumerate(WORDS * 20)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Steam Workshop</title></head>"
+        f"<body>{chrome}{body}{chrome}</body></html>"
+    ).encode()
+
+
+# Share of files per folder and their size range in bytes, roughly what a
+# large content mod ships.
+TREE_LAYOUT = [
+    ("Defs", 0.45, (1024, 16 * 1024)),
+    ("Languages", 0.3, (256, 8 * 1024)),
+    ("Textures", 0.2, (8 * 1024, 256 * 1024)),
+    ("Sounds", 0.05, (64 * 1024, 2 * 1024 * 1024)),
+]
+TREE_FANOUT = 50
+
+
+def write_file_tree(root: Path, files: int, seed: int = 0) -> Path:
+    rng = random.Random(seed + 2)
+    block = (
+        rng.randbytes(2 * 1024 * 1024)
+        if hasattr(rng, "randbytes")
+        else bytes(rng.getrandbits(8) for _ in range(2 * 1024 * 1024))
+    )
+    for folder, share, (low, high) in TREE_LAYOUT:
+        for n in range(int(files * share)):
+            path = root / folder / f"Group{n // TREE_FANOUT}" / f"file{n}.dat"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(block[: rng.randint(low, high)])
+    return root
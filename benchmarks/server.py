@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# Serves generated Workshop pages on localhost so the scraper can be measured
+# without network access or Steam's rate limits.
+
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        pages: Dict[str, bytes] = self.server.pages  # type: ignore
+        if url.path.startswith("/workshop/browse"):
+            body = pages.get("search")
+        else:
+            body = pages.get(f"detail:{query.get('id', [''])[0]}")
+
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def workshop_server(pages: Dict[str, bytes]) -> Iterator[str]:
+    # Yields the base URL. pages maps "search" and "detail:<steamid>" to HTML.
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.pages = pages  # type: ignore
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
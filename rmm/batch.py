@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import shlex
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from .manager import Manager
+from .mod import EXPANSION_PACKAGES, Mod
+from .modlist import ModListFile, ModListV2Format, ModListV3Format
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchRunner:
+    # Runs rmm commands read from a script against one Manager, so paths, the
+    # installed index and ModsConfig are loaded once and ModsConfig.xml is
+    # written a single time at the end. Commands never prompt.
+    COMMANDS = [
+        "enable",
+        "disable",
+        "remove",
+        "sync",
+        "sort",
+        "export",
+        "import",
+        "list",
+        "order",
+        "verify",
+    ]
+
+    def __init__(self, manager: Manager):
+        self.manager = manager
+
+    def _resolve(self, terms: List[str]) -> List[Mod]:
+        installed = self.manager.installed_mods_dict()
+        if terms == ["-a"]:
+            return list(installed.values())
+        mods = []
+        for term in terms:
+            term = term.lower()
+            mod: Optional[Mod] = installed.get(term)
+            if not mod and term.isdigit():
+                mod = next((m for m in installed.values() if m == int(term)), None)
+            if not mod:
+                mod = next((m for m in EXPANSION_PACKAGES if m == term), None)
+            if not mod:
+                raise BatchError(f"No installed mod matches '{term}'")
+            mods.append(mod)
+        return mods
+
+    def enable(self, args: List[str]):
+        self.manager.enable_mods(self._resolve(args))
+
+    def disable(self, args: List[str]):
+        self.manager.disable_mods(self._resolve(args))
+
+    def remove(self, args: List[str]):
+        self.manager.remove_mods(self._resolve(args))
+
+    def sync(self, args: List[str]):
+        try:
+            steamids = [int(n) for n in args]
+        except ValueError:
+            raise BatchError("sync takes Workshop ids in batch mode")
+        self.manager.sync_mods([Mod(steamid=n) for n in steamids])
+
+    def sort(self, args: List[str]):
+        self.manager.sort_mods()
+
+    def export(self, args: List[str]):
+        mods = None
+        lock = False
+        while len(args) > 1 and args[0] in ("-e", "-d", "-l"):
+            flag = args.pop(0)
+            if flag == "-e":
+                mods = self.manager.enabled_mods()
+            elif flag == "-d":
+                mods = self.manager.disabled_mods()
+            else:
+                lock = True
+        if len(args) != 1:
+            raise BatchError("export takes a single file name")
+        if mods is None:
+            mods = self.manager.installed_mods()
+        if lock:
+            entries = self.manager.lock_mods(mods)
+            ModListFile.write(Path(args[0]), entries, ModListV3Format())
+        else:
+            ModListFile.write(Path(args[0]), mods, ModListV2Format())
+        print(f"Mod list written to {args[0]}")
+
+    def _import(self, args: List[str]):
+        from .plan import Planner
+
+        exact = bool(args) and args[0] == "-r"
+        if exact:
+            args = args[1:]
+        if len(args) != 1:
+            raise BatchError("import takes a single file name")
+        entries = ModListFile.read(Path(args[0]))
+        if not entries:
+            raise BatchError(f"No mods read from {args[0]}")
+        plan = Planner.plan(self.manager, entries, exact=exact)
+        print(plan.summary())
+        Planner.apply(self.manager, plan)
+
+    def list(self, args: List[str]):
+        from .cli import tabulate_mod_or_wr
+
+        print(tabulate_mod_or_wr(self.manager.installed_mods(), alpha=True))
+
+    def order(self, args: List[str]):
+        from .cli import tabulate_mod_or_wr
+
+        print(
+            tabulate_mod_or_wr(
+                self.manager.order_mods(), numbered=True, reversed_numbering=False
+            )
+        )
+
+    def verify(self, args: List[str]):
+        from .cli import print_verify
+
+        print_verify(self.manager.verify_report())
+
+    def execute(self, line: str):
+        words = shlex.split(line, comments=True)
+        if not words:
+            return
+        command, args = words[0], words[1:]
+        if command not in self.COMMANDS:
+            raise BatchError(f"Unknown batch command '{command}'")
+        getattr(self, "_import" if command == "import" else command)(args)
+
+    def run(self, lines: Iterable[str]) -> bool:
+        with self.manager.deferred_writes():
+            for number, line in enumerate(lines, 1):
+                try:
+                    self.execute(line)
+                except (BatchError, ValueError, OSError) as e:
+                    print(f"line {number}: {e}")
+                    print("Stopping; ModsConfig.xml left unchanged")
+                    return False
+        if self.manager.write_modsconfig():
+            print("Updating ModsConfig.xml")
+        return True
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+from . import util
+
+
+def cache_dir() -> Path:
+    if path := os.environ.get("RMM_CACHE_PATH"):
+        return util.sanitize_path(path)
+    if util.platform() == "win32":
+        base = os.environ.get("LOCALAPPDATA")
+        return Path(base) / "rmm" if base else Path("~/AppData/Local/rmm").expanduser()
+    if util.platform() == "darwin":
+        return Path("~/Library/Caches/rmm").expanduser()
+    base = os.environ.get("XDG_CACHE_HOME")
+    return Path(base) / "rmm" if base else Path("~/.cache/rmm").expanduser()
+
+
+class JsonCache:
+    def __init__(self, name: str):
+        self.path = cache_dir() / f"{name}.json"
+        self._data: Optional[dict] = None
+        self._dirty = False
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            try:
+                with self.path.open("r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+                if not isinstance(self._data, dict):
+                    self._data = {}
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def set(self, key: str, value: Any):
+        if self.data.get(key) != value:
+            self.data[key] = value
+            self._dirty = True
+
+    def delete(self, key: str):
+        if key in self.data:
+            del self.data[key]
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            util.atomic_write(self.path, [json.dumps(self.data)])
+            self._dirty = False
+        except OSError:
+            # A cache that cannot be written only costs a slower next run.
+            pass
@@ -1,38 +1,49 @@
 from __future__ import annotations
 
-import importlib.metadata
 import os
 import re
 import sys
 from pathlib import Path
-from typing import cast
+from typing import TYPE_CHECKING, cast
 
-from tabulate import tabulate
-
-from . import util
+from . import timing, util
 from .config import Config
 from .exception import InvalidSelectionException
-from .manager import Manager
-from .mod import Mod
-from .modlist import ModListFile, ModListV2Format
-from .path import PathFinder
-from .steam import WorkshopResult, WorkshopWebScraper
+
+# Command modules are imported by the commands that need them so that
+# startup, help and version stay cheap.
+if TYPE_CHECKING:
+    from .manager import Manager
+    from .mod import Mod
+
+# Set by --json/--ndjson; None prints tables.
+OUTPUT_FORMAT = None
 
 USAGE = """
 RimWorld Mod Manager
 
 Usage:
+rmm [options] batch <file>|-
+rmm [options] check [-i] [-r]
 rmm [options] config
-rmm [options] export [-e]|[-d] <file>
-rmm [options] import <file>
-rmm [options] enable [-a]|[-f file]|<packageid>|<term>
-rmm [options] disable [-a]|[-f file]|<packageid>|<term>
+rmm [options] conflicts
+rmm [options] cost
+rmm [options] export [-e]|[-d] [-l] <file>
+rmm [options] import [-r] <file>
+rmm [options] import-save [-r] <file.rws>
+rmm [options] enable [-a [--compatible-version]]|[-f file]|<packageid>|<term>
+rmm [options] disable [-a [--incompatible-version]]|[-f file]|<packageid>|<term>
+rmm [options] pack [-a] <file>
+rmm [options] profile [list]|save [-a] <name>|use <name>|delete <name>
 rmm [options] remove [-a]|[-f file]|<packageid>|<term>
-rmm [options] list
-rmm [options] query [<term>]
+rmm [options] du
+rmm [options] list [-s] [--incompatible-version]
+rmm [options] query [-s] [<term>]
 rmm [options] search <term>
+rmm [options] serve
 rmm [options] sort
 rmm [options] sync <name>
+rmm [options] unpack [-c] <file>
 rmm [options] update
 rmm [options] verify
 
@@ -40,17 +51,32 @@ rmm -h | --help
 rmm -v | --version
 
 Operations:
+batch             Run rmm commands from a file (or stdin) in one process
+check             Verify installed mods against their install manifests
 config            Sort and enable/disable mods with ncurses
+conflicts         List defs defined by more than one active mod.
+cost              Rank active mods by estimated game load time.
+du                Show disk usage of enabled and disabled mods by file type.
 export            Save mod list to file.
 import            Install a mod list from a file.
+import-save       Install the mod list used by a save game.
 list              List installed mods.
 query             Search installed mods.
+pack              Write enabled mods and their load order to one
+                  compressed archive.
+profile           Save the Mods folder and ModsConfig as a named profile,
+                  or switch between profiles.
 remove            Remove installed mod.
 search            Search Workshop.
+serve             Keep the mod index warm and answer other rmm calls.
 sort              Auto-sort your modlist
 sync              Install or update a mod.
+unpack            Install the mods in a pack, skipping identical installed
+                  ones, and apply its load order. Workshop subscriptions
+                  are left to Steam; -c copies differing ones into Mods.
 update            Update all mods from Steam.
-verify            Checks that enabled mods are compatible
+verify            Checks that enabled mods are compatible and support the
+                  game version
 enable            Enable mods
 disable           Disable mods
 order             Lists mod order
@@ -62,23 +88,45 @@ name              Name of mod.
 
 Flags
 -a                Performs operation on all mods
+                  Profile save: link every mod, not only enabled ones.
+                  Pack: include every installed mod.
 -d                Export disabled mods to modlist.
 -e                Export enabled mods to modlist.
+-l                Export a lockfile with revisions and content hashes.
 -f                Specify mods in a mod list
+-r                Import: remove and disable mods not in the list.
+                  Check: reinstall broken mods from the Workshop.
+-i                Check: create manifests for mods installed without one.
+-s                List, query: show mod sizes, largest first.
+--compatible-version    Enable -a: only mods that support the game version.
+--incompatible-version  List, disable -a: only mods that don't support it.
 
 Options:
 -p --path DIR     RimWorld path.
 -w --workshop DIR Workshop Path.
 -u --user DIR     User config path.
+--json            Print list, query, order, search, verify, check, du,
+                  conflicts and cost as JSON. Other messages go to stderr.
+--ndjson          Same as --json, one object per line.
+--profile[=json]  Print time spent per phase to stderr.
 
 Environment Variables:
 RMM_PATH          Folder containings Mods
 RMM_WORKSHOP_PATH Folder containing Workshop mods (optional)
+RMM_EXTRA_PATHS   More folders of mods, separated like PATH (optional)
 RMM_USER_PATH     Folder containing saves and config
+RMM_SOCKET        Socket used by 'rmm serve' (optional)
+RMM_PROFILE       Same as --profile, set to 1, table or json
+RMM_PROFILE_CPROFILE    Also write cProfile stats to this file
+RMM_PROFILE_TRACEMALLOC Also write peak memory and top allocations here
 
 Pathing Preference:
 CLI Argument > Environment Variable > Defaults
 
+Mod Precedence:
+A mod found in several folders is read from the first of
+Mods > RMM_EXTRA_PATHS > Workshop
+
 Tip:
 You can use enable, disable, and remove with no
 argument to select from all mods.
@@ -103,7 +151,7 @@ def mods_config_dec(func):
 def _interactive_query(manager: Manager, term: str, verb: str):
     search_result = manager.search_installed(term)
     if not search_result:
-        print(f"No packages matching {search_term}")
+        print(f"No packages matching {term}")
         return False
 
     print(tabulate_mod_or_wr(search_result, reverse=True, numbered=True))
@@ -132,6 +180,8 @@ def _interactive_verify(mods: list[Mod], verb: str):
 
 
 def _cli_parse_modlist(args):
+    from .modlist import ModListFile
+
     modlist_filename = args[2]
     modlist_path = Path(modlist_filename)
     queue = ModListFile.read(modlist_path)
@@ -152,6 +202,12 @@ def _interactive_selection(args: list[str], manager: Manager, verb: str, f):
 
     elif args[1] == "-a":
         queue = manager.installed_mods()
+        if "--compatible-version" in args or "--incompatible-version" in args:
+            incompatible = manager.incompatible_mods(queue)
+            if "--compatible-version" in args:
+                queue = [m for m in queue if m not in incompatible]
+            else:
+                queue = incompatible
 
     if not queue:
         search_term = " ".join(args[1:])
@@ -180,7 +236,14 @@ def tabulate_mod_or_wr(
     alpha=False,
     reversed_numbering=True,
     light=False,
+    size=False,
+    versions=False,
 ) -> str:
+    from tabulate import tabulate
+
+    from .mod import Mod
+    from .steam import WorkshopResult
+
     if not mods:
         return ""
     if isinstance(mods, dict):
@@ -189,6 +252,14 @@ def tabulate_mod_or_wr(
     if isinstance(mods[0], Mod):
         headers = ["package", "name", "author", "enabled"]
         mod_list = [[n.packageid, n.name, n.author[:20], n.enabled] for n in mods]
+        if size:
+            headers.append("size")
+            for row, n in zip(mod_list, mods):
+                row.append(util.format_bytes(n.size or 0))
+        if versions:
+            headers.append("versions")
+            for row, n in zip(mod_list, mods):
+                row.append(", ".join(n.versions or []))
     elif isinstance(mods[0], WorkshopResult) or light:
         headers = ["name", "author"]
         mod_list = [[n.name, n.author[:20]] for n in mods]
@@ -236,29 +307,115 @@ def help(args: list[str], manager: Manager):
 
 
 def version(args: list[str], manager: Manager):
+    import importlib.metadata
+
     try:
         print(importlib.metadata.version("rmm-spoons"))
     except importlib.metadata.PackageNotFoundError:
         print("version unknown")
 
 
+def _write_rows(rows, numbered=False):
+    from .output import RowWriter
+
+    with RowWriter(cast(str, OUTPUT_FORMAT)) as writer:
+        for n, row in enumerate(rows, 1):
+            if numbered:
+                writer.write(row, position=n)
+            else:
+                writer.write(row)
+
+
+def _by_size(mods: list[Mod], manager: Manager) -> list[Mod]:
+    manager.mod_sizes(mods)
+    return sorted(mods, key=lambda n: n.size or 0, reverse=True)
+
+
 @mods_config_dec
 def _list(args: list[str], manager: Manager):
     if not manager.config.mod_path:
         raise Exception("Game path not defined")
-    print(tabulate_mod_or_wr(manager.installed_mods(), alpha=True))
+    flags = set(args[1:])
+    if not flags:
+        if OUTPUT_FORMAT:
+            return _write_rows(manager.iter_installed_mods())
+        return print(tabulate_mod_or_wr(manager.installed_mods(), alpha=True))
+
+    mods = manager.installed_mods()
+    if "--incompatible-version" in flags:
+        if not manager.game_version:
+            print("Unable to read the game version from Version.txt")
+            exit(1)
+        mods = manager.incompatible_mods(mods)
+    if "-s" in flags:
+        mods = _by_size(mods, manager)
+    if OUTPUT_FORMAT:
+        return _write_rows(mods)
+    print(
+        tabulate_mod_or_wr(
+            mods,
+            alpha="-s" not in flags,
+            size="-s" in flags,
+            versions="--incompatible-version" in flags,
+        )
+    )
 
 
 @mods_config_dec
 def query(args: list[str], manager: Manager):
     if not manager.config.mod_path:
         raise Exception("Game path not defined")
-    search_term = " ".join(args[1:])
+    sized = "-s" in args[1:2]
+    search_term = " ".join(args[2:] if sized else args[1:])
+    if sized:
+        mods = _by_size(manager.search_installed(search_term), manager)
+        if OUTPUT_FORMAT:
+            return _write_rows(mods)
+        return print(tabulate_mod_or_wr(mods, size=True))
+    if OUTPUT_FORMAT:
+        return _write_rows(manager.iter_installed_mods(search_term))
     print(tabulate_mod_or_wr(manager.search_installed(search_term), alpha=True))
 
 
+@mods_config_dec
+def du(args: list[str], manager: Manager):
+    from .usage import CATEGORIES, empty
+
+    mods = manager.installed_mods()
+    totals = {"enabled": empty(), "disabled": empty(), "all": empty()}
+    counts = dict.fromkeys(totals, 0)
+    for mod, sizes in zip(mods, manager.mod_sizes(mods)):
+        for group in ("enabled" if mod.enabled else "disabled", "all"):
+            counts[group] += 1
+            for k, v in sizes.items():
+                totals[group][k] += v
+    rows = [
+        {"mods": k, "count": counts[k], **v, "total": sum(v.values())}
+        for k, v in totals.items()
+    ]
+
+    if OUTPUT_FORMAT:
+        return _write_rows(rows)
+    from tabulate import tabulate
+
+    headers = ["mods", "count", *CATEGORIES, "total"]
+    print(
+        tabulate(
+            [
+                [n["mods"], n["count"]] + [util.format_bytes(n[k]) for k in headers[2:]]
+                for n in rows
+            ],
+            headers=headers,
+        )
+    )
+
+
 def search(args: list[str], manager: Manager):
+    from .steam import WorkshopWebScraper
+
     joined_args = " ".join(args[1:])
+    if OUTPUT_FORMAT:
+        return _write_rows(WorkshopWebScraper.search(joined_args))
     results = WorkshopWebScraper.search(joined_args, reverse=True)
     print(tabulate_mod_or_wr(results))
 
@@ -298,6 +455,8 @@ def capture_indexes(strInput: str):
 
 @mods_config_dec
 def sync(args: list[str], manager: Manager):
+    from .steam import WorkshopWebScraper
+
     joined_args = " ".join(args[1:])
     results = WorkshopWebScraper.search(joined_args)
     print(
@@ -349,11 +508,12 @@ def config(args: list[str], manager: Manager):
     import rmm.multiselect as multiselect
 
     data = manager.order_all_mods()
-    mod_state = curses.wrapper(multiselect.multiselect_order_menu, data)
+    rules = manager.modsconfig.load_community_rules(manager.config, download=False)
+    mod_state = curses.wrapper(multiselect.multiselect_order_menu, data, rules)
     new_mod_order = [k for k, v in mod_state if v == True]
 
-    manager.modsconfig.mods = new_mod_order
-    manager.modsconfig.write()
+    manager.modsconfig.mods = dict.fromkeys(new_mod_order)
+    manager.write_modsconfig()
 
 
 @mods_config_dec
@@ -364,17 +524,17 @@ def sort(args: list[str], manager: Manager):
     if not manager.config.modsconfig_path:
         raise Exception("ModsConfig.xml not found")
 
-    manager.modsconfig.autosort(manager.installed_mods(), manager.config)
-    manager.modsconfig.write()
+    manager.sort_mods()
+    manager.write_modsconfig()
 
 
 @mods_config_dec
 def update(args: list[str], manager: Manager):
     if not manager.config.mod_path:
         raise Exception("Game path not defined")
-    installed_mods_names = "\n  ".join(
-        [n.name for n in manager.installed_mods() if n.name]
-    )
+    # Steam updates Workshop subscriptions itself.
+    mods = [m for m in manager.installed_mods() if not m.workshop_managed]
+    installed_mods_names = "\n  ".join([n.name for n in mods if n.name])
     print("Preparing to update following packages:")
     print(installed_mods_names)
     print(
@@ -386,51 +546,117 @@ def update(args: list[str], manager: Manager):
     if input() != "y":
         return False
 
-    manager.sync_mods(manager.installed_mods())
+    manager.sync_mods(mods)
 
 
 @mods_config_dec
 def export(args: list[str], manager: Manager):
+    from .modlist import ModListFile, ModListV2Format, ModListV3Format
+
     if not manager.config.mod_path:
         raise Exception("Game path not defined")
-    if args[1] == "-e":
-        args = args[1:]
-        mods = manager.enabled_mods()
-    elif args[1] == "-d":
+    mods = None
+    lock = False
+    while len(args) > 2 and args[1] in ("-e", "-d", "-l"):
+        flag = args[1]
         args = args[1:]
-        mods = manager.disabled_mods()
-    else:
+        if flag == "-e":
+            mods = manager.enabled_mods()
+        elif flag == "-d":
+            mods = manager.disabled_mods()
+        else:
+            lock = True
+    if mods is None:
         mods = manager.installed_mods()
 
     joined_args = " ".join(args[1:])
-    ModListFile.write(Path(joined_args), mods, ModListV2Format())
+    if lock:
+        print("Hashing mods and fetching Workshop revisions...")
+        ModListFile.write(Path(joined_args), manager.lock_mods(mods), ModListV3Format())
+    else:
+        ModListFile.write(Path(joined_args), mods, ModListV2Format())
     print(f"Mod list written to {joined_args}")
 
 
-@mods_config_dec
-def _import(args: list[str], manager: Manager):
-    joined_args = " ".join(args[1:])
-    mod_install_queue = ModListFile.read(Path(joined_args))
+def _apply_modlist(manager: Manager, entries, exact: bool = False):
+    from .plan import Planner
 
-    if not mod_install_queue:
+    if not entries:
         print("No mods imported")
         exit(1)
 
-    mod_install_queue = [n for n in mod_install_queue if n.steamid]
+    plan = Planner.plan(manager, entries, exact=exact)
+    if plan.empty():
+        print("Installed mods already match the mod list")
+        return True
 
-    for mod in mod_install_queue:
-        print(mod.title())
-
-    print("\nImport package(s)? [y/n]:")
+    if details := plan.details():
+        print(details + "\n")
+    print(plan.summary())
+    print("\nApply changes? [y/n]:")
 
     if input() != "y":
         return False
 
-    manager.sync_mods(mod_install_queue)
+    Planner.apply(manager, plan)
+
+
+@mods_config_dec
+def _import(args: list[str], manager: Manager):
+    from .modlist import ModListFile
+
+    exact = False
+    if len(args) > 2 and args[1] == "-r":
+        exact = True
+        args = args[1:]
+
+    modlist_path = Path(" ".join(args[1:]))
+    _apply_modlist(manager, ModListFile.read(modlist_path), exact)
+
+
+@mods_config_dec
+def import_save(args: list[str], manager: Manager):
+    from xml.etree.ElementTree import ParseError
+
+    from .save import SaveFile
+
+    exact = False
+    if len(args) > 2 and args[1] == "-r":
+        exact = True
+        args = args[1:]
+
+    save_path = Path(" ".join(args[1:]))
+    try:
+        entries = SaveFile.read_modlist(save_path)
+    except (OSError, ParseError) as e:
+        print(f"Unable to read save file {save_path}\n\t{e}")
+        exit(1)
+    _apply_modlist(manager, entries, exact)
+
+
+@mods_config_dec
+def batch(args: list[str], manager: Manager):
+    from .batch import BatchRunner
+
+    script = " ".join(args[1:])
+    runner = BatchRunner(manager)
+    if script in ("", "-"):
+        ok = runner.run(sys.stdin)
+    else:
+        try:
+            with open(script, "r", encoding="utf-8") as f:
+                ok = runner.run(f)
+        except OSError as e:
+            print(e)
+            ok = False
+    if not ok:
+        exit(1)
 
 
 @mods_config_dec
 def order(args: list[str], manager: Manager):
+    if OUTPUT_FORMAT:
+        return _write_rows(manager.order_mods(), numbered=True)
     print(
         tabulate_mod_or_wr(
             manager.order_mods(),
@@ -441,8 +667,305 @@ def order(args: list[str], manager: Manager):
     )
 
 
+def print_verify(report: dict):
+    for packageid in report["incompatible"]:
+        print(f"Warning: {packageid} does not support {report['game_version']}")
+    print(report["valid"])
+
+
 def verify(args: list[str], manager: Manager):
-    print(manager.verify_mods())
+    if OUTPUT_FORMAT:
+        return _write_rows([manager.verify_report()])
+    print_verify(manager.verify_report())
+
+
+def check(args: list[str], manager: Manager):
+    from .manager import SYNC_BATCH_SIZE
+    from .mod import Mod
+
+    flags = set(args[1:])
+    results = sorted(
+        manager.check_mods(init="-i" in flags), key=lambda n: n[0].packageid or ""
+    )
+    problems = [(m, r) for m, r in results if r.status != "ok"]
+
+    if OUTPUT_FORMAT:
+        _write_rows(
+            {
+                "packageid": m.packageid,
+                "dirname": m.dirname,
+                "status": r.status,
+                "missing": r.missing,
+                "changed": r.changed,
+                "extra": r.extra,
+            }
+            for m, r in results
+        )
+    else:
+        from tabulate import tabulate
+
+        if problems:
+            print(
+                tabulate(
+                    [
+                        [m.packageid, r.status, len(r.missing), len(r.changed)]
+                        for m, r in problems
+                    ],
+                    headers=["package", "status", "missing", "changed"],
+                )
+            )
+        counts = {
+            s: sum(r.status == s for _, r in results)
+            for s in ["ok", "broken", "untracked"]
+        }
+        print(
+            "{ok} ok, {broken} broken, {untracked} without a manifest".format(**counts)
+        )
+
+    broken = [m for m, r in problems if r.status == "broken"]
+    if not broken:
+        return
+    repairable = [m for m in broken if m.steamid and not m.workshop_managed]
+    for m in broken:
+        if m.workshop_managed:
+            print(f"{m.title()} is a Workshop subscription; verify it in Steam")
+        elif not m.steamid:
+            print(f"{m.title()} has no Workshop id and must be reinstalled by hand")
+    if "-r" not in flags:
+        if repairable:
+            print(f"Run 'rmm check -r' to reinstall {len(repairable)} broken mods")
+        exit(1)
+    for batch in util.batched(repairable, SYNC_BATCH_SIZE):
+        manager.sync_mods([Mod(steamid=m.steamid) for m in batch])
+
+
+@mods_config_dec
+def conflicts(args: list[str], manager: Manager):
+    from .defs import DefIndex
+
+    index = manager.def_index()
+    found = sorted(
+        DefIndex.conflicts(index),
+        key=lambda n: (n.kind != "duplicate", n.def_type, n.def_name),
+    )
+    errors = DefIndex.errors(index)
+
+    if OUTPUT_FORMAT:
+        return _write_rows(
+            {
+                "type": n.def_type,
+                "defName": n.def_name,
+                "kind": n.kind,
+                "mods": n.mods,
+            }
+            for n in found
+        )
+    from tabulate import tabulate
+
+    for packageid, relative in errors:
+        print(f"Unable to parse {relative} in {packageid}")
+    if found:
+        print(
+            tabulate(
+                [[n.def_type, n.def_name, n.kind, " > ".join(n.mods)] for n in found],
+                headers=["type", "defName", "kind", "mods (last wins)"],
+            )
+        )
+    defs = sum(len(d or []) for files in index.values() for _, d in files.values())
+    print(
+        f"{defs} defs in {len(index)} mods: "
+        f"{sum(n.kind == 'override' for n in found)} overridden, "
+        f"{sum(n.kind == 'duplicate' for n in found)} duplicated"
+    )
+
+
+@mods_config_dec
+def cost(args: list[str], manager: Manager):
+    costs = sorted(manager.load_costs(), key=lambda n: n.cost, reverse=True)
+    if OUTPUT_FORMAT:
+        return _write_rows(
+            {**n._asdict(), "cost": round(n.cost, 2), "rank": rank}
+            for rank, n in enumerate(costs, 1)
+        )
+    from tabulate import tabulate
+
+    print(
+        tabulate(
+            [
+                [
+                    rank,
+                    n.packageid,
+                    f"{n.cost:.1f}",
+                    n.operations,
+                    n.expensive,
+                    n.def_files,
+                    util.format_bytes(n.def_bytes),
+                    n.textures,
+                    f"{n.pixels / 1e6:.1f}",
+                    util.format_bytes(n.assembly_bytes),
+                ]
+                for rank, n in enumerate(costs, 1)
+            ],
+            headers=[
+                "no",
+                "package",
+                "cost",
+                "patches",
+                "slow xpath",
+                "def files",
+                "defs",
+                "textures",
+                "mpx",
+                "assemblies",
+            ],
+        )
+    )
+    total = sum(n.cost for n in costs)
+    if total:
+        top = costs[: max(1, len(costs) // 10)]
+        print(
+            f"The top {len(top)} of {len(costs)} mods account for "
+            f"{sum(n.cost for n in top) / total:.0%} of the estimated load cost"
+        )
+
+
+@mods_config_dec
+def profile(args: list[str], manager: Manager):
+    from .profile import ProfileError
+
+    action = args[1] if len(args) > 1 else "list"
+    names = [n for n in args[2:] if not n.startswith("-")]
+    try:
+        if action == "list":
+            profiles = manager.profiles().list()
+            if OUTPUT_FORMAT:
+                return _write_rows(n._asdict() for n in profiles)
+            if not profiles:
+                print("No profiles; create one with 'rmm profile save <name>'")
+            for n in profiles:
+                print(f"{'*' if n.active else ' '} {n.name} ({n.mods} mods)")
+            return
+        if len(names) != 1:
+            print(USAGE)
+            exit(1)
+        if action == "save":
+            manager.save_profile(names[0], all_mods="-a" in args)
+            print(f"Saved and switched to profile {names[0]}")
+        elif action == "use":
+            manager.use_profile(names[0])
+            print(f"Switched to profile {names[0]}")
+        elif action == "delete":
+            manager.profiles().delete(names[0])
+            print(f"Deleted profile {names[0]}")
+        else:
+            print(USAGE)
+            exit(1)
+    except (ProfileError, OSError) as e:
+        print(e)
+        exit(1)
+
+
+@mods_config_dec
+def pack(args: list[str], manager: Manager):
+    if not manager.config.mod_path:
+        raise Exception("Game path not defined")
+    all_mods = len(args) > 2 and args[1] == "-a"
+    if all_mods:
+        args = args[1:]
+    if len(args) < 2:
+        print(USAGE)
+        exit(1)
+    path = Path(" ".join(args[1:]))
+    mods = manager.installed_mods() if all_mods else manager.enabled_mods()
+    print(f"Packing {len(mods)} mods...")
+    try:
+        manager.pack_mods(path, mods)
+    except OSError as e:
+        print(f"Unable to write {path}\n\t{e}")
+        exit(1)
+    print(f"Mod pack written to {path}")
+
+
+@mods_config_dec
+def unpack(args: list[str], manager: Manager):
+    import tarfile
+
+    from .pack import PackError
+
+    local = len(args) > 2 and args[1] == "-c"
+    if local:
+        args = args[1:]
+    if len(args) < 2:
+        print(USAGE)
+        exit(1)
+    path = Path(" ".join(args[1:]))
+    try:
+        installed, skipped = manager.unpack_mods(path, local=local)
+    except (PackError, tarfile.TarError, OSError) as e:
+        print(f"Unable to unpack {path}\n\t{e}")
+        exit(1)
+    print(f"Installed {installed} mods, skipped {skipped}")
+
+
+def serve(args: list[str], manager: Manager):
+    from .daemon import DaemonError
+    from .daemon import serve as serve_forever
+
+    try:
+        serve_forever(manager)
+    except (DaemonError, OSError) as e:
+        print(e)
+        exit(1)
+
+
+def _client(command: str, args: list[str], config: Config) -> bool:
+    # Answers read-only commands from a running 'rmm serve'. Returns False
+    # when no daemon is reachable, or it serves another install, so the
+    # caller loads everything itself.
+    from .daemon import DaemonError, config_paths, request
+
+    try:
+        if request("ping") != config_paths(config):
+            return False
+        result = request(command, args[1:])
+    except DaemonError as e:
+        print(e)
+        exit(1)
+    if result is None:
+        return False
+
+    if command == "verify":
+        if OUTPUT_FORMAT:
+            _write_rows([result])
+        else:
+            print_verify(result)
+        return True
+
+    if OUTPUT_FORMAT:
+        _write_rows(result, numbered=command == "order")
+        return True
+
+    from .mod import Mod
+
+    mods = [
+        Mod(
+            **{
+                **n,
+                "dirname": n["dirname"] and Path(n["dirname"]),
+                "source": n["source"] and Path(n["source"]),
+            }
+        )
+        for n in result
+    ]
+    if command == "order":
+        print(
+            tabulate_mod_or_wr(
+                mods, numbered=True, reverse=False, reversed_numbering=False
+            )
+        )
+    else:
+        print(tabulate_mod_or_wr(mods, alpha=True))
+    return True
 
 
 def windows_setup():
@@ -462,6 +985,8 @@ def windows_setup():
 
 
 def parse_options() -> Config:
+    global OUTPUT_FORMAT
+
     path_options = [
         ("mod_path", "--path", "-p"),
         ("workshop_path", "--workshop", "-w"),
@@ -470,12 +995,29 @@ def parse_options() -> Config:
 
     config = Config()
     del sys.argv[0]
+
+    # Output flags may appear anywhere, e.g. 'rmm list --json'.
+    for flag in ["--json", "--ndjson"]:
+        while flag in sys.argv:
+            sys.argv.remove(flag)
+            OUTPUT_FORMAT = flag[2:]
+    if OUTPUT_FORMAT:
+        from .output import separate_messages
+
+        separate_messages()
+
+    profile_format = None
+    for flag in ["--profile", "--profile=table", "--profile=json"]:
+        while flag in sys.argv:
+            sys.argv.remove(flag)
+            profile_format = flag.partition("=")[2] or "table"
+    timing.start_from_env(profile_format)
+
     try:
         while s := _get_long_name_from_alias_map(
             sys.argv[0], [p for p in path_options]
         ):
             del sys.argv[0]
-            print(sys.argv[0])
             path_str = sys.argv[0]
             if util.platform() == "win32":
                 path = Path(str(path_str).strip('"'))
@@ -490,9 +1032,55 @@ def parse_options() -> Config:
     return config
 
 
-def run():
-    windows_setup()
-    config = parse_options()
+ACTIONS = [
+    "batch",
+    "export",
+    "config",
+    "conflicts",
+    "cost",
+    "sort",
+    "verify",
+    "check",
+    "du",
+    "enable",
+    "disable",
+    "order",
+    ("_import", "import"),
+    ("import_save", "import-save"),
+    ("_list", "list", "-Q"),
+    "pack",
+    "profile",
+    ("query", "-Qs"),
+    ("remove", "-R"),
+    ("search", "-Ss"),
+    "serve",
+    ("sync", "-S"),
+    "unpack",
+    ("update", "-Su"),
+    ("help", "-h", "--help"),
+    ("version", "-v", "--version"),
+]
+
+# Commands that run without resolving game paths or loading a Manager.
+PATHLESS_ACTIONS = ["help", "version", "search"]
+
+# Commands a running 'rmm serve' can answer, keyed to the daemon's names.
+CLIENT_ACTIONS = {
+    "_list": "list",
+    "query": "query",
+    "order": "order",
+    "verify": "verify",
+}
+
+
+def resolve_paths(config: Config) -> Config:
+    with timing.phase("paths"):
+        return _resolve_paths(config)
+
+
+def _resolve_paths(config: Config) -> Config:
+    from .path import PathFinder
+
     if config.mod_path:
         config.mod_path = PathFinder.find_game(config.mod_path)
     if not config.mod_path:
@@ -525,6 +1113,12 @@ def run():
             else:
                 config.workshop_path = PathFinder.find_workshop_defaults()
 
+    config.extra_paths = [
+        util.sanitize_path(n)
+        for n in os.environ.get("RMM_EXTRA_PATHS", "").split(os.pathsep)
+        if n
+    ]
+
     if config.config_path:
         config.config_path = PathFinder.find_config(config.config_path)
 
@@ -542,38 +1136,48 @@ def run():
         if config.modsconfig_path:
             config.modsconfig_path = cast(Path, config.modsconfig_path)
 
-    manager = Manager(config)
+    return config
 
-    actions = [
-        "export",
-        "config",
-        "sort",
-        "verify",
-        "enable",
-        "disable",
-        "order",
-        ("_import", "import"),
-        ("_list", "list", "-Q"),
-        ("query", "-Qs"),
-        ("remove", "-R"),
-        ("search", "-Ss"),
-        ("sync", "-S"),
-        ("update", "-Su"),
-        ("help", "-h"),
-        ("version", "-v"),
-    ]
 
+def run():
+    windows_setup()
+    config = parse_options()
+
+    command = None
     if sys.argv:
-        command = _get_long_name_from_alias_map(sys.argv[0], actions)
-        if command and command in globals():
-            globals()[command](sys.argv, manager)
-            windows_setup()
-            sys.exit(0)
+        command = _get_long_name_from_alias_map(sys.argv[0], ACTIONS)
+    if not command or command not in globals():
+        print(USAGE)
+        sys.exit(0)
 
-    print(USAGE)
-    # windows_setup()
+    try:
+        _dispatch(command, config)
+    finally:
+        timing.finish()
+    windows_setup()
     sys.exit(0)
 
 
+def _dispatch(command: str, config: Config):
+    if command in PATHLESS_ACTIONS:
+        globals()[command](sys.argv, None)
+        return
+
+    config = resolve_paths(config)
+    # The daemon answers the plain commands, without flags, and only for the
+    # install these paths resolve to.
+    if (
+        command in CLIENT_ACTIONS
+        and not any(n.startswith("-") for n in sys.argv[1:])
+        and _client(CLIENT_ACTIONS[command], sys.argv, config)
+    ):
+        return
+
+    from .manager import Manager
+
+    manager = Manager(config)
+    globals()[command](sys.argv, manager)
+
+
 if __name__ == "__main__":
     run()
@@ -2,7 +2,7 @@
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 
 @dataclass
@@ -17,4 +17,6 @@ class Config:
         self.workshop_path = workshop_path
         self.config_path = config_path
         self.modsconfig_path = None
+        # Further folders of mods, read after mod_path and before workshop_path.
+        self.extra_paths: List[Path] = []
         self.USE_HUMAN_NAMES = True
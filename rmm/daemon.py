@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .cache import cache_dir
+from .mod import EXPANSION_PACKAGES, Mod
+from .output import record
+
+# The client side of this module runs on every list/query, so keep the
+# Manager import off its path.
+if TYPE_CHECKING:
+    from .config import Config
+    from .manager import Manager
+
+# Seconds between stat scans of the Mods folder and ModsConfig.xml.
+WATCH_INTERVAL = 2.0
+CLIENT_TIMEOUT = 5.0
+
+
+class DaemonError(Exception):
+    pass
+
+
+def socket_path() -> Path:
+    if path := os.environ.get("RMM_SOCKET"):
+        return Path(path).expanduser()
+    if runtime := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime) / "rmm.sock"
+    return cache_dir() / "rmm.sock"
+
+
+def supported() -> bool:
+    return hasattr(socket, "AF_UNIX") and hasattr(socketserver, "UnixStreamServer")
+
+
+def config_paths(config: Config) -> Dict[str, Any]:
+    # What a client compares with ping before trusting the daemon's answers.
+    return {
+        "mod_path": str(config.mod_path),
+        "workshop_path": config.workshop_path and str(config.workshop_path),
+        "extra_paths": [str(n) for n in config.extra_paths],
+        "modsconfig_path": config.modsconfig_path and str(config.modsconfig_path),
+    }
+
+
+class ModState:
+    # Owns the warm Manager. Every request and the watcher take the lock, so
+    # the Manager only ever sees one caller at a time.
+    def __init__(self, manager: Manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.community_db: Optional[dict] = None
+        self.snapshot = self._stat_snapshot()
+
+    def _stat_snapshot(self) -> Tuple[Dict[str, Tuple[int, int]], Optional[int]]:
+        # Mod metadata only changes when a mod directory or its About.xml does,
+        # so stat those instead of re-reading every About.xml.
+        mods = {}
+        for root in self.manager.mod_roots():
+            try:
+                with os.scandir(root) as it:
+                    for entry in it:
+                        if not entry.is_dir():
+                            continue
+                        try:
+                            about = os.stat(Path(entry.path) / "About" / "About.xml")
+                            about_mtime = about.st_mtime_ns
+                        except OSError:
+                            about_mtime = 0
+                        mods[entry.path] = (entry.stat().st_mtime_ns, about_mtime)
+            except OSError:
+                pass
+
+        modsconfig_mtime = None
+        if self.manager.config.modsconfig_path:
+            try:
+                modsconfig_mtime = os.stat(
+                    self.manager.config.modsconfig_path
+                ).st_mtime_ns
+            except OSError:
+                pass
+        return mods, modsconfig_mtime
+
+    def refresh(self):
+        with self.lock:
+            mods, modsconfig_mtime = self._stat_snapshot()
+            if mods != self.snapshot[0]:
+                self.manager.invalidate_index()
+            if modsconfig_mtime != self.snapshot[1]:
+                self.manager.modsconfig = None
+            self.snapshot = (mods, modsconfig_mtime)
+
+    def watch(self, stop: threading.Event, interval: float = WATCH_INTERVAL):
+        while not stop.wait(interval):
+            self.refresh()
+
+    def _resolve(self, terms: List[str]) -> List[Mod]:
+        installed = self.manager.installed_mods_dict()
+        mods = []
+        for term in terms:
+            term = str(term).lower()
+            mod = installed.get(term)
+            if not mod and term.isdigit():
+                mod = next((m for m in installed.values() if m == int(term)), None)
+            if not mod:
+                mod = next((m for m in EXPANSION_PACKAGES if m == term), None)
+            if not mod:
+                raise DaemonError(f"No installed mod matches '{term}'")
+            mods.append(mod)
+        return mods
+
+    def handle(self, command: str, args: List[Any]) -> Any:
+        with self.lock:
+            if command == "ping":
+                return config_paths(self.manager.config)
+            if command == "list":
+                return [record(m) for m in self.manager.installed_mods()]
+            if command == "query":
+                term = " ".join(str(n) for n in args)
+                return [record(m) for m in self.manager.search_installed(term)]
+            if command == "order":
+                return [record(m) for m in self.manager.order_mods()]
+            if command == "verify":
+                return self.manager.verify_report()
+            if command in ("enable", "disable"):
+                mods = self._resolve(args)
+                for m in mods:
+                    if command == "enable":
+                        self.manager.modsconfig.enable_mod(m)
+                    else:
+                        self.manager.modsconfig.disable_mod(m)
+                self._write_modsconfig()
+                return [m.packageid for m in mods]
+            if command == "sort":
+                if self.community_db is None:
+                    self.community_db = self.manager.modsconfig.load_community_rules(
+                        self.manager.config
+                    )
+                self.manager.modsconfig.autosort(
+                    self.manager.installed_mods(),
+                    self.manager.config,
+                    self.community_db,
+                )
+                self._write_modsconfig()
+                return list(self.manager.modsconfig.mods)
+            raise DaemonError(f"Unknown command '{command}'")
+
+    def _write_modsconfig(self):
+        # Our own write must not look like an external edit to the watcher.
+        self.manager.write_modsconfig()
+        self.snapshot = (self.snapshot[0], self._stat_snapshot()[1])
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        state: ModState = self.server.state  # type: ignore
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = state.handle(request["cmd"], request.get("args") or [])
+                response = {"ok": True, "result": result}
+            except (DaemonError, KeyError, ValueError, TypeError, OSError) as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+def _terminate_handler(pid: int):
+    # Treat SIGTERM like Ctrl-C so the socket file is cleaned up either way.
+    # Pool workers forked while serving inherit the handler and must still
+    # die quietly when the pool terminates them.
+    def handler(signum, frame):
+        if os.getpid() != pid:
+            os._exit(0)
+        raise KeyboardInterrupt
+
+    return handler
+
+
+def serve(manager: Manager, path: Optional[Path] = None):
+    if not supported():
+        raise DaemonError("rmm serve requires Unix domain socket support")
+    path = path or socket_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        if request("ping", path=path) is not None:
+            raise DaemonError(f"rmm is already serving on {path}")
+        path.unlink()
+
+    state = ModState(manager)
+    stop = threading.Event()
+    watcher = threading.Thread(target=state.watch, args=(stop,), daemon=True)
+
+    server = socketserver.ThreadingUnixStreamServer(str(path), _Handler)
+    server.daemon_threads = True
+    server.state = state  # type: ignore
+    os.chmod(path, 0o600)
+    watcher.start()
+    signal.signal(signal.SIGTERM, _terminate_handler(os.getpid()))
+    print(f"Serving {manager.config.mod_path} on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def request(
+    command: str, args: Optional[List[Any]] = None, path: Optional[Path] = None
+) -> Optional[Any]:
+    # Returns the daemon's result, or None when no daemon is reachable so the
+    # caller can fall back to doing the work itself.
+    if not supported():
+        return None
+    path = path or socket_path()
+    if not path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(CLIENT_TIMEOUT)
+            s.connect(str(path))
+            s.sendall(json.dumps({"cmd": command, "args": args or []}).encode())
+            s.sendall(b"\n")
+            with s.makefile("rb") as f:
+                response = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    if not response.get("ok"):
+        raise DaemonError(response.get("error"))
+    return response.get("result")
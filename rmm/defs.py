@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# Index of the Defs each active mod defines, for 'rmm conflicts'. Parsed
+# files are cached per mod with their mtimes, so after the first run only
+# edited files are read again.
+
+from __future__ import annotations
+
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from . import timing, util
+from .cache import JsonCache
+
+# Where the game keeps the official content, under its Data folder.
+EXPANSION_FOLDERS = {
+    "ludeon.rimworld": "Core",
+    "ludeon.rimworld.royalty": "Royalty",
+    "ludeon.rimworld.ideology": "Ideology",
+    "ludeon.rimworld.biotech": "Biotech",
+}
+
+PARSE_WORKERS = 16
+
+
+class Conflict(NamedTuple):
+    def_type: str
+    def_name: str
+    kind: str  # override (the last mod wins) or duplicate (within one mod)
+    mods: List[str]  # in load order
+
+
+def _wanted(li: ET.Element, active: Set[str]) -> bool:
+    if_active = li.get("IfModActive")
+    if if_active and not any(n.strip().lower() in active for n in if_active.split(",")):
+        return False
+    if_not_active = li.get("IfModNotActive")
+    if if_not_active and any(
+        n.strip().lower() in active for n in if_not_active.split(",")
+    ):
+        return False
+    return True
+
+
+def _closest(versions: List[str], version: str) -> Optional[str]:
+    # The newest of versions that isn't newer than version.
+    key = util.version_key(version)
+    older = [n for n in versions if util.version_key(n) and util.version_key(n) <= key]
+    return max(older, key=util.version_key) if older else None
+
+
+def load_folders(path: Path, version: Optional[str], active: Set[str]) -> List[str]:
+    # Folders the game loads content from, relative to the mod ("" is the mod
+    # itself), following LoadFolders.xml when the mod has one.
+    try:
+        root = ET.parse(path / "LoadFolders.xml").getroot()
+    except (OSError, ET.ParseError):
+        root = None
+    if root is not None:
+        lists = {n.tag: n for n in root}
+        chosen = lists.get(f"v{version}") if version else None
+        if chosen is None:
+            chosen = lists.get("default")
+        if chosen is None and version:
+            closest = _closest([n[1:] for n in lists if n.startswith("v")], version)
+            chosen = lists.get(f"v{closest}")
+        if chosen is not None:
+            return [
+                (li.text or "").strip().strip("/\\")
+                for li in chosen.findall("li")
+                if _wanted(li, active)
+            ]
+
+    folders = ["", "Common"]
+    if version:
+        try:
+            with os.scandir(path) as it:
+                versions = [n.name for n in it if n.is_dir()]
+        except OSError:
+            versions = []
+        if closest := _closest(versions, version):
+            folders.append(closest)
+    return folders
+
+
+def content_files(
+    path: Path, folders: List[str], kind: str, extensions: Tuple[str, ...]
+) -> Dict[str, int]:
+    # Maps every file under the folders' kind subfolder (Defs, Patches...)
+    # with one of the extensions to its mtime.
+    files: Dict[str, int] = {}
+    for folder in folders:
+        base = path / folder / kind
+        if not base.is_dir():
+            continue
+        for relative, st in util.tree_files(base):
+            if relative.lower().endswith(extensions):
+                files["/".join(filter(None, [folder, kind, relative]))] = st.st_mtime_ns
+    return files
+
+
+def def_files(path: Path, folders: List[str]) -> Dict[str, int]:
+    return content_files(path, folders, "Defs", (".xml",))
+
+
+def read_defs(path: str) -> Optional[List[Tuple[str, str]]]:
+    # Streams the file and returns (def type, defName) for each top-level
+    # def, or None when the game couldn't read it either.
+    defs = []
+    depth = 0
+    name = None
+    try:
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+            if depth == 3 and elem.tag == "defName":
+                name = (elem.text or "").strip()
+            elif depth == 2:
+                if name:
+                    defs.append((elem.get("Class", elem.tag), name))
+                name = None
+                elem.clear()
+            depth -= 1
+    except (OSError, ET.ParseError):
+        return None
+    return defs
+
+
+class DefIndex:
+    _cache = JsonCache("defs")
+
+    @classmethod
+    def build(
+        cls, mods: List[Tuple[str, Path]], version: Optional[str], active: Set[str]
+    ) -> Dict[str, Dict[str, list]]:
+        # mods are (packageid, folder) in load order. Returns, in the same
+        # order, packageid -> {file: [mtime, defs or None]}.
+        from multiprocessing import Pool
+
+        index: Dict[str, Dict[str, list]] = {}
+        stale: List[Tuple[str, str, int]] = []
+        with timing.phase("defs.scan", len(mods)):
+            for packageid, path in mods:
+                cached = cls._cache.get(str(path), {})
+                files = {}
+                for relative, mtime in def_files(
+                    path, load_folders(path, version, active)
+                ).items():
+                    entry = cached.get(relative)
+                    if entry and entry[0] == mtime:
+                        files[relative] = entry
+                    else:
+                        stale.append((packageid, relative, mtime))
+                        files[relative] = [mtime, None]
+                index[packageid] = files
+        paths = dict(mods)
+
+        if stale:
+            with timing.phase("defs.parse", len(stale)), Pool(PARSE_WORKERS) as p:
+                parsed = p.map(
+                    read_defs,
+                    [str(paths[pid] / relative) for pid, relative, _ in stale],
+                    max(1, len(stale) // (PARSE_WORKERS * 4)),
+                )
+            for (packageid, relative, mtime), defs in zip(stale, parsed):
+                index[packageid][relative] = [mtime, defs]
+
+        for packageid, path in mods:
+            cls._cache.set(str(path), index[packageid])
+        for key in list(cls._cache.data):
+            if not os.path.isdir(key):
+                cls._cache.delete(key)
+        cls._cache.save()
+        return index
+
+    @staticmethod
+    def conflicts(index: Dict[str, Dict[str, list]]) -> List[Conflict]:
+        owners: Dict[Tuple[str, str], List[str]] = {}
+        for packageid, files in index.items():
+            for _, defs in files.values():
+                for def_type, def_name in defs or []:
+                    owners.setdefault((def_type, def_name), []).append(packageid)
+        return [
+            Conflict(
+                def_type,
+                def_name,
+                "duplicate" if len(set(pids)) < len(pids) else "override",
+                list(dict.fromkeys(pids)),
+            )
+            for (def_type, def_name), pids in owners.items()
+            if len(pids) > 1
+        ]
+
+    @staticmethod
+    def errors(index: Dict[str, Dict[str, list]]) -> List[Tuple[str, str]]:
+        return [
+            (packageid, relative)
+            for packageid, files in index.items()
+            for relative, (_, defs) in files.items()
+            if defs is None
+        ]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# Multi-threaded tree copy and removal for mod folders. Mods can hold tens of
+# thousands of small files, where per-file syscall latency, not bandwidth,
+# dominates; overlapping those calls helps most on network drives and HDDs.
+
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Files are handed to workers in batches so tiny files don't each pay for a
+# task; a batch is closed at BATCH_FILES files or BATCH_BYTES bytes.
+BATCH_FILES = 64
+BATCH_BYTES = 8 * 1024 * 1024
+# Above this size, try copy_file_range, which lets the kernel (or a
+# filesystem with reflinks or server-side copy) move the data.
+LARGE_FILE = 1024 * 1024
+
+PathLike = Union[str, Path]
+
+
+def _scan(root: str) -> Tuple[List[str], List[Tuple[str, int]], List[str]]:
+    # Returns (directories, files with sizes, symlinks) relative to root,
+    # parents first. Links aren't followed, so a cycle can't recurse forever.
+    dirs: List[str] = []
+    files: List[Tuple[str, int]] = []
+    links: List[str] = []
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        with os.scandir(os.path.join(root, rel)) as it:
+            for entry in it:
+                path = os.path.join(rel, entry.name)
+                if entry.is_symlink():
+                    links.append(path)
+                elif entry.is_dir():
+                    dirs.append(path)
+                    stack.append(path)
+                else:
+                    files.append((path, entry.stat().st_size))
+    return dirs, files, links
+
+
+def _batches(files: List[Tuple[str, int]]) -> List[List[Tuple[str, int]]]:
+    batches: List[List[Tuple[str, int]]] = []
+    batch: List[Tuple[str, int]] = []
+    size = 0
+    for path, n in files:
+        batch.append((path, n))
+        size += n
+        if len(batch) >= BATCH_FILES or size >= BATCH_BYTES:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _copy_file_range(src: str, dst: str) -> bool:
+    # Returns False when the kernel or filesystem can't do it, so the caller
+    # falls back to shutil (which uses sendfile on Linux).
+    if not hasattr(os, "copy_file_range"):
+        return False
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            while os.copy_file_range(fsrc.fileno(), fdst.fileno(), LARGE_FILE):
+                pass
+        except OSError as e:
+            if e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                return False
+            raise
+    return True
+
+
+def _copy_file(src: str, dst: str, size: int):
+    if size < LARGE_FILE or not _copy_file_range(src, dst):
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def _run(
+    fn: Callable[[List[Tuple[str, int]]], None],
+    batches: List[List[Tuple[str, int]]],
+    workers: Optional[int],
+):
+    # Runs every batch and re-raises the first failure once all have finished.
+    with ThreadPoolExecutor(workers or WORKERS) as pool:
+        futures = [pool.submit(fn, n) for n in batches]
+    for f in futures:
+        f.result()
+
+
+def copy_tree(
+    source: PathLike,
+    destination: PathLike,
+    workers: Optional[int] = None,
+    dirs_exist_ok: bool = False,
+):
+    # Like shutil.copytree with symlinks=True: copies links as links,
+    # preserves file and directory metadata, and fails if destination exists
+    # unless dirs_exist_ok.
+    source, destination = os.fspath(source), os.fspath(destination)
+    dirs, files, links = _scan(source)
+
+    # Every directory exists before any worker starts writing files.
+    os.makedirs(destination, exist_ok=dirs_exist_ok)
+    for rel in dirs:
+        os.mkdir(os.path.join(destination, rel))
+    for rel in links:
+        link = os.path.join(source, rel)
+        os.symlink(
+            os.readlink(link),
+            os.path.join(destination, rel),
+            target_is_directory=os.path.isdir(link),
+        )
+
+    def copy_batch(batch: List[Tuple[str, int]]):
+        for rel, size in batch:
+            _copy_file(os.path.join(source, rel), os.path.join(destination, rel), size)
+
+    _run(copy_batch, _batches(files), workers)
+
+    # Last, as creating files above changed the directories' mtimes.
+    for rel in reversed(dirs):
+        shutil.copystat(os.path.join(source, rel), os.path.join(destination, rel))
+    shutil.copystat(source, destination)
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except PermissionError:
+        # Read-only files can't be deleted on Windows.
+        os.chmod(path, stat.S_IWRITE)
+        os.unlink(path)
+
+
+def _scan_for_removal(root: str) -> Tuple[List[str], List[Tuple[str, int]]]:
+    # As in _scan, symlinks aren't followed; they are removed like files.
+    dirs: List[str] = []
+    files: List[Tuple[str, int]] = []
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        dirs.append(directory)
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    files.append((entry.path, 0))
+    return dirs, files
+
+
+def remove_tree(path: PathLike, workers: Optional[int] = None):
+    path = os.fspath(path)
+    if os.path.islink(path):
+        raise OSError(f"Cannot call remove_tree on a symbolic link: {path}")
+    dirs, files = _scan_for_removal(path)
+
+    def unlink_batch(batch: List[Tuple[str, int]]):
+        for n, _ in batch:
+            _unlink(n)
+
+    _run(unlink_batch, _batches(files), workers)
+    # Children were appended after their parents.
+    for directory in reversed(dirs):
+        os.rmdir(directory)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Rough estimate of what each active mod adds to game startup, for 'rmm cost'.
+# The game's load is dominated by parsing Defs, applying XML patches (slow
+# XPath queries run against the whole Defs document), uploading textures and
+# loading assemblies, so those are measured per mod. Files are cached with
+# their mtimes like the Def index.
+
+from __future__ import annotations
+
+import os
+import re
+import struct
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from . import timing
+from .cache import JsonCache
+from .defs import PARSE_WORKERS, content_files, load_folders
+
+# Subfolder and file extensions for each kind of content.
+KINDS = {
+    "patches": ("Patches", (".xml",)),
+    "defs": ("Defs", (".xml",)),
+    "textures": ("Textures", (".png", ".dds", ".jpg", ".jpeg")),
+    "assemblies": ("Assemblies", (".dll",)),
+}
+
+# XPath that makes the game search the whole document or test every node,
+# instead of going straight to Defs/SomeDef[defName="X"].
+EXPENSIVE_XPATH = re.compile(r"//|\*|contains\(|starts-with\(|text\(\)|not\(")
+
+# Relative cost per unit, rough guesses from profiling startup; only the
+# ranking they produce is meaningful.
+WEIGHTS = {
+    "operations": 0.02,
+    "expensive": 1.0,
+    "def_bytes": 20.0 / 1024**2,
+    "pixels": 4.0 / 1024**2,
+    "assembly_bytes": 10.0 / 1024**2,
+}
+
+
+class ModCost(NamedTuple):
+    packageid: str
+    operations: int = 0
+    expensive: int = 0
+    def_files: int = 0
+    def_bytes: int = 0
+    textures: int = 0
+    pixels: int = 0
+    assembly_bytes: int = 0
+
+    @property
+    def cost(self) -> float:
+        return sum(getattr(self, k) * w for k, w in WEIGHTS.items())
+
+
+def read_patches(path: str) -> Tuple[int, int]:
+    # Returns (operations, operations with an expensive xpath).
+    operations = expensive = 0
+    try:
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                if "PatchOperation" in elem.get("Class", ""):
+                    operations += 1
+            elif elem.tag == "xpath":
+                if EXPENSIVE_XPATH.search(elem.text or ""):
+                    expensive += 1
+    except (OSError, ET.ParseError):
+        pass
+    return operations, expensive
+
+
+# JPEG start of frame markers; C4, C8 and CC are other segments.
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(f) -> Tuple[int, int]:
+    # Segment lengths count their own two bytes; anything shorter is corrupt
+    # and would leave the scan stuck on the same marker.
+    size = os.fstat(f.fileno()).st_size
+    position = 2
+    while position + 4 <= size:
+        f.seek(position)
+        marker, length = struct.unpack(">2sH", f.read(4))
+        if length < 2:
+            break
+        if marker[0] == 0xFF and marker[1] in JPEG_SOF:
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        position += 2 + length
+    return 0, 0
+
+
+def image_size(path: str) -> Tuple[int, int]:
+    # Reads (width, height) from the image header, or (0, 0).
+    try:
+        with open(path, "rb") as f:
+            head = f.read(24)
+            if head.startswith(b"\x89PNG"):
+                return struct.unpack(">II", head[16:24])
+            if head.startswith(b"DDS "):
+                height, width = struct.unpack("<II", head[12:20])
+                return width, height
+            if head.startswith(b"\xff\xd8"):
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        pass
+    return 0, 0
+
+
+def measure(task: Tuple[str, str]) -> Tuple[int, int]:
+    kind, path = task
+    if kind == "patches":
+        return read_patches(path)
+    if kind == "textures":
+        width, height = image_size(path)
+        return 1, width * height
+    try:
+        return 1, os.stat(path).st_size
+    except OSError:
+        return 0, 0
+
+
+class LoadCost:
+    _cache = JsonCache("loadcost")
+
+    @classmethod
+    def build(
+        cls, mods: List[Tuple[str, Path]], version: Optional[str], active: Set[str]
+    ) -> List[ModCost]:
+        # mods are (packageid, folder) in load order; the result keeps it.
+        from multiprocessing import Pool
+
+        # Per mod, file -> [mtime, kind, a, b] with a and b from measure().
+        index: Dict[str, Dict[str, list]] = {}
+        stale: List[Tuple[str, str, int, str]] = []
+        with timing.phase("cost.scan", len(mods)):
+            for packageid, path in mods:
+                cached = cls._cache.get(str(path), {})
+                folders = load_folders(path, version, active)
+                files = {}
+                for kind, (subfolder, extensions) in KINDS.items():
+                    for relative, mtime in content_files(
+                        path, folders, subfolder, extensions
+                    ).items():
+                        entry = cached.get(relative)
+                        if entry and entry[0] == mtime:
+                            files[relative] = entry
+                        else:
+                            stale.append((packageid, relative, mtime, kind))
+                index[packageid] = files
+        paths = dict(mods)
+
+        if stale:
+            with timing.phase("cost.measure", len(stale)), Pool(PARSE_WORKERS) as p:
+                measured = p.map(
+                    measure,
+                    [(kind, str(paths[pid] / rel)) for pid, rel, _, kind in stale],
+                    max(1, len(stale) // (PARSE_WORKERS * 4)),
+                )
+            for (packageid, relative, mtime, kind), (a, b) in zip(stale, measured):
+                index[packageid][relative] = [mtime, kind, a, b]
+
+        for packageid, path in mods:
+            cls._cache.set(str(path), index[packageid])
+        for key in list(cls._cache.data):
+            if not os.path.isdir(key):
+                cls._cache.delete(key)
+        cls._cache.save()
+        return [cls._total(packageid, files) for packageid, files in index.items()]
+
+    @staticmethod
+    def _total(packageid: str, files: Dict[str, list]) -> ModCost:
+        totals = dict.fromkeys(ModCost._fields[1:], 0)
+        for _, kind, a, b in files.values():
+            if kind == "patches":
+                totals["operations"] += a
+                totals["expensive"] += b
+            elif kind == "defs":
+                totals["def_files"] += a
+                totals["def_bytes"] += b
+            elif kind == "textures":
+                totals["textures"] += a
+                totals["pixels"] += b
+            else:
+                totals["assembly_bytes"] += b
+        return ModCost(packageid, **totals)
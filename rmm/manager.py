@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
-from . import util
+from . import timing, util
 from .config import Config
+from .manifest import MANIFEST_NAME, CheckResult, Manifest
 from .mod import EXPANSION_PACKAGES, Mod, ModFolder
-from .modsconfig import ModsConfig
-from .steam import SteamDownloader, WorkshopResult
+from .modlist import ModListEntry
+from .steam import SteamDownloader, WorkshopResult, WorkshopWebScraper
+
+LOCK_WORKERS = 16
+SYNC_BATCH_SIZE = 50
 
 
 class Manager:
@@ -15,8 +22,128 @@ class Manager:
         if not isinstance(config, Config):
             raise Exception("Must pass Config object to Manager")
         self.config = config
-        if self.config.modsconfig_path:
-            self.modsconfig = ModsConfig(self.config.modsconfig_path)
+        self._modsconfig = None
+        self._index: Optional[List[Mod]] = None
+        self._version_index: Optional[Dict[str, List[Mod]]] = None
+        self._game_version: Optional[str] = None
+        self.defer_writes = False
+
+    # ModsConfig.xml is parsed on first use; commands that never touch it
+    # don't pay for it. Raises AttributeError when no config path is known.
+    @property
+    def modsconfig(self):
+        if self._modsconfig is None:
+            if not self.config.modsconfig_path:
+                raise AttributeError("ModsConfig.xml path is not defined")
+            from .modsconfig import ModsConfig
+
+            with timing.phase("modsconfig.read"):
+                self._modsconfig = ModsConfig(self.config.modsconfig_path)
+        return self._modsconfig
+
+    @modsconfig.setter
+    def modsconfig(self, value):
+        self._modsconfig = value
+
+    def mod_roots(self) -> List[Path]:
+        # Folders mods are read from, in order of precedence. Only mod_path is
+        # installed into.
+        roots = [self.config.mod_path, *self.config.extra_paths]
+        if self.config.workshop_path:
+            roots.append(self.config.workshop_path)
+        return list(dict.fromkeys(n for n in roots if n and n.is_dir()))
+
+    def profiles(self):
+        from .profile import Profiles
+
+        return Profiles(self.config.mod_path, self.config.modsconfig_path)
+
+    def save_profile(self, name: str, all_mods: bool = False):
+        # Links the enabled mods in Mods, or every stored and installed one.
+        profiles = self.profiles()
+        if all_mods:
+            dirnames = profiles.all_mods()
+        else:
+            dirnames = [
+                str(m.dirname)
+                for m in self.installed_mods()
+                if m.source == self.config.mod_path and m.enabled
+            ]
+        profiles.save(name, dirnames)
+        self.invalidate_index()
+
+    def use_profile(self, name: str):
+        self.profiles().use(name)
+        self.invalidate_index()
+        self.modsconfig = None
+
+    def mod_dir(self, mod: Mod) -> Path:
+        return (mod.source or self.config.mod_path) / mod.dirname
+
+    def _mark_workshop(self, mod: Mod) -> Mod:
+        mod.workshop_managed = bool(
+            self.config.workshop_path and mod.source == self.config.workshop_path
+        )
+        return mod
+
+    # A single scan of the mod folders is shared by every operation until a
+    # mod is installed or removed.
+    def _read_index(self) -> List[Mod]:
+        if self._index is None:
+            self._index = [
+                self._mark_workshop(m) for m in ModFolder.read_roots(self.mod_roots())
+            ]
+        return self._index
+
+    def invalidate_index(self):
+        self._index = None
+        self._version_index = None
+
+    @property
+    def game_version(self) -> Optional[str]:
+        # Read once; "" records that Version.txt is missing or unreadable.
+        if self._game_version is None:
+            self._game_version = util.game_version(self.game_path) or ""
+        return self._game_version or None
+
+    def version_index(self) -> Dict[str, List[Mod]]:
+        # Installed mods by each game version their About.xml lists.
+        if self._version_index is None:
+            index: Dict[str, List[Mod]] = {}
+            for mod in self._read_index():
+                for version in mod.versions or []:
+                    if version := util.short_version(version or ""):
+                        index.setdefault(version, []).append(mod)
+            self._version_index = index
+        return self._version_index
+
+    def incompatible_mods(self, mods: List[Mod]) -> List[Mod]:
+        # Mods that don't list the game's version; none when it is unknown.
+        if not self.game_version:
+            return []
+        compatible = {
+            m.packageid for m in self.version_index().get(self.game_version, [])
+        }
+        return [
+            m
+            for m in mods
+            if m.packageid not in compatible and m not in EXPANSION_PACKAGES
+        ]
+
+    def write_modsconfig(self) -> bool:
+        if self.defer_writes:
+            return False
+        with timing.phase("modsconfig.write"):
+            return self.modsconfig.write()
+
+    @contextmanager
+    def deferred_writes(self):
+        # ModsConfig changes stay in memory until the caller writes them.
+        self.defer_writes = True
+        try:
+            yield
+        finally:
+            self.defer_writes = False
 
     def install_mod(self, steam_cache: Path, steamid: int):
         if not steamid:
@@ -30,29 +157,56 @@ class Manager:
             dest_path = self.config.mod_path / str(steamid)
 
         if dest_path:
-            util.copy(
-                steam_cache / str(steamid),
-                dest_path,
-                recursive=True,
-            )
+            self.invalidate_index()
+            # The manifest describes the source and goes in first, so a copy
+            # that is interrupted leaves a mod 'rmm check' reports as broken.
+            # Copies keep mtimes, so checking the finished copy needs no hashing.
+            with timing.phase("manifest", 1):
+                files = Manifest.create(steam_cache / str(steamid))
+                # Left by an install that stopped before About.xml was copied,
+                # so it was never indexed or removed.
+                if dest_path.is_symlink() or dest_path.exists():
+                    util.remove(dest_path)
+                dest_path.mkdir(parents=True)
+                Manifest.write(dest_path, files, steamid)
+            with timing.phase("copy", 1):
+                util.copy(
+                    steam_cache / str(steamid),
+                    dest_path,
+                    recursive=True,
+                    exist_ok=True,
+                )
         else:
             print(f"Unable to install mod: {steamid}")
             return False
         return True
 
-    def remove_mod(self, mod: Mod):
+    def remove_mod(self, mod: Mod, installed_mods: Optional[List[Mod]] = None):
+        with timing.phase("remove"):
+            self._remove_mod(mod, installed_mods)
+
+    def _remove_mod(self, mod: Mod, installed_mods: Optional[List[Mod]] = None):
         if not self.config.mod_path:
             raise Exception("Game path not defined")
 
-        installed_mods = ModFolder.read(self.config.mod_path)
+        if installed_mods is None:
+            installed_mods = self._read_index()
         removal_queue = [n for n in installed_mods if n == mod]
+        if removal_queue:
+            self.invalidate_index()
 
         print("\n")
+        timing.count("remove", len(removal_queue))
         for m in removal_queue:
+            if m.workshop_managed:
+                print(f"{m.title()} is a Workshop subscription; unsubscribe in Steam")
+                continue
             print(f"Uninstalling {mod.title()}")
-            mod_absolute_path = self.config.mod_path / m.dirname
+            mod_absolute_path = self.mod_dir(m)
             if mod_absolute_path:
                 util.remove(mod_absolute_path)
+            if m.source and m.source != self.config.mod_path:
+                continue
 
             steamid_path = self.config.mod_path / str(m.steamid)
             if m.steamid and steamid_path.exists():
@@ -63,18 +217,36 @@ class Manager:
                 util.remove(pid_path)
 
     def remove_mods(self, queue: List[Mod]):
+        installed_mods = self._read_index()
         for mod in queue:
             if isinstance(mod, WorkshopResult):
-                mod = Mod.create_from_workshorp_result(mod)
-            self.remove_mod(mod)
-
-    def sync_mods(self, queue: Union[List[Mod], List[WorkshopResult]]):
+                mod = Mod.create_from_workshop_result(mod)
+            elif isinstance(mod, ModListEntry):
+                mod = mod.to_mod()
+            self.remove_mod(mod, installed_mods)
+
+    def _skip_subscribed(self, queue: list) -> list:
+        # Steam keeps Workshop subscriptions up to date; a copy in Mods would
+        # shadow the subscription.
+        subscribed = {
+            m.steamid for m in self._read_index() if m.workshop_managed and m.steamid
+        }
+        for mod in queue:
+            if mod.steamid in subscribed:
+                print(f"{mod.title()} is a Workshop subscription; Steam updates it")
+        return [m for m in queue if m.steamid not in subscribed]
+
+    def sync_mods(
+        self, queue: Union[List[Mod], List[WorkshopResult], List[ModListEntry]]
+    ):
+        queue = self._skip_subscribed(queue)
         steam_mods, steam_cache_path = SteamDownloader.download(
             [mod.steamid for mod in queue if mod.steamid]
         )
+        installed_mods = self._read_index()
 
         for mod in queue:
-            if isinstance(mod, WorkshopResult):
+            if isinstance(mod, (WorkshopResult, ModListEntry)):
                 new_mod = [m for m in steam_mods if m.steamid == mod.steamid]
                 if len(new_mod) == 1:
                     mod = new_mod[0]
@@ -84,7 +256,7 @@ class Manager:
                 continue
             success = False
             try:
-                self.remove_mod(mod)
+                self.remove_mod(mod, installed_mods)
                 success = self.install_mod(steam_cache_path, mod.steamid)
             except FileNotFoundError:
                 print(
@@ -93,6 +265,261 @@ class Manager:
             if success:
                 print(f"Installed {mod.title()}")
 
+    @staticmethod
+    def _matches_lock(path: Path, entry: ModListEntry) -> bool:
+        if not entry.hash or not path.is_dir():
+            return False
+        # Sizes are cheap to total up, so only hash trees that could match.
+        if entry.size is not None and util.tree_size(path) != entry.size:
+            return False
+        return util.hash_tree(path)[1] == entry.hash
+
+    def lock_mods(self, mods: List[Mod]) -> List[ModListEntry]:
+        def lock(mod: Mod) -> ModListEntry:
+            size, content_hash = util.hash_tree(self.mod_dir(mod))
+            revision = None
+            if mod.steamid:
+                try:
+                    revision = WorkshopWebScraper.revision(mod.steamid)
+                except OSError:
+                    print(f"Unable to fetch Workshop revision for {mod.title()}")
+            return ModListEntry(
+                packageid=mod.packageid,
+                steamid=mod.steamid,
+                repo_url=mod.repo_url,
+                revision=revision,
+                size=size,
+                hash=content_hash,
+            )
+
+        with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+            return list(pool.map(lock, mods))
+
+    def _installed_lock_path(self, installed: dict, entry: ModListEntry):
+        mod = installed.get(entry.packageid)
+        if not mod and entry.steamid:
+            mod = next((m for m in installed.values() if m == entry.steamid), None)
+        if not mod:
+            return None
+        return self.mod_dir(mod)
+
+    def install_entries(self, entries: List[ModListEntry]):
+        # Entries pinned by a lockfile are installed straight from the steamcmd
+        # cache when an identical copy is already there.
+        entries = self._skip_subscribed(entries)
+        _, steam_cache_path = SteamDownloader.find_path()
+        with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+            cached = list(
+                pool.map(
+                    lambda e: self._matches_lock(steam_cache_path / str(e.steamid), e),
+                    entries,
+                )
+            )
+
+        from_cache = [e for e, ok in zip(entries, cached) if ok]
+        if from_cache:
+            installed_mods = self._read_index()
+            for entry in from_cache:
+                self.remove_mod(entry.to_mod(), installed_mods)
+                if self.install_mod(steam_cache_path, entry.steamid):
+                    print(f"Installed {entry.title()} from cache")
+
+        to_download = [e for e, ok in zip(entries, cached) if not ok and e.steamid]
+        for batch in util.batched(to_download, SYNC_BATCH_SIZE):
+            self.sync_mods(batch)
+
+        locked = [e for e in entries if e.hash]
+        if not locked:
+            return
+        installed = self.installed_mods_dict()
+
+        def verify(entry: ModListEntry) -> bool:
+            path = self._installed_lock_path(installed, entry)
+            return bool(path) and self._matches_lock(path, entry)
+
+        with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+            verified = list(pool.map(verify, locked))
+        for entry, ok in zip(locked, verified):
+            if not ok:
+                print(f"{entry.title()} does not match the lockfile revision")
+
+    def check_mods(
+        self, mods: Optional[List[Mod]] = None, init: bool = False
+    ) -> List[Tuple[Mod, CheckResult]]:
+        # Verifies installs against their manifests in parallel. With init,
+        # mods installed before manifests existed get one from their current
+        # files instead of being reported as untracked.
+        if mods is None:
+            mods = self._read_index() + self._unindexed()
+
+        def check(mod: Mod) -> CheckResult:
+            path = self.mod_dir(mod)
+            result = Manifest.check(path)
+            if result.status == "untracked" and init:
+                try:
+                    Manifest.record(path)
+                    return CheckResult("ok")
+                except OSError as e:
+                    print(f"Unable to write manifest for {mod.title()}: {e}")
+            return result
+
+        with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+            return list(zip(mods, pool.map(check, mods)))
+
+    def _unindexed(self) -> List[Mod]:
+        # Folders with a manifest but no readable About.xml: installs that
+        # stopped early. They are named after the packageid or steamid.
+        indexed = {self.mod_dir(m) for m in self._read_index()}
+        mods = []
+        for root in self.mod_roots():
+            try:
+                entries = [n for n in os.scandir(root) if n.is_dir()]
+            except OSError:
+                continue
+            for entry in entries:
+                path = Path(entry.path)
+                if path in indexed or not (path / MANIFEST_NAME).is_file():
+                    continue
+                steamid = Manifest.steamid(path)
+                if not steamid and entry.name.isdigit():
+                    steamid = int(entry.name)
+                mods.append(
+                    Mod(
+                        packageid=entry.name,
+                        steamid=steamid,
+                        dirname=Path(entry.name),
+                        source=root,
+                    )
+                )
+        return mods
+
+    def mod_sizes(self, mods: List[Mod]) -> List[dict]:
+        # Bytes per file category for each mod, also stored in mod.size.
+        from .usage import DiskUsage
+
+        paths = [self.mod_dir(m) for m in mods]
+        with timing.phase("usage", len(mods)):
+            with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+                sizes = list(pool.map(DiskUsage.measure, paths))
+        for mod, n in zip(mods, sizes):
+            mod.size = sum(n.values())
+        DiskUsage.save(self.mod_roots(), [self.mod_dir(m) for m in self._read_index()])
+        return sizes
+
+    def _active_folders(self) -> List[Tuple[str, Path]]:
+        # (packageid, folder) of the active mods and expansions, in load order.
+        from .defs import EXPANSION_FOLDERS
+
+        mods = []
+        for mod in self.order_mods():
+            if mod.dirname:
+                mods.append((mod.packageid, self.mod_dir(mod)))
+            elif mod.packageid in EXPANSION_FOLDERS:
+                path = self.game_path / "Data" / EXPANSION_FOLDERS[mod.packageid]
+                if path.is_dir():
+                    mods.append((mod.packageid, path))
+        return mods
+
+    @property
+    def game_path(self) -> Path:
+        return self.config.mod_path.parent
+
+    def def_index(self):
+        from .defs import DefIndex
+
+        return DefIndex.build(
+            self._active_folders(),
+            self.game_version,
+            set(self._enabled_mod_pids()),
+        )
+
+    def load_costs(self):
+        from .loadcost import LoadCost
+
+        return LoadCost.build(
+            self._active_folders(),
+            self.game_version,
+            set(self._enabled_mod_pids()),
+        )
+
+    def pack_mods(self, path: Path, mods: List[Mod]) -> int:
+        from .pack import write_pack
+
+        folders = [self.mod_dir(m) for m in mods]
+        with timing.phase("pack.hash", len(mods)):
+            with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+                hashes = [h for _, h in pool.map(util.hash_tree, folders)]
+        with timing.phase("pack.write", len(mods)):
+            return write_pack(
+                path, list(zip(mods, folders, hashes)), self._enabled_mod_pids()
+            )
+
+    def unpack_mods(self, path: Path, local: bool = False) -> Tuple[int, int]:
+        # Installs the pack's mods into Mods, skipping those already installed
+        # with identical content, and applies its load order. Workshop
+        # subscriptions are left to Steam unless local asks for a copy in Mods
+        # of those that differ. Returns (installed, skipped).
+        from .pack import read_pack
+
+        if not self.config.mod_path:
+            raise Exception("Game path not defined")
+        installed = {m.packageid: m for m in self._read_index()}
+        skipped = set()
+        unpacked = []
+
+        def plan(index: dict) -> set:
+            packed = {e["packageid"]: e for e in index["mods"]}
+            present = [pid for pid in packed if pid in installed]
+            with timing.phase("unpack.hash", len(present)):
+                with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+                    hashes = pool.map(
+                        lambda pid: util.hash_tree(self.mod_dir(installed[pid]))[1],
+                        present,
+                    )
+                    for pid, content_hash in zip(present, hashes):
+                        if content_hash == packed[pid]["hash"]:
+                            skipped.add(pid)
+            for pid in present:
+                if pid in skipped:
+                    print(f"{pid} is already installed")
+                elif installed[pid].workshop_managed and not local:
+                    print(f"{pid} is a Workshop subscription; Steam updates it")
+                    skipped.add(pid)
+            return set(packed) - skipped
+
+        def done(pid: str, folder: Path):
+            mod = installed.get(pid)
+            if mod and mod.source in (None, self.config.mod_path):
+                self._remove_mod(mod, [mod])
+            dest = self.config.mod_path / pid
+            if dest.exists():
+                util.remove(dest)
+            os.replace(folder, dest)
+            Manifest.record(dest)
+            unpacked.append(pid)
+            print(f"Installed {pid}")
+
+        staging = self.config.mod_path / f"{util.RMM_FILE_PREFIX}-unpack"
+        if staging.exists():
+            util.remove(staging)
+        staging.mkdir()
+        self.invalidate_index()
+        try:
+            with timing.phase("unpack"):
+                index = read_pack(path, staging, plan, done)
+        finally:
+            util.remove(staging)
+        timing.count("unpack", len(unpacked))
+
+        available = {m.packageid for m in self._read_index()}
+        self.modsconfig.mods = {
+            pid: None
+            for pid in index["order"]
+            if pid in available or pid in EXPANSION_PACKAGES
+        }
+        self.write_modsconfig()
+        return len(unpacked), len(skipped)
+
     def _mod_config_state(self, mods):
         return [m for _, m in self._mod_config_state_dict(mods).items()]
 
@@ -107,15 +534,25 @@ class Manager:
         return mods
 
     def installed_mods(self):
-        mods = ModFolder.read_dict(self.config.mod_path)
+        mods = Mod.list_to_dict(self._read_index())
         return self._mod_config_state(mods)
 
     def installed_mods_dict(self):
-        mods = ModFolder.read_dict(self.config.mod_path)
+        mods = Mod.list_to_dict(self._read_index())
         return self._mod_config_state_dict(mods)
 
+    def iter_installed_mods(self, term=None):
+        enabled_mods = set(self._enabled_mod_pids())
+        for mod in ModFolder.iter_roots(self.mod_roots()):
+            if term is not None and not ModFolder.matches(mod, term):
+                continue
+            mod.enabled = mod.packageid in enabled_mods
+            yield self._mark_workshop(mod)
+
     def search_installed(self, term):
-        mods = ModFolder.search_dict(self.config.mod_path, term)
+        mods = Mod.list_to_dict(
+            [m for m in self._read_index() if ModFolder.matches(m, term)]
+        )
         return self._mod_config_state(mods)
 
     def _enabled_mod_pids(self):
@@ -147,8 +584,8 @@ class Manager:
         for n in mods:
             print("Enabling " + n.title())
             self._enable_mod(n)
-        print("Updating ModsConfig.xml")
-        self.modsconfig.write()
+        if self.write_modsconfig():
+            print("Updating ModsConfig.xml")
 
     def _disable_mod(self, mod: Union[str, Mod]):
         if isinstance(mod, str):
@@ -161,12 +598,20 @@ class Manager:
         for n in mods:
             print("Disabling " + n.title())
             self._disable_mod(n)
-        print("Updating ModsConfig.xml")
-        self.modsconfig.write()
+        if self.write_modsconfig():
+            print("Updating ModsConfig.xml")
 
     def verify_mods(self):
         return self.modsconfig.verify_state(self.installed_mods())
 
+    def verify_report(self) -> dict:
+        enabled = [m for m in self.installed_mods() if m.enabled]
+        return {
+            "valid": self.verify_mods(),
+            "game_version": self.game_version,
+            "incompatible": [m.packageid for m in self.incompatible_mods(enabled)],
+        }
+
     def sort_mods(self):
         self.modsconfig.autosort(self.installed_mods(), self.config)
 
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Per-mod manifest of installed files, written at install time and used by
+# 'rmm check' to find incomplete or damaged installs. It lives in the mod
+# folder under the .rmm prefix, which content hashes ignore.
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from . import util
+
+MANIFEST_NAME = util.RMM_FILE_PREFIX + "_manifest"
+MANIFEST_VERSION = 1
+
+
+class CheckResult(NamedTuple):
+    status: str  # ok, broken or untracked
+    missing: List[str] = []
+    changed: List[str] = []
+    extra: List[str] = []
+    rehashed: int = 0
+
+
+class Manifest:
+    # files maps a relative path to [size, mtime_ns, sha256]. mtime_ns is the
+    # file's mtime when its hash was last confirmed, so an unchanged size and
+    # mtime means the file needn't be read again.
+    @staticmethod
+    def create(path: Path) -> Dict[str, list]:
+        return {
+            relative: [st.st_size, st.st_mtime_ns, util.hash_file(path / relative)]
+            for relative, st in util.tree_files(path)
+        }
+
+    @staticmethod
+    def _load(path: Path) -> Optional[dict]:
+        try:
+            with (path / MANIFEST_NAME).open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return None
+        return data
+
+    @classmethod
+    def read(cls, path: Path) -> Optional[Dict[str, list]]:
+        data = cls._load(path)
+        return data.get("files") if data else None
+
+    @classmethod
+    def steamid(cls, path: Path) -> Optional[int]:
+        # Recorded at install, so a copy that never got its About.xml can
+        # still be reinstalled.
+        data = cls._load(path)
+        return data.get("steamid") if data else None
+
+    @staticmethod
+    def write(path: Path, files: Dict[str, list], steamid: Optional[int] = None):
+        data: dict = {"version": MANIFEST_VERSION, "files": files}
+        if steamid:
+            data["steamid"] = steamid
+        util.atomic_write(path / MANIFEST_NAME, [json.dumps(data)])
+
+    @classmethod
+    def record(cls, path: Path):
+        cls.write(path, cls.create(path))
+
+    @classmethod
+    def check(cls, path: Path) -> CheckResult:
+        files = cls.read(path)
+        if files is None:
+            return CheckResult("untracked")
+
+        current = dict(util.tree_files(path))
+        missing, changed = [], []
+        rehashed = 0
+        confirmed = False
+        for relative, (size, mtime, digest) in files.items():
+            st = current.get(relative)
+            if st is None:
+                missing.append(relative)
+            elif st.st_size != size:
+                changed.append(relative)
+            elif st.st_mtime_ns != mtime:
+                rehashed += 1
+                if util.hash_file(path / relative) != digest:
+                    changed.append(relative)
+                else:
+                    files[relative][1] = st.st_mtime_ns
+                    confirmed = True
+        extra = sorted(set(current) - set(files))
+
+        # Remember files that were touched but still match, so the next check
+        # can skip them.
+        if confirmed:
+            try:
+                cls.write(path, files)
+            except OSError:
+                pass
+        status = "broken" if missing or changed else "ok"
+        return CheckResult(status, sorted(missing), sorted(changed), extra, rehashed)
@@ -3,14 +3,15 @@
 from __future__ import annotations
 
 
+import os
 from dataclasses import dataclass, field
-from multiprocessing import Pool
 from pathlib import Path
-from typing import Optional, List, Union, cast
+from typing import Dict, Generator, Optional, List, Tuple, Union, cast
 
 import xml.etree.ElementTree as ET
 
-from . import util
+from . import timing, util
+from .cache import JsonCache
 
 DEBUG = False
 
@@ -30,6 +31,10 @@ class Mod:
     repo_url: Optional[str] = None
     workshop_managed: Optional[bool] = None
     enabled: Optional[bool] = None
+    # Bytes on disk, only filled in when asked for.
+    size: Optional[int] = None
+    # The folder holding dirname: the game's Mods, an extra path or Workshop.
+    source: Optional[Path] = None
 
     def title(self) -> str:
         return self.packageid or f"{self.name} by {self.author}"
@@ -145,38 +150,179 @@ class Mod:
             print(f"Ignoring {path}.\n\t{about_xml_path} contains invalid XML.")
 
 
+def _parse(path: Path) -> Tuple[Path, Optional[Mod]]:
+    return path, Mod.create_from_path(path)
+
+
+# About.xml fields kept in the metadata cache.
+CACHED_FIELDS = [
+    "packageid",
+    "before",
+    "after",
+    "incompatible",
+    "author",
+    "name",
+    "versions",
+    "steamid",
+    "ignored",
+]
+
+
 class ModFolder:
+    # Parsed About.xml metadata, keyed by mod folder. An entry is reused while
+    # the folder, its About folder, About.xml and PublishedFileId.txt keep
+    # their mtimes, so an unchanged Mods folder costs a few stats per mod.
+    _cache = JsonCache("mods")
+
     @staticmethod
-    def read(path: Path) -> list[Mod]:
-        with Pool(16) as p:
-            mods = cast(
-                list[Mod],
-                list(
-                    filter(
-                        None,
-                        p.map(
-                            Mod.create_from_path,
-                            path.iterdir(),
-                        ),
-                    )
-                ),
+    def _fingerprint(path: Path) -> Optional[List[int]]:
+        try:
+            stamps = [os.stat(path).st_mtime_ns, 0, 0, 0]
+            with os.scandir(path / "About") as it:
+                for entry in it:
+                    name = entry.name.lower()
+                    if name == "about.xml":
+                        stamps[2] = entry.stat().st_mtime_ns
+                    elif name == "publishedfileid.txt":
+                        stamps[3] = entry.stat().st_mtime_ns
+            stamps[1] = os.stat(path / "About").st_mtime_ns
+        except OSError:
+            return None
+        return stamps
+
+    @classmethod
+    def _lookup(cls, entries: List[Path]) -> Tuple[List[Mod], List[Path], dict]:
+        # Returns (cached mods, entries to parse, their fingerprints).
+        mods: List[Mod] = []
+        stale: List[Path] = []
+        fingerprints = {}
+        for path in entries:
+            fingerprint = cls._fingerprint(path)
+            cached = cls._cache.get(str(path))
+            if fingerprint and cached and cached[0] == fingerprint:
+                mods.append(Mod(dirname=path.name, source=path.parent, **cached[1]))
+            else:
+                stale.append(path)
+                fingerprints[path] = fingerprint
+        return mods, stale, fingerprints
+
+    @classmethod
+    def _store(cls, path: Path, mod: Optional[Mod], fingerprint: Optional[list]):
+        if mod:
+            mod.source = path.parent
+        if mod and fingerprint:
+            cls._cache.set(
+                str(path), [fingerprint, {n: getattr(mod, n) for n in CACHED_FIELDS}]
             )
 
-        return mods
+    @classmethod
+    def _save(cls, entries: Dict[Path, List[Path]]):
+        for root, paths in entries.items():
+            prefix = os.path.join(root, "")
+            keep = {str(n) for n in paths}
+            for key in list(cls._cache.data):
+                if key.startswith(prefix) and key not in keep:
+                    cls._cache.delete(key)
+        cls._cache.save()
+
+    @staticmethod
+    def _scan(roots: List[Path]) -> Dict[Path, List[Path]]:
+        entries = {}
+        for root in roots:
+            try:
+                entries[root] = list(root.iterdir())
+            except OSError:
+                print(f"Unable to read {root}")
+        return entries
+
+    @staticmethod
+    def _dedupe(mods: List[Mod], roots: List[Path]) -> List[Mod]:
+        # A packageid found under several roots keeps the earliest root's copy.
+        rank = {root: n for n, root in enumerate(roots)}
+        winners = {}
+        for mod in sorted(mods, key=lambda m: rank.get(m.source, len(roots))):
+            winners.setdefault(mod.packageid, mod)
+        return list(winners.values())
+
+    @classmethod
+    def read_roots(cls, roots: List[Path]) -> list[Mod]:
+        # Every root's folders go through one lookup and one parse pool.
+        from multiprocessing import Pool
+
+        with timing.phase("scan"):
+            entries = cls._scan(roots)
+            mods, stale, fingerprints = cls._lookup(
+                [n for paths in entries.values() for n in paths]
+            )
+        if stale:
+            with timing.phase("about.parse", len(stale)), Pool(16) as p:
+                parsed = p.map(Mod.create_from_path, stale)
+            for entry, mod in zip(stale, parsed):
+                cls._store(entry, mod, fingerprints[entry])
+            mods += [m for m in parsed if m]
+        cls._save(entries)
+        return cls._dedupe(mods, roots)
+
+    @classmethod
+    def iter_roots(cls, roots: List[Path]) -> Generator[Mod, None, None]:
+        # Yields mods as soon as they are known to win, in no particular order:
+        # mods from the first root at once, mods from later roots once every
+        # folder has been read.
+        from multiprocessing import Pool
+
+        with timing.phase("scan"):
+            entries = cls._scan(roots)
+            mods, stale, fingerprints = cls._lookup(
+                [n for paths in entries.values() for n in paths]
+            )
+        first = roots[0] if roots else None
+        seen = set()
+        later = []
+
+        def route(mod: Mod) -> bool:
+            if mod.source == first:
+                seen.add(mod.packageid)
+                return True
+            later.append(mod)
+            return False
+
+        yield from (m for m in mods if route(m))
+        if stale:
+            with timing.phase("about.parse", len(stale)), Pool(16) as p:
+                for entry, mod in p.imap_unordered(_parse, stale, 8):
+                    cls._store(entry, mod, fingerprints[entry])
+                    if mod and route(mod):
+                        yield mod
+        cls._save(entries)
+        yield from (m for m in cls._dedupe(later, roots) if m.packageid not in seen)
+
+    @classmethod
+    def read(cls, path: Path) -> list[Mod]:
+        return cls.read_roots([path])
+
+    @classmethod
+    def iter(cls, path: Path) -> Generator[Mod, None, None]:
+        return cls.iter_roots([path])
 
     @staticmethod
     def read_dict(path: Path):
         return Mod.list_to_dict(ModFolder.read(path))
 
+    @staticmethod
+    def matches(mod: Mod, search_term) -> bool:
+        return (
+            (isinstance(mod.packageid, str) and search_term.lower() == mod.packageid)
+            or (isinstance(mod.name, str) and search_term.lower() in mod.name.lower())
+            or (
+                isinstance(mod.author, str)
+                and search_term.lower() in mod.author.lower()
+            )
+            or search_term == mod.steamid
+        )
+
     @staticmethod
     def search(path: Path, search_term) -> list[Mod]:
-        return [
-            r
-            for r in ModFolder.read(path)
-            if (isinstance(r.name, str) and search_term.lower() in r.name.lower())
-            or (isinstance(r.author, str) and search_term.lower() in r.author.lower())
-            or search_term == r.steamid
-        ]
+        return [r for r in ModFolder.read(path) if ModFolder.matches(r, search_term)]
 
     @staticmethod
     def search_dict(path: Path, search_term) -> dict[str, Mod]:
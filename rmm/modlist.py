@@ -3,19 +3,47 @@
 from __future__ import annotations
 
 import csv
+import itertools
 import re
 from abc import ABC, abstractmethod
 from collections.abc import MutableSequence
 from pathlib import Path
-from typing import Any, Generator, Iterator, cast
+from typing import Any, Generator, Iterable, Iterator, NamedTuple, Optional, cast
 
 from .mod import Mod
 
 
+class ModListEntry(NamedTuple):
+    packageid: Optional[str] = None
+    steamid: Optional[int] = None
+    repo_url: Optional[str] = None
+    name: Optional[str] = None
+    author: Optional[str] = None
+    revision: Optional[str] = None
+    size: Optional[int] = None
+    hash: Optional[str] = None
+
+    def title(self) -> str:
+        if self.packageid:
+            return self.packageid
+        if self.name:
+            return f"{self.name} by {self.author}"
+        return str(self.steamid)
+
+    def to_mod(self) -> Mod:
+        return Mod(
+            packageid=self.packageid,
+            steamid=self.steamid,
+            repo_url=self.repo_url,
+            name=self.name,
+            author=self.author or "Unknown",
+        )
+
+
 class ModListSerializer(ABC):
     @classmethod
     @abstractmethod
-    def parse(cls, text: str) -> Generator[Mod, None, None]:
+    def parse(cls, lines: Iterable[str]) -> Generator[ModListEntry, None, None]:
         pass
 
     @classmethod
@@ -43,25 +71,21 @@ class ModListV2Format(ModListSerializer):
     MAGIC_FLAG = "RMM_V2_MODLIST"
 
     @classmethod
-    def parse(cls, text: str) -> Generator[Mod, None, None]:
-        reader = csv.reader(text.split("\n"))
+    def parse(cls, lines: Iterable[str]) -> Generator[ModListEntry, None, None]:
+        reader = csv.reader(lines)
         for parsed in reader:
             try:
-                yield Mod(
-                    packageid=parsed[cls.HEADER["PACKAGE_ID"]],
-                    steamid=int(parsed[cls.HEADER["STEAM_ID"]]),
-                    repo_url=parsed[cls.HEADER["REPO_URL"]] if not "" else None,
-                )
+                packageid = parsed[cls.HEADER["PACKAGE_ID"]]
+                steamid = parsed[cls.HEADER["STEAM_ID"]]
+                repo_url = parsed[cls.HEADER["REPO_URL"]] or None
             except IndexError:
                 if parsed:
                     print("Unable to import: ", parsed)
                 continue
+            try:
+                yield ModListEntry(packageid.lower(), int(steamid), repo_url)
             except ValueError:
-                yield Mod(
-                    packageid=parsed[cls.HEADER["PACKAGE_ID"]],
-                    repo_url=parsed[cls.HEADER["REPO_URL"]] if not "" else None,
-                )
-                continue
+                yield ModListEntry(packageid.lower(), None, repo_url)
 
     @classmethod
     def serialize(cls, mods: MutableSequence) -> Generator[str, None, None]:
@@ -77,8 +101,8 @@ class ModListV2Format(ModListSerializer):
             list[str],
             [
                 mod.packageid,
-                str(mod.steamid) if not None else "",
-                mod.repo_url if not None else "",
+                str(mod.steamid) if mod.steamid is not None else "",
+                mod.repo_url if mod.repo_url is not None else "",
             ],
         )
 
@@ -86,20 +110,22 @@ class ModListV2Format(ModListSerializer):
 class ModListV1Format(ModListSerializer):
     STEAM_ID = 0
 
+    NAME_EXP = re.compile("(.*) by (.*)")
+
     @classmethod
-    def parse(cls, text: str) -> Generator[Mod, None, None]:
-        name_exp = re.compile("(.*) by (.*)")
-        for line in text.split("\n"):
+    def parse(cls, lines: Iterable[str]) -> Generator[ModListEntry, None, None]:
+        for line in lines:
+            line = line.rstrip("\r\n")
             parsed = line.split("#", 1)
             name = None
             author = None
             if len(parsed) == 2:
-                matches = re.findall(name_exp, parsed[1])
+                matches = re.findall(cls.NAME_EXP, parsed[1])
                 if matches and len(matches[0]) == 2:
-                    name = matches[0][0]
-                    author = matches[0][1]
+                    name = matches[0][0].strip()
+                    author = matches[0][1].strip()
             try:
-                yield Mod(
+                yield ModListEntry(
                     steamid=int(
                         parsed[cls.STEAM_ID]
                         .strip()
@@ -124,21 +150,104 @@ class ModListV1Format(ModListSerializer):
         return "{}# {} by {} ".format(str(mod.steamid), mod.name, mod.author)
 
 
+# Lockfile: V2 columns plus the Workshop revision, total size and content hash.
+class ModListV3Format(ModListSerializer):
+    HEADER = {
+        "PACKAGE_ID": 0,
+        "STEAM_ID": 1,
+        "REPO_URL": 2,
+        "REVISION": 3,
+        "SIZE": 4,
+        "HASH": 5,
+    }
+    MAGIC_FLAG = "RMM_V3_LOCKFILE"
+
+    @classmethod
+    def parse(cls, lines: Iterable[str]) -> Generator[ModListEntry, None, None]:
+        reader = csv.reader(lines)
+        for parsed in reader:
+            if not parsed or parsed[0] == cls.MAGIC_FLAG:
+                continue
+            try:
+                packageid, steamid, repo_url, revision, size, content_hash = (
+                    parsed[cls.HEADER[n]] for n in cls.HEADER
+                )
+            except (IndexError, ValueError):
+                print("Unable to import: ", parsed)
+                continue
+            yield ModListEntry(
+                packageid=packageid.lower(),
+                steamid=int(steamid) if steamid.isdigit() else None,
+                repo_url=repo_url or None,
+                revision=revision or None,
+                size=int(size) if size.isdigit() else None,
+                hash=content_hash or None,
+            )
+
+    @classmethod
+    def serialize(cls, mods: MutableSequence) -> Generator[str, None, None]:
+        yield cls.MAGIC_FLAG
+        buffer = CsvStringBuilder()
+        writer = csv.writer(cast(Any, buffer))
+        for m in mods:
+            writer.writerow(cls.format(m))
+            yield buffer.pop().strip()
+
+    @classmethod
+    def format(cls, entry: ModListEntry) -> list[str]:
+        return [
+            entry.packageid or "",
+            str(entry.steamid) if entry.steamid is not None else "",
+            entry.repo_url or "",
+            entry.revision or "",
+            str(entry.size) if entry.size is not None else "",
+            entry.hash or "",
+        ]
+
+
 class ModListFile:
-    @staticmethod
-    def read(path: Path) -> list[Mod]:
+    # Number of non-blank lines inspected to pick a parser.
+    DETECT_LINES = 16
+    V1_LINE = re.compile(r"^\s?[0-9]+\s?#.*$")
+
+    @classmethod
+    def detect(cls, head: list[str]) -> type[ModListSerializer]:
+        if head and head[0].strip() == ModListV3Format.MAGIC_FLAG:
+            return ModListV3Format
+        for line in head:
+            if cls.V1_LINE.match(line):
+                return ModListV1Format
+        return ModListV2Format
+
+    @classmethod
+    def _read_head(cls, f) -> list[str]:
+        head = []
+        for line in f:
+            head.append(line)
+            if len([n for n in head if n.strip()]) >= cls.DETECT_LINES:
+                break
+        return head
+
+    @classmethod
+    def format(cls, path: Path) -> type[ModListSerializer]:
+        with path.open("r", encoding="utf-8", newline="") as f:
+            return cls.detect([n for n in cls._read_head(f) if n.strip()])
+
+    @classmethod
+    def stream(cls, path: Path) -> Generator[ModListEntry, None, None]:
+        with path.open("r", encoding="utf-8", newline="") as f:
+            head = cls._read_head(f)
+            serializer = cls.detect([n for n in head if n.strip()])
+            yield from serializer.parse(itertools.chain(head, f))
+
+    @classmethod
+    def read(cls, path: Path) -> Optional[list[ModListEntry]]:
         try:
-            with path.open("r") as f:
-                text = f.read()
+            return list(cls.stream(path))
         except OSError as e:
             print(e)
             return None
 
-        if re.search(r"^\s?[0-9]+\s?#.*$", text, re.MULTILINE):
-            return [m for m in ModListV1Format.parse(text)]
-
-        return [m for m in ModListV2Format.parse(text)]
-
     @staticmethod
     def write(path: Path, mods: MutableSequence, serializer: ModListSerializer) -> bool:
         try:
@@ -1,14 +1,68 @@
 #!/usr/bin/env python3
 
+import json
 from pathlib import Path
-from typing import List, cast
+from typing import Dict, Generator, Iterable, List, Optional, Set, Tuple, cast
 from xml.etree import ElementTree as ET
 
-from . import util
+from . import timing, util
 from .mod import EXPANSION_PACKAGES, Mod
 
+COMMUNITY_RULES_STEAMID = 1847679158
+COMMUNITY_RULES_PATH = "rupal.rimpymodmanagerdatabase/db/communityRules.json"
+
+
+def _escape(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _quoteattr(s: str) -> str:
+    return '"{}"'.format(_escape(s).replace('"', "&quot;"))
+
+
+def _xml_attributes(element: ET.Element) -> str:
+    return "".join(f" {k}={_quoteattr(v)}" for k, v in element.attrib.items())
+
+
+def _xml_element(element: ET.Element, depth: int) -> Generator[str, None, None]:
+    indent = "  " * depth
+    text = (element.text or "").strip()
+    attributes = _xml_attributes(element)
+    children = [n for n in element if isinstance(n.tag, str)]
+
+    if not children and not text:
+        yield f"{indent}<{element.tag}{attributes} />\n"
+    elif not children:
+        yield f"{indent}<{element.tag}{attributes}>{_escape(text)}</{element.tag}>\n"
+    else:
+        yield f"{indent}<{element.tag}{attributes}>\n"
+        for child in children:
+            yield from _xml_element(child, depth + 1)
+        yield f"{indent}</{element.tag}>\n"
+
+
+def merge_community_rules(
+    mods: Iterable[Mod], community_db: dict
+) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+    # Returns (load_after, load_before) per packageid, combining About.xml
+    # with the community rules database without modifying the mods.
+    rules = community_db.get("rules", {})
+    load_after = {}
+    load_before = {}
+    for m in mods:
+        rule = rules.get(m.packageid) or {}
+        load_after[m.packageid] = {n.lower() for n in m.before or []} | {
+            n.lower() for n in rule.get("loadAfter") or {} if n
+        }
+        load_before[m.packageid] = {n.lower() for n in m.after or []} | {
+            n.lower() for n in rule.get("loadBefore") or {} if n
+        }
+    return load_after, load_before
+
 
 class ModsConfig:
+    LIST_ELEMENTS = ("activeMods", "knownExpansions")
+
     def __init__(self, p: Path):
         if isinstance(p, str):
             p = Path(p)
@@ -39,34 +93,57 @@ class ModsConfig:
         except TypeError:
             self.expansions = []
 
-    def write(self):
-        active_mods = self.root.find("activeMods")
-        if not active_mods:
-            return
-        try:
-            for item in list(active_mods.findall("li")):
-                if active_mods:
-                    active_mods.remove(item)
-        except AttributeError:
-            pass
+        self._saved_mods = list(self.mods)
+        self._saved_expansions = list(self.expansions)
 
-        try:
-            for mod in self.mods:
-                new_element = ET.SubElement(active_mods, "li")
-                new_element.text = mod
-        except AttributeError:
-            raise Exception("Unable to find 'activeMods' in ModsConfig")
-
-        buffer = util.et_pretty_xml(self.root)
+    def write(self) -> bool:
+        active_mods = list(self.mods)
+        if (
+            active_mods == self._saved_mods
+            and self.expansions == self._saved_expansions
+        ):
+            return False
 
         try:
-            with self.path.open("w+") as f:
-                f.seek(0)
-                f.write(buffer)
+            util.atomic_write(self.path, self._serialize())
         except OSError:
             print("Unable to write ModsConfig")
             raise
 
+        self._saved_mods = active_mods
+        self._saved_expansions = list(self.expansions)
+        return True
+
+    def _serialize(self) -> Generator[str, None, None]:
+        yield '<?xml version="1.0" encoding="utf-8"?>\n'
+        yield f"<{self.root.tag}{_xml_attributes(self.root)}>\n"
+        written = set()
+        for element in self.root:
+            if not isinstance(element.tag, str):
+                continue
+            if element.tag in self.LIST_ELEMENTS:
+                if element.tag in written:
+                    continue
+                yield from self._serialize_list(element.tag)
+            else:
+                yield from _xml_element(element, 1)
+            written.add(element.tag)
+
+        for tag in self.LIST_ELEMENTS:
+            if tag not in written:
+                yield from self._serialize_list(tag)
+        yield f"</{self.root.tag}>\n"
+
+    def _serialize_list(self, tag: str) -> Generator[str, None, None]:
+        items = self.mods if tag == "activeMods" else self.expansions
+        if not items:
+            yield f"  <{tag} />\n"
+            return
+        yield f"  <{tag}>\n"
+        for item in items:
+            yield f"    <li>{_escape(item)}</li>\n"
+        yield f"  </{tag}>\n"
+
     def enable_mod(self, m: Mod):
         self.mods[m.packageid] = None
 
@@ -74,11 +151,57 @@ class ModsConfig:
         if m.packageid in self.mods:
             del self.mods[m.packageid]
 
-    def autosort(self, mods, config):
-        import json
+    @staticmethod
+    def load_community_rules(config, download: bool = True) -> Optional[dict]:
+        rules_path = config.mod_path / COMMUNITY_RULES_PATH
+        if not rules_path.is_file():
+            if not download:
+                return None
+            print("Downloading rules file\n")
+            from .manager import Manager
+
+            Manager(config).sync_mods([Mod(steamid=COMMUNITY_RULES_STEAMID)])
 
+        with timing.phase("rules.load"), rules_path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def autosort(self, mods, config, community_db: Optional[dict] = None):
         import networkx as nx
 
+        if community_db is None:
+            community_db = self.load_community_rules(config)
+        with timing.phase("graph.build"):
+            DG, populated_mods, mods_for_removal = self._load_order_graph(
+                nx, mods, community_db
+            )
+
+        count = 0
+        while True:
+            try:
+                with timing.phase("sort", DG.number_of_nodes()):
+                    sorted_mods = list(reversed(list(nx.topological_sort(DG))))
+                self.mods = dict.fromkeys(
+                    util.list_loop_exclusion(sorted_mods, mods_for_removal)
+                )
+                print("Auto-sort complete")
+
+                print(
+                    "Verifying state: {}".format(
+                        "good" if self.verify_state(populated_mods) else "bad"
+                    )
+                )
+                return
+            except nx.exception.NetworkXUnfeasible:
+                if count >= 10:
+                    print("Unable to break cycles")
+                    exit(0)
+                print("Cycle found. Breaking load order cycle")
+                cycle = nx.find_cycle(DG)
+                print(cycle)
+                DG.remove_edge(*cycle[0])
+                count += 1
+
+    def _load_order_graph(self, nx, mods, community_db: dict):
         DG = nx.DiGraph()
 
         before_core = ["brrainz.harmony", "me.samboycoding.betterloading"]
@@ -100,42 +223,9 @@ class ModsConfig:
                 DG.add_edge(combined_load_order[j], combined_load_order[k])
 
         populated_mods = {m.packageid: m for m in mods if m in self.mods}
-
-        rules_path = Path(
-            config.mod_path / "rupal.rimpymodmanagerdatabase/db/communityRules.json"
+        load_after, load_before = merge_community_rules(
+            populated_mods.values(), community_db
         )
-        if not rules_path.is_file():
-            print("Downloading rules file\n")
-            # import rmm.steam
-            # rules_cache_path = Path(SteamDownloader.find_path()[1]/ "1847679158")
-            # rmm.steam.SteamDownloader.download([1847679158])
-
-            manager.Manager(config).sync_mods([Mod(steamid=1847679158)])
-
-        with (
-            config.mod_path / "rupal.rimpymodmanagerdatabase/db/communityRules.json"
-        ).open("r", encoding="utf-8") as f:
-            community_db = json.load(f)
-
-        for pid, m in populated_mods.items():
-            try:
-                for j in community_db["rules"][m.packageid]["loadAfter"]:
-                    if j:
-                        try:
-                            m.before.add(j)
-                        except AttributeError:
-                            m.before = set(j)
-            except KeyError:
-                pass
-            try:
-                for j in community_db["rules"][m.packageid]["loadBefore"]:
-                    if j:
-                        try:
-                            m.after.add(j)
-                        except AttributeError:
-                            m.after = set(j)
-            except KeyError:
-                pass
 
         rocketman = False
         if "krkr.rocketman" in populated_mods:
@@ -159,38 +249,14 @@ class ModsConfig:
             if not m in combined_load_order:
                 for n in combined_load_order:
                     DG.add_edge(pid, n)
-            if m.after:
-                for a in m.after:
-                    if a in self.mods:
-                        DG.add_edge(a.lower(), pid)
-            if m.before:
-                for b in m.before:
-                    if b in self.mods:
-                        DG.add_edge(pid, b.lower())
-
-        count = 0
-        while True:
-            try:
-                sorted_mods = reversed(list(nx.topological_sort(DG)))
-                self.mods = [n for n in sorted_mods]
-                self.mods = util.list_loop_exclusion(self.mods, mods_for_removal)
-                print("Auto-sort complete")
-
-                print(
-                    "Verifying state: {}".format(
-                        "good" if self.verify_state(populated_mods) else "bad"
-                    )
-                )
-                return
-            except nx.exception.NetworkXUnfeasible:
-                if count >= 10:
-                    print("Unable to break cycles")
-                    exit(0)
-                print("Cycle found. Breaking load order cycle")
-                cycle = nx.find_cycle(DG)
-                print(cycle)
-                DG.remove_edge(*cycle[0])
-                count += 1
+            for a in load_before[pid]:
+                if a in self.mods:
+                    DG.add_edge(a, pid)
+            for b in load_after[pid]:
+                if b in self.mods:
+                    DG.add_edge(pid, b)
+
+        return DG, populated_mods, mods_for_removal
 
     def verify_state(self, mods: List[Mod]):
         if isinstance(mods, list):
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import curses
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
 class WindowSizeException(Exception):
@@ -11,135 +13,409 @@ class AbortModOrderException(Exception):
     pass
 
 
-def multiselect_order_menu(stdscr, data):
-    data = [(n.packageid, n.enabled) for n in data]
-    k = 0
+KEY_ENTER = (curses.KEY_ENTER, 10, 13)
+KEY_ESCAPE = 27
+KEY_BACKSPACE = (curses.KEY_BACKSPACE, 127, 8)
 
-    # Clear and refresh the screen for a blank canvas
-    stdscr.clear()
-    stdscr.refresh()
+STATUS = (
+    "'c' accept, 'q' quit, 'Enter' enable/disable, 'j/k' move, "
+    "PgUp/PgDn/Home/End scroll, ':' go to number, '/' filter"
+)
+CONSTRAINT_STATUS = STATUS + ", 's' snap to valid position"
 
-    # Start colors in curses
-    curses.start_color()
-    curses.init_pair(1, curses.COLOR_CYAN, curses.COLOR_BLACK)
-    curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
-    curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_WHITE)
 
-    selection = 0
-    window_height, window_width = stdscr.getmaxyx()
-    scroll_window_height = window_height - 10
-    scroll_window_position = 0
-
-    if window_width < 40 or window_height < 15:
-        raise WindowSizeException()
-
-    def check_bounds(location, data, delta_position):
-        if delta_position > 0:
-            if location < len(data) - 1:
-                return True
-        if delta_position < 0:
-            if location > 0:
-                return True
-        return False
+class ConstraintIndex:
+    # Load order constraints between the listed mods, keyed by packageid.
+    # Only enabled mods constrain each other. A move or toggle only changes
+    # relations involving the mods it touched, so just those and their
+    # neighbours are rechecked: O(degree) per edit rather than O(n).
+    def __init__(
+        self,
+        data: List[Tuple[str, bool]],
+        load_after: Dict[str, Set[str]],
+        load_before: Dict[str, Set[str]],
+        incompatible: Dict[str, Set[str]],
+    ):
+        self.earlier: Dict[str, Set[str]] = defaultdict(set)
+        self.later: Dict[str, Set[str]] = defaultdict(set)
+        self.incompatible: Dict[str, Set[str]] = defaultdict(set)
+        listed = {k for k, _ in data}
+        for pid, deps in load_after.items():
+            for n in deps & listed - {pid}:
+                self.earlier[pid].add(n)
+                self.later[n].add(pid)
+        for pid, deps in load_before.items():
+            for n in deps & listed - {pid}:
+                self.later[pid].add(n)
+                self.earlier[n].add(pid)
+        for pid, deps in incompatible.items():
+            for n in deps & listed - {pid}:
+                self.incompatible[pid].add(n)
+                self.incompatible[n].add(pid)
+
+        self.position = {k: n for n, (k, _) in enumerate(data)}
+        self.enabled = {k for k, v in data if v}
+        self.violations: Set[str] = set()
+        for k, _ in data:
+            self.check(k)
+
+    def neighbours(self, pid: str) -> Set[str]:
+        return self.earlier[pid] | self.later[pid] | self.incompatible[pid]
+
+    def problems(self, pid: str) -> List[str]:
+        if pid not in self.enabled:
+            return []
+        p = self.position[pid]
+        problems = []
+        for n in self.earlier[pid]:
+            if n in self.enabled and self.position[n] > p:
+                problems.append(f"must load after {n}")
+        for n in self.later[pid]:
+            if n in self.enabled and self.position[n] < p:
+                problems.append(f"must load before {n}")
+        for n in self.incompatible[pid]:
+            if n in self.enabled:
+                problems.append(f"incompatible with {n}")
+        return problems
+
+    def check(self, pid: str):
+        if self.problems(pid):
+            self.violations.add(pid)
+        else:
+            self.violations.discard(pid)
+
+    def update(
+        self, data: List[Tuple[str, bool]], changed: Iterable[str], lo: int, hi: int
+    ):
+        # data[lo:hi + 1] may have new positions; changed mods were moved or
+        # toggled, so their neighbours' relations to them may differ too.
+        for n in range(lo, hi + 1):
+            k, v = data[n]
+            self.position[k] = n
+            if v:
+                self.enabled.add(k)
+            else:
+                self.enabled.discard(k)
+        for pid in set(changed):
+            for n in self.neighbours(pid) | {pid}:
+                self.check(n)
+
+    def valid_position(self, pid: str) -> Optional[int]:
+        # The position nearest to the current one that satisfies every
+        # ordering constraint, counted with pid removed from the list. None
+        # if the constraints contradict each other.
+        p = self.position[pid]
+
+        def without(n: str) -> int:
+            return self.position[n] - (self.position[n] > p)
+
+        lo = max(
+            (without(n) + 1 for n in self.earlier[pid] if n in self.enabled),
+            default=0,
+        )
+        hi = min(
+            (without(n) for n in self.later[pid] if n in self.enabled),
+            default=len(self.position) - 1,
+        )
+        if lo > hi:
+            return None
+        return min(max(p, lo), hi)
+
+
+class OrderMenu:
+    # Only rows inside the visible window are drawn, and a row is only
+    # rewritten when its text or attributes change, so a keypress costs
+    # O(window height) regardless of how many mods are listed.
+    HEADER_ROWS = 2
+    FOOTER_ROWS = 2
+
+    def __init__(
+        self,
+        stdscr,
+        data: List[Tuple[str, bool]],
+        constraints: Optional[ConstraintIndex] = None,
+    ):
+        self.stdscr = stdscr
+        self.data = [(k, v) for k, v in data]
+        self.constraints = constraints
+        self.message = ""
+        self.max_length = max((len(k) for k, _ in self.data), default=0)
+        self.number_width = len(str(len(self.data)))
+
+        self.filter: Optional[str] = None
+        self.view = list(range(len(self.data)))
+        self.selection = 0
+        self.top = 0
+        self.prompt: Optional[Tuple[str, str]] = None
+        self.lines: Dict[int, Tuple[str, int]] = {}
+        self.resize()
+
+    def resize(self):
+        self.height, self.width = self.stdscr.getmaxyx()
+        if self.width < 40 or self.height < 15:
+            raise WindowSizeException()
+        self.page = self.height - self.HEADER_ROWS - self.FOOTER_ROWS
+        row_width = self.number_width + 3 + self.max_length
+        self.start_x = max(0, (self.width - row_width) // 2)
+        self.lines.clear()
+        self.stdscr.erase()
+
+    def apply_filter(self, term: Optional[str]):
+        current = self.view[self.selection] if self.view else 0
+        self.filter = term or None
+        if self.filter:
+            self.view = [
+                n for n, (k, _) in enumerate(self.data) if self.filter in k.lower()
+            ]
+        else:
+            self.view = list(range(len(self.data)))
+        # Stay on the same mod if it is still listed, else the nearest one below.
+        self.selection = next(
+            (p for p, n in enumerate(self.view) if n >= current),
+            max(len(self.view) - 1, 0),
+        )
+
+    def move_selection(self, delta: int):
+        if self.view:
+            self.selection = min(max(self.selection + delta, 0), len(self.view) - 1)
+
+    def move_entry(self, delta: int):
+        # Moves the selected mod past its neighbour in the current view; with a
+        # filter that neighbour may be several positions away in the full list.
+        target = self.selection + delta
+        if not self.view or not 0 <= target < len(self.view):
+            return
+        src, dst = self.view[self.selection], self.view[target]
+        self.move_to(src, dst)
+        self.selection = target
+
+    def move_to(self, src: int, dst: int):
+        pid = self.data[src][0]
+        if abs(src - dst) == 1:
+            self.data[src], self.data[dst] = self.data[dst], self.data[src]
+        else:
+            self.data.insert(dst, self.data.pop(src))
+        # The view holds indices into data; any move can change which ones match.
+        if self.filter:
+            self.apply_filter(self.filter)
+        if self.constraints:
+            self.constraints.update(self.data, [pid], min(src, dst), max(src, dst))
 
-    def move_selection(selected, l, d):
-        if d > 0 and check_bounds(selected, l, d):
-            return selected + 1
-        if d < 0:
-            if selected > 0 and check_bounds(selected, l, d):
-                return selected - 1
-        return selected
+    def snap(self):
+        # Moves the selected mod to the nearest position where its load order
+        # constraints hold.
+        if not self.view or not self.constraints:
+            return
+        src = self.view[self.selection]
+        pid = self.data[src][0]
+        dst = self.constraints.valid_position(pid)
+        if dst is None:
+            self.message = f"No valid position for {pid}; its rules conflict"
+            return
+        if dst != src:
+            self.move_to(src, dst)
+            if self.filter and dst not in self.view:
+                self.apply_filter(None)
+            self.selection = self.view.index(dst)
 
-    def list_swap(data, offset, pos):
-        temp = data[offset], data[offset + pos]
-        data[offset + pos] = temp[0]
-        data[offset] = temp[1]
+    def toggle(self):
+        if self.view:
+            n = self.view[self.selection]
+            self.data[n] = (self.data[n][0], not self.data[n][1])
+            if self.constraints:
+                self.constraints.update(self.data, [self.data[n][0]], n, n)
+            self.move_selection(1)
 
-    while True:
-        # Initialization
-        stdscr.clear()
-        window_height, window_width = stdscr.getmaxyx()
+    def jump(self, number: str):
+        # Numbers are positions in the full list, as shown on each row.
+        try:
+            n = int(number) - 1
+        except ValueError:
+            return
+        if 0 <= n < len(self.data):
+            if self.filter and n not in self.view:
+                self.apply_filter(None)
+            self.selection = self.view.index(n)
 
+    def scroll(self):
+        if self.selection < self.top:
+            self.top = self.selection
+        elif self.selection >= self.top + self.page:
+            self.top = self.selection - self.page + 1
+        self.top = max(0, min(self.top, max(len(self.view) - self.page, 0)))
+
+    def draw_line(self, y: int, text: str, attr: int = curses.A_NORMAL):
+        text = text[: self.width - 1]
+        if self.lines.get(y) == (text, attr):
+            return
+        self.stdscr.move(y, 0)
+        self.stdscr.clrtoeol()
+        self.stdscr.addstr(y, 0, text, attr)
+        self.lines[y] = (text, attr)
+
+    def row(self, n: int) -> str:
+        k, v = self.data[n]
+        mark = "+" if v else "-"
+        return (" " * self.start_x + f"{n + 1:>{self.number_width}} {mark} {k}").ljust(
+            self.width - 1
+        )
+
+    def row_attr(self, n: int, selected: bool) -> int:
+        attr = curses.A_STANDOUT if selected else curses.A_NORMAL
+        if self.constraints and self.data[n][0] in self.constraints.violations:
+            attr |= curses.color_pair(2) | curses.A_BOLD
+        return attr
+
+    def status(self) -> str:
+        return CONSTRAINT_STATUS if self.constraints else STATUS
+
+    def info(self) -> str:
+        # Explains the selected row's problems, or the last message.
+        if self.message:
+            return self.message
+        if self.constraints and self.view:
+            pid = self.data[self.view[self.selection]][0]
+            problems = self.constraints.problems(pid)
+            if problems:
+                return f"{pid}: " + "; ".join(problems)
+        return ""
+
+    def render(self):
+        self.scroll()
+        title = "RMM: Mod Sorting Display"
+        if self.view:
+            title += f"  [{self.selection + 1}/{len(self.view)}]"
+        if self.constraints and self.constraints.violations:
+            title += f"  {len(self.constraints.violations)} mods with problems"
+        self.draw_line(0, title, curses.color_pair(1))
+
+        for y in range(self.page):
+            p = self.top + y
+            if p < len(self.view):
+                n = self.view[p]
+                self.draw_line(
+                    self.HEADER_ROWS + y,
+                    self.row(n),
+                    self.row_attr(n, p == self.selection),
+                )
+            else:
+                self.draw_line(self.HEADER_ROWS + y, "")
+
+        if self.prompt:
+            label, text = self.prompt
+            self.draw_line(self.height - 2, f"{label}{text}")
+        elif self.filter:
+            self.draw_line(self.height - 2, f"filter: {self.filter}  (Esc clears)")
+        else:
+            self.draw_line(self.height - 2, self.info(), curses.color_pair(2))
+        self.draw_line(
+            self.height - 1, self.status().ljust(self.width - 1), curses.color_pair(3)
+        )
+        self.stdscr.noutrefresh()
+        curses.doupdate()
+
+    def read_prompt(self, label: str, incremental: bool = False) -> Optional[str]:
+        # Returns the entered text, or None when cancelled with Esc. With
+        # incremental, the filter is updated as each key is typed.
+        text = ""
+        while True:
+            self.prompt = (label, text)
+            self.render()
+            k = self.stdscr.getch()
+            if k in KEY_ENTER:
+                self.prompt = None
+                return text
+            if k == KEY_ESCAPE:
+                self.prompt = None
+                return None
+            if k == curses.KEY_RESIZE:
+                self.resize()
+                continue
+            if k in KEY_BACKSPACE:
+                text = text[:-1]
+            elif 32 <= k < 127:
+                text += chr(k)
+            else:
+                continue
+            if incremental:
+                self.apply_filter(text.lower())
+
+    def handle(self, k: int) -> bool:
+        # Returns True when the user accepts the new order.
+        self.message = ""
         if k == curses.KEY_DOWN:
-            selection = move_selection(selection, data, 1)
+            self.move_selection(1)
         elif k == curses.KEY_UP:
-            selection = move_selection(selection, data, -1)
+            self.move_selection(-1)
+        elif k == curses.KEY_NPAGE:
+            self.move_selection(self.page)
+        elif k == curses.KEY_PPAGE:
+            self.move_selection(-self.page)
+        elif k in (curses.KEY_HOME, ord("g")):
+            self.selection = 0
+        elif k in (curses.KEY_END, ord("G")):
+            self.selection = max(len(self.view) - 1, 0)
         elif k == ord("j"):
-            if check_bounds(selection, data, 1):
-                list_swap(data, selection, 1)
-                selection = move_selection(selection, data, 1)
+            self.move_entry(1)
         elif k == ord("k"):
-            if check_bounds(selection, data, -1):
-                list_swap(data, selection, -1)
-                selection = move_selection(selection, data, -1)
-        elif k == curses.KEY_ENTER or k == 10 or k == 13:
-            data[selection] = (data[selection][0], not data[selection][1])
-            selection = move_selection(selection, data, 1)
-
+            self.move_entry(-1)
+        elif k in KEY_ENTER:
+            self.toggle()
+        elif k == ord("s"):
+            self.snap()
+        elif k == ord(":"):
+            number = self.read_prompt(":")
+            if number:
+                self.jump(number)
+        elif k == ord("/"):
+            previous = self.filter
+            term = self.read_prompt("/", incremental=True)
+            self.apply_filter(previous if term is None else term.lower())
+        elif k == KEY_ESCAPE:
+            self.apply_filter(None)
+        elif k == curses.KEY_RESIZE:
+            self.resize()
         elif k == ord("c"):
-            return data
-
+            return True
         elif k == ord("q"):
             raise AbortModOrderException()
+        return False
 
-        if scroll_window_position < len(data) - 1 and selection > (
-            scroll_window_position + scroll_window_height - 1
-        ):
-            scroll_window_position += 1
-        if scroll_window_position > 0 and selection < (scroll_window_position):
-            scroll_window_position -= 1
+    def run(self) -> List[Tuple[str, bool]]:
+        while True:
+            self.render()
+            if self.handle(self.stdscr.getch()):
+                return self.data
 
-        statusbarstr = "Press 'c' to accept changes, 'q' to exit without saving, 'Enter' to enable/disable, 'j/k' to change order."
 
-        max_length = 0
-        for n in data:
-            if len(n[0]) > max_length:
-                max_length = len(n[0])
+def multiselect_order_menu(stdscr, data, rules: Optional[dict] = None):
+    # rules is an optional community rules database; About.xml constraints
+    # are taken from the mods themselves.
+    constraints = None
+    if data and not isinstance(data[0], tuple):
+        from .modsconfig import merge_community_rules
 
-        scroll_centering_value = (
-            scroll_window_height if scroll_window_height < len(data) else len(data)
-        )
-        start_y = int(
-            (window_height // 2)
-            - int(scroll_centering_value) // 2
-            - int(scroll_centering_value) % 2
-        )
-        start_x = int((window_width // 2) - int(max_length) // 2)
-
-        for i, (k, v) in enumerate(
-            data[scroll_window_position : scroll_window_position + scroll_window_height]
-        ):
-            if v == False:
-                stdscr.addstr(start_y, start_x - 3, "-")
-            if v == True:
-                stdscr.addstr(start_y, start_x - 3, "+")
-            if selection == i + scroll_window_position:
-                stdscr.attron(curses.A_STANDOUT)
-            stdscr.addstr(start_y, start_x, k)
-            if selection == i + scroll_window_position:
-                stdscr.attroff(curses.A_STANDOUT)
-            start_y += 1
-
-        # Rendering some text
-        title = "RMM: Mod Sorting Display"
-        stdscr.addstr(0, 0, title, curses.color_pair(1))
-
-        # Render status bar
-        stdscr.attron(curses.color_pair(3))
-        stdscr.addstr(window_height - 1, 0, statusbarstr[0 : window_width - 1])
-        if window_width > len(statusbarstr):
-            stdscr.addstr(
-                window_height - 1,
-                len(statusbarstr),
-                " " * (window_width - len(statusbarstr) - 1),
-            )
-        stdscr.attroff(curses.color_pair(3))
-
-        # Refresh the screen
-        stdscr.refresh()
-
-        # Wait for next input
-        k = stdscr.getch()
+        load_after, load_before = merge_community_rules(data, rules or {})
+        incompatible = {
+            n.packageid: {m.lower() for m in n.incompatible or []} for n in data
+        }
+        data = [(n.packageid, n.enabled) for n in data]
+        constraints = ConstraintIndex(data, load_after, load_before, incompatible)
+
+    curses.start_color()
+    curses.init_pair(1, curses.COLOR_CYAN, curses.COLOR_BLACK)
+    curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
+    curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_WHITE)
+    try:
+        curses.curs_set(0)
+    except curses.error:
+        pass
+    # Esc should act immediately rather than wait for an escape sequence.
+    if hasattr(curses, "set_escdelay"):
+        curses.set_escdelay(25)
+
+    stdscr.erase()
+    return OrderMenu(stdscr, data, constraints).run()
 
 
 def main():
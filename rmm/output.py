@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Iterable, Optional, TextIO
+
+FORMATS = ["json", "ndjson"]
+
+# Field names are part of the output contract for scripts; append, don't rename.
+MOD_FIELDS = [
+    "packageid",
+    "name",
+    "author",
+    "steamid",
+    "enabled",
+    "dirname",
+    "versions",
+    "before",
+    "after",
+    "incompatible",
+    "ignored",
+    "repo_url",
+    "size",
+    "source",
+]
+
+MOD_LIST_FIELDS = {"versions", "before", "after", "incompatible"}
+
+WORKSHOP_FIELDS = [
+    "steamid",
+    "name",
+    "author",
+    "description",
+    "update_time",
+    "size",
+    "create_time",
+    "num_ratings",
+    "rating",
+]
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, (set, tuple)):
+        return sorted(value) if isinstance(value, set) else list(value)
+    return value
+
+
+def record(item: Any) -> dict:
+    from .mod import Mod
+    from .steam import WorkshopResult
+
+    if isinstance(item, Mod):
+        fields = MOD_FIELDS
+    elif isinstance(item, WorkshopResult):
+        fields = WORKSHOP_FIELDS
+    elif isinstance(item, dict):
+        return {k: _value(v) for k, v in item.items()}
+    else:
+        raise TypeError(f"Cannot serialize {type(item).__name__}")
+    row = {n: _value(getattr(item, n, None)) for n in fields}
+    for n in MOD_LIST_FIELDS.intersection(fields):
+        row[n] = row[n] or []
+    return row
+
+
+# Where rows go once messages are moved off stdout.
+_rows: Optional[TextIO] = None
+
+
+def separate_messages():
+    # Keeps stdout for rows only: rows get a private copy of it and fd 1 is
+    # pointed at stderr, so prints from here, pool workers and child
+    # processes all land on stderr whatever start method they use.
+    global _rows
+    if _rows is not None:
+        return
+    sys.stdout.flush()
+    _rows = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding=sys.stdout.encoding)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+
+class RowWriter:
+    # json writes a single array, ndjson one object per line; either way rows
+    # are flushed as soon as they are produced.
+    def __init__(self, output_format: str, stream: Optional[TextIO] = None):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format {output_format}")
+        self.output_format = output_format
+        self.stream = stream or _rows or sys.stdout
+        self.count = 0
+
+    def __enter__(self) -> RowWriter:
+        if self.output_format == "json":
+            self.stream.write("[")
+        return self
+
+    def write(self, item: Any, **extra):
+        row = json.dumps({**record(item), **extra})
+        if self.output_format == "json":
+            row = ("," if self.count else "") + "\n" + row
+        else:
+            row += "\n"
+        self.stream.write(row)
+        self.stream.flush()
+        self.count += 1
+
+    def write_all(self, items: Iterable[Any]):
+        for item in items:
+            self.write(item)
+
+    def __exit__(self, *exc):
+        if self.output_format == "json":
+            self.stream.write("\n]\n" if self.count else "]\n")
+            self.stream.flush()
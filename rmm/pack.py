@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# Modpack archives for 'rmm pack' and 'rmm unpack': one compressed tar stream
+# holding an index, a V2 mod list and every mod folder. The index comes first
+# and carries each mod's content hash, so unpacking can decide which mods are
+# already installed before their files go by, and skip them without seeking.
+#
+# Archives are compressed on all cores: with zstd when the zstandard package
+# is installed, otherwise as xz blocks compressed side by side. Both are read
+# back, as are plain and gzipped tars.
+
+from __future__ import annotations
+
+import io
+import json
+import lzma
+import os
+import shutil
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Deque, Generator, List, Optional, Set, Tuple
+
+from . import util
+from .mod import Mod
+from .modlist import ModListV2Format
+
+INDEX_NAME = "rmm-pack.json"
+MODLIST_NAME = "modlist.csv"
+MODS_DIR = "Mods"
+PACK_VERSION = 1
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZSTD_LEVEL = 10
+XZ_MAGIC = b"\xfd7zXZ\x00"
+XZ_PRESET = 6
+# Uncompressed bytes per xz stream. Each is compressed on its own thread and
+# the streams are concatenated, which xz readers accept as one file.
+XZ_BLOCK_SIZE = 8 * 1024**2
+COMPRESS_WORKERS = os.cpu_count() or 4
+
+
+class PackError(Exception):
+    pass
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ParallelXZWriter(io.RawIOBase):
+    # Write-only file object compressing blocks on a thread pool; lzma drops
+    # the GIL while it works. Blocks are written in order, with at most two
+    # per worker in flight.
+    def __init__(self, f: BinaryIO):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.f = f
+        self.buffer = bytearray()
+        self.pending: Deque[Future] = deque()
+        self.pool = ThreadPoolExecutor(COMPRESS_WORKERS)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= XZ_BLOCK_SIZE:
+            self._submit(bytes(self.buffer[:XZ_BLOCK_SIZE]))
+            del self.buffer[:XZ_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block: bytes):
+        self.pending.append(self.pool.submit(lzma.compress, block, preset=XZ_PRESET))
+        while len(self.pending) > COMPRESS_WORKERS * 2:
+            self.f.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        if self.buffer or not self.pending:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.f.write(self.pending.popleft().result())
+        self.pool.shutdown()
+        super().close()
+
+
+@contextmanager
+def _writer(path: Path) -> Generator[tarfile.TarFile, None, None]:
+    # Profile links are followed, so the archive holds the mods themselves.
+    with path.open("wb") as f:
+        if zstd_available():
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+            stream = compressor.stream_writer(f, closefd=False)
+        else:
+            stream = ParallelXZWriter(f)
+        with stream, tarfile.open(fileobj=stream, mode="w|", dereference=True) as tar:
+            yield tar
+
+
+@contextmanager
+def _reader(path: Path) -> Generator[tarfile.TarFile, None, None]:
+    with path.open("rb") as f:
+        magic = f.read(len(XZ_MAGIC))
+        f.seek(0)
+        if magic.startswith(ZSTD_MAGIC):
+            if not zstd_available():
+                raise PackError(f"{path} is zstd compressed; install zstandard")
+            import zstandard
+
+            stream = zstandard.ZstdDecompressor().stream_reader(f, closefd=False)
+        elif magic == XZ_MAGIC:
+            stream = lzma.LZMAFile(f)
+        else:
+            stream = f
+        with stream, tarfile.open(fileobj=stream, mode="r|*") as tar:
+            yield tar
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _skip_rmm_files(info: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+    # Manifests and other rmm files at the top of a mod describe this install,
+    # not the mod; unpacking records fresh ones.
+    parts = info.name.split("/")
+    if len(parts) == 3 and parts[2].startswith(util.RMM_FILE_PREFIX):
+        return None
+    return info
+
+
+def write_pack(path: Path, mods: List[Tuple[Mod, Path, str]], order: List[str]) -> int:
+    # mods are (mod, folder, content hash). Returns the number packed.
+    index = {
+        "version": PACK_VERSION,
+        "order": order,
+        "mods": [
+            {
+                "packageid": mod.packageid,
+                "steamid": mod.steamid,
+                "name": mod.name,
+                "hash": content_hash,
+            }
+            for mod, _, content_hash in mods
+        ],
+    }
+    modlist = "\n".join(ModListV2Format.serialize([m for m, _, _ in mods]))
+    with _writer(path) as tar:
+        _add_bytes(tar, INDEX_NAME, json.dumps(index).encode())
+        _add_bytes(tar, MODLIST_NAME, (modlist + "\n").encode())
+        for mod, folder, _ in mods:
+            tar.add(
+                folder, arcname=f"{MODS_DIR}/{mod.packageid}", filter=_skip_rmm_files
+            )
+    return len(mods)
+
+
+def _safe_parts(name: str) -> Optional[List[str]]:
+    parts = name.split("/")
+    if name.startswith("/") or any(n in ("", ".", "..") for n in parts):
+        return None
+    return parts
+
+
+def read_pack(
+    path: Path,
+    staging: Path,
+    plan: Callable[[dict], Set[str]],
+    done: Callable[[str, Path], None],
+) -> dict:
+    # Streams the archive once. plan gets the index and returns the packageids
+    # to extract; each is written under staging and handed to done(packageid,
+    # folder) as soon as its last file is out. Returns the index.
+    index: Optional[dict] = None
+    wanted: Set[str] = set()
+    current: Optional[str] = None
+
+    def finish():
+        if current in wanted:
+            done(current, staging / current)
+
+    with _reader(path) as tar:
+        for member in tar:
+            if index is None:
+                if member.name != INDEX_NAME:
+                    raise PackError(f"{path} is not an rmm pack")
+                index = json.load(tar.extractfile(member))
+                if index.get("version") != PACK_VERSION:
+                    raise PackError(f"{path} has unsupported pack version")
+                wanted = plan(index)
+                continue
+            parts = _safe_parts(member.name)
+            if not parts or parts[0] != MODS_DIR or len(parts) < 2:
+                continue
+            if parts[1] != current:
+                finish()
+                current = parts[1]
+            if current not in wanted:
+                continue
+            target = staging.joinpath(*parts[1:])
+            if member.isdir():
+                target.mkdir(parents=True, exist_ok=True)
+            elif member.isfile():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with target.open("wb") as f:
+                    shutil.copyfileobj(tar.extractfile(member), f)
+                os.utime(target, (member.mtime, member.mtime))
+        finish()
+    if index is None:
+        raise PackError(f"{path} is empty")
+    return index
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
+import os
+from collections import deque
 from pathlib import Path
 from typing import List, Optional
 
-from . import util
+from . import timing, util, vdf
+from .cache import JsonCache
+
+RIMWORLD_APPID = "294100"
 
 
 class PathFinder:
+    _cache = JsonCache("paths")
+
     DEFAULT_GAME_PATHS = [
         ("~/GOG Games/RimWorld", "linux"),
         ("~/games/rimworld", "linux"),
@@ -31,56 +38,116 @@ class PathFinder:
         ("C:/Program Files/Steam/steamapps/common/workshop/content/294100", "win32"),
     ]
 
+    STEAM_ROOTS = [
+        ("~/.local/share/Steam", "linux"),
+        ("~/.steam/steam", "linux"),
+        ("~/.var/app/com.valvesoftware.Steam/.local/share/Steam", "linux"),
+        ("~/Library/Application Support/Steam", "darwin"),
+        ("C:/Program Files (x86)/Steam", "win32"),
+        ("C:/Program Files/Steam", "win32"),
+    ]
+
     DEFAULT_CONFIG_PATHS = [
         ("~/Library/Application Support/RimWorld/", "darwin"),
         ("~/.config/unity3d/Ludeon Studios/RimWorld by Ludeon Studios", "linux"),
         ("~/AppData/LocalLow/Ludeon Studios/RimWorld by Ludeon Studios", "win32"),
     ]
 
+    # Directories that never contain a RimWorld install and can be huge.
+    PRUNED_DIRS = {
+        ".git",
+        ".hg",
+        ".svn",
+        ".cache",
+        ".venv",
+        "__pycache__",
+        "node_modules",
+        "site-packages",
+        "shadercache",
+        "compatdata",
+        "downloading",
+    }
+    # Virtual filesystems, pruned only directly under the filesystem root so
+    # folders like ~/dev stay searchable.
+    PRUNED_MOUNTS = {"proc", "sys", "dev"}
+    MAX_SEARCH_DEPTH = 8
+
     @staticmethod
     def _is_game_dir(p: Path) -> bool:
-        if p.name == "Mods":
-            for n in p.parent.iterdir():
-                if n.name == "Version.txt":
-                    return True
-        return False
+        return p.name == "Mods" and (p.parent / "Version.txt").is_file()
 
     @staticmethod
     def _is_workshop_dir(p: Path) -> bool:
         return (
             p.name == "294100"
+            and len(p.parts) >= 3
             and p.parts[-2] == "content"
             and p.parts[-3] == "workshop"
         )
 
     @staticmethod
     def _is_config_dir(p: Path) -> bool:
-        files_to_find = ["Config", "Saves"]
-        child_names = [f.name for f in p.iterdir()]
-        for target_name in files_to_find:
-            if not target_name in child_names:
-                return False
-        return True
+        return (p / "Config").is_dir() and (p / "Saves").is_dir()
 
-    @staticmethod
-    def _search_root(p: Path, f) -> Optional[Path]:
-        try:
-            p = util.sanitize_path(p)
-            for n in p.glob("**/"):
-                if f(n):
-                    return n
-            return None
-        except FileNotFoundError:
+    @classmethod
+    def _search_root(cls, p: Path, f) -> Optional[Path]:
+        # Breadth-first so the shallowest match wins and the search stops at the
+        # first hit instead of walking the whole tree under p.
+        p = util.sanitize_path(p)
+        if not p.is_dir():
             return None
+        queue = deque([(p, 0)])
+        while queue:
+            directory, depth = queue.popleft()
+            if f(directory):
+                return directory
+            if depth >= cls.MAX_SEARCH_DEPTH:
+                continue
+            pruned = cls.PRUNED_DIRS
+            if directory.parent == directory:
+                pruned = pruned | cls.PRUNED_MOUNTS
+            try:
+                with os.scandir(directory) as it:
+                    children = sorted(
+                        e.name
+                        for e in it
+                        if e.name not in pruned
+                        and (
+                            e.is_dir(follow_symlinks=False)
+                            # Mods is a link while a profile is in use.
+                            or (e.name == "Mods" and e.is_dir())
+                        )
+                    )
+            except OSError:
+                continue
+            queue.extend((directory / n, depth + 1) for n in children)
+        return None
 
-    @staticmethod
-    def get_workshop_from_game_path(p: Path):
+    @classmethod
+    def _search_cached(cls, kind: str, p: Path, f, validate) -> Optional[Path]:
+        key = f"{kind}:{util.sanitize_path(p)}"
+        if cached := cls._cache.get(key):
+            cached = Path(cached)
+            if validate(cached):
+                return cached
+            cls._cache.delete(key)
+
+        with timing.phase(f"paths.search.{kind}"):
+            result = cls._search_root(p, f)
+        if result:
+            cls._cache.set(key, str(result))
+        cls._cache.save()
+        return result
+
+    @classmethod
+    def get_workshop_from_game_path(cls, p: Path):
         p = util.sanitize_path(p)
         for index, dirname in enumerate(p.parts):
             if dirname == "steamapps":
                 return Path(*list(p.parts[0:index])) / Path(
                     "steamapps/workshop/content/294100"
                 )
+        return cls.find_steam_workshop()
 
     @staticmethod
     def _search_defaults(defaults: List[str], f) -> Optional[Path]:
@@ -91,25 +158,83 @@ class PathFinder:
                 return path
         return None
 
+    # Cached results are validated with a single stat before being trusted.
     @classmethod
     def find_game(cls, p: Path) -> Optional[Path]:
-        return cls._search_root(p, cls._is_game_dir)
+        return cls._search_cached(
+            "game",
+            p,
+            cls._is_game_dir,
+            lambda n: (n.parent / "Version.txt").is_file(),
+        )
 
     @classmethod
     def find_workshop(cls, p: Path) -> Optional[Path]:
-        return cls._search_root(p, cls._is_workshop_dir)
+        return cls._search_cached(
+            "workshop", p, cls._is_workshop_dir, lambda n: n.is_dir()
+        )
 
     @classmethod
     def find_config(cls, p: Path) -> Optional[Path]:
-        return cls._search_root(p, cls._is_config_dir)
+        return cls._search_cached(
+            "config", p, cls._is_config_dir, lambda n: (n / "Config").is_dir()
+        )
+
+    @classmethod
+    def steam_libraries(cls) -> List[Path]:
+        libraries: List[Path] = []
+        platform = util.platform()
+        for root in [n[0] for n in cls.STEAM_ROOTS if n[1] == platform]:
+            root = util.sanitize_path(root)
+            try:
+                folders = vdf.load(root / "steamapps/libraryfolders.vdf")
+            except (OSError, vdf.VdfParseError):
+                continue
+            paths = [root]
+            for key, value in folders.get("libraryfolders", {}).items():
+                # Newer files nest each library in a section, older ones map
+                # an index straight to the path.
+                if isinstance(value, dict) and "path" in value:
+                    paths.append(Path(value["path"]))
+                elif key.isdigit() and isinstance(value, str):
+                    paths.append(Path(value))
+            for path in paths:
+                if path.resolve() not in [n.resolve() for n in libraries]:
+                    libraries.append(path)
+        return libraries
+
+    @classmethod
+    def find_steam_game(cls) -> Optional[Path]:
+        for library in cls.steam_libraries():
+            manifest = library / f"steamapps/appmanifest_{RIMWORLD_APPID}.acf"
+            try:
+                installdir = vdf.load(manifest)["appstate"]["installdir"]
+            except (OSError, KeyError, TypeError, vdf.VdfParseError):
+                continue
+            mods = library / "steamapps/common" / installdir / "Mods"
+            if cls._is_game_dir(mods):
+                return mods
+        return None
+
+    @classmethod
+    def find_steam_workshop(cls) -> Optional[Path]:
+        for library in cls.steam_libraries():
+            workshop = library / "steamapps/workshop/content" / RIMWORLD_APPID
+            if workshop.is_dir():
+                return workshop
+        return None
 
     @classmethod
     def find_game_defaults(cls) -> Optional[Path]:
-        return cls._search_defaults(cls.DEFAULT_GAME_PATHS, cls.find_game)
+        return cls.find_steam_game() or cls._search_defaults(
+            cls.DEFAULT_GAME_PATHS, cls.find_game
+        )
 
     @classmethod
     def find_workshop_defaults(cls) -> Optional[Path]:
-        return cls._search_defaults(cls.DEFAULT_WORKSHOP_PATHS, cls.find_workshop)
+        return cls.find_steam_workshop() or cls._search_defaults(
+            cls.DEFAULT_WORKSHOP_PATHS, cls.find_workshop
+        )
 
     @classmethod
     def find_config_defaults(cls) -> Optional[Path]:
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from . import util
+from .manager import LOCK_WORKERS, Manager
+from .mod import EXPANSION_PACKAGES, Mod
+from .modlist import ModListEntry
+
+# Used only to estimate how long downloads will take.
+ASSUMED_THROUGHPUT = 5 * 1024 * 1024
+
+
+@dataclass
+class Plan:
+    download: List[ModListEntry] = field(default_factory=list)
+    remove: List[Mod] = field(default_factory=list)
+    enable: List[str] = field(default_factory=list)
+    disable: List[str] = field(default_factory=list)
+    moved: int = 0
+    # Target activeMods; steamid-only entries are resolved after download.
+    active: List[ModListEntry] = field(default_factory=list)
+
+    def empty(self) -> bool:
+        return not (
+            self.download or self.remove or self.enable or self.disable or self.moved
+        )
+
+    def download_bytes(self) -> Optional[int]:
+        sizes = [e.size for e in self.download if e.size is not None]
+        return sum(sizes) if sizes else None
+
+    def summary(self) -> str:
+        download = f"{len(self.download)}"
+        if (size := self.download_bytes()) is not None:
+            unknown = len([e for e in self.download if e.size is None])
+            download += " ({}, ~{}s{})".format(
+                util.format_bytes(size),
+                int(size / ASSUMED_THROUGHPUT) + 1,
+                f", {unknown} of unknown size" if unknown else "",
+            )
+        lines = [
+            f"download  {download}",
+            f"remove    {len(self.remove)}",
+            f"enable    {len(self.enable)}",
+            f"disable   {len(self.disable)}",
+            f"reorder   {self.moved}",
+        ]
+        return "\n".join(lines)
+
+    def details(self) -> str:
+        lines = []
+        for verb, items in [
+            ("Download", [e.title() for e in self.download]),
+            ("Remove", [m.title() for m in self.remove]),
+            ("Enable", self.enable),
+            ("Disable", self.disable),
+        ]:
+            lines += [f"{verb} {n}" for n in items]
+        return "\n".join(lines)
+
+
+class Planner:
+    @staticmethod
+    def _find_installed(installed: dict, entry: ModListEntry) -> Optional[Mod]:
+        mod = installed.get(entry.packageid)
+        if not mod and entry.steamid:
+            mod = next((m for m in installed.values() if m == entry.steamid), None)
+        return mod
+
+    @classmethod
+    def plan(
+        cls, manager: Manager, entries: List[ModListEntry], exact: bool = False
+    ) -> Plan:
+        plan = Plan()
+        installed = manager.installed_mods_dict()
+
+        def needs_download(entry: ModListEntry) -> bool:
+            mod = cls._find_installed(installed, entry)
+            if not mod:
+                return bool(entry.steamid)
+            if entry.hash and not mod.workshop_managed:
+                return not manager._matches_lock(manager.mod_dir(mod), entry)
+            return False
+
+        with ThreadPoolExecutor(LOCK_WORKERS) as pool:
+            downloads = list(pool.map(needs_download, entries))
+        plan.download = [e for e, d in zip(entries, downloads) if d]
+
+        expansions = [m.packageid for m in EXPANSION_PACKAGES]
+        resolved = []
+        for entry in entries:
+            mod = cls._find_installed(installed, entry)
+            if mod and not entry.packageid:
+                entry = entry._replace(packageid=mod.packageid)
+            if mod or entry.steamid or entry.packageid in expansions:
+                resolved.append(entry)
+
+        listed = {e.packageid for e in resolved if e.packageid}
+        listed_steamids = {e.steamid for e in resolved if e.steamid}
+        current = list(manager.modsconfig.mods)
+
+        if exact:
+            plan.remove = [
+                m
+                for pid, m in installed.items()
+                if pid not in listed
+                and m.steamid not in listed_steamids
+                and not m.ignored
+                and not m.workshop_managed
+            ]
+
+        # Core and DLC rarely appear in exported lists, so keep them in front
+        # unless the list places them explicitly. Without -r, mods the list
+        # does not mention stay enabled after the listed ones.
+        head = [p for p in current if p in expansions and p not in listed]
+        tail = (
+            [] if exact else [p for p in current if p not in listed and p not in head]
+        )
+        plan.active = (
+            [ModListEntry(packageid=p) for p in head]
+            + resolved
+            + [ModListEntry(packageid=p) for p in tail]
+        )
+
+        target = [e.packageid for e in plan.active if e.packageid]
+        plan.enable = [p for p in target if p not in manager.modsconfig.mods] + [
+            e.title() for e in plan.active if not e.packageid
+        ]
+        plan.disable = [p for p in current if p not in target]
+        kept_target = [p for p in target if p in manager.modsconfig.mods]
+        kept_current = [p for p in current if p in target]
+        plan.moved = len([a for a, b in zip(kept_target, kept_current) if a != b])
+        return plan
+
+    @staticmethod
+    def apply(manager: Manager, plan: Plan):
+        if plan.remove:
+            manager.remove_mods(plan.remove)
+        if plan.download:
+            manager.install_entries(plan.download)
+
+        installed = manager.installed_mods_dict()
+        active = []
+        for entry in plan.active:
+            pid = entry.packageid
+            if not pid:
+                mod = Planner._find_installed(installed, entry)
+                if not mod:
+                    print(f"Unable to enable {entry.title()}")
+                    continue
+                pid = mod.packageid
+            if pid not in active:
+                active.append(pid)
+
+        manager.modsconfig.mods = {pid: None for pid in active}
+        if manager.write_modsconfig():
+            print("Updating ModsConfig.xml")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+CHUNK_SIZE = 4096
+# Progress output is often rewritten in place with \r rather than \n.
+LINE_BREAK = re.compile(rb"\r\n|\r|\n")
+
+
+class ProcessTimeout(Exception):
+    pass
+
+
+async def _stream_lines(
+    cmd: List[str],
+    on_line: Callable[[str], None],
+    deadline: Callable[[], Optional[float]],
+    env: Optional[Dict[str, str]],
+    cwd: Optional[str],
+) -> int:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=env,
+        cwd=cwd,
+    )
+    assert proc.stdout
+    buffer = b""
+    try:
+        while True:
+            # deadline is asked again after every chunk, since on_line may
+            # move it (e.g. when a new item starts).
+            until = deadline()
+            timeout = None if until is None else max(until - time.monotonic(), 0)
+            try:
+                chunk = await asyncio.wait_for(proc.stdout.read(CHUNK_SIZE), timeout)
+            except asyncio.TimeoutError:
+                raise ProcessTimeout(f"{cmd[0]} timed out")
+            if not chunk:
+                break
+            *lines, buffer = LINE_BREAK.split(buffer + chunk)
+            for line in lines:
+                if line:
+                    on_line(line.decode(errors="replace"))
+        if buffer:
+            on_line(buffer.decode(errors="replace"))
+        return await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+def run_lines(
+    cmd: List[str],
+    on_line: Callable[[str], None],
+    deadline: Union[Callable[[], Optional[float]], float, None] = None,
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+) -> int:
+    # Runs cmd, passing each output line (stdout and stderr) to on_line, and
+    # returns its exit code. deadline is a time.monotonic() value, or a
+    # callable returning one; past it the process is killed and
+    # ProcessTimeout raised.
+    if not callable(deadline):
+        fixed = deadline
+        deadline = lambda: fixed  # noqa: E731
+    return asyncio.run(_stream_lines(cmd, on_line, deadline, env, cwd))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+# Named mod profiles built from symlinks. Mod folders live once in a shared
+# store next to Mods; a profile is a folder of links into the store plus a
+# copy of ModsConfig.xml, and Mods itself becomes a link to the active
+# profile. Switching replaces one link and one file, each with a rename.
+#
+#   <game>/.rmm/store/<mod>
+#   <game>/.rmm/profiles/<name>/Mods/<mod> -> ../../../store/<mod>
+#   <game>/.rmm/profiles/<name>/ModsConfig.xml
+#   <game>/Mods -> .rmm/profiles/<name>/Mods
+
+from __future__ import annotations
+
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from . import util
+
+PROFILE_DIR = util.RMM_FILE_PREFIX
+NAME = re.compile(r"^[\w.-]+$")
+
+
+class ProfileError(Exception):
+    pass
+
+
+class ProfileInfo(NamedTuple):
+    name: str
+    mods: int
+    active: bool
+
+
+def _clear(path: Path):
+    # Leftovers from an interrupted run.
+    if path.is_symlink() or path.exists():
+        util.remove(path)
+
+
+def _link(target: str, path: Path):
+    # Creates path -> target, replacing whatever link is at path in one step.
+    tmp = path.with_name(f".{path.name}.rmm-tmp")
+    _clear(tmp)
+    os.symlink(target, tmp, target_is_directory=True)
+    os.replace(tmp, path)
+
+
+class Profiles:
+    def __init__(self, mod_path: Path, modsconfig_path: Optional[Path]):
+        self.mod_path = mod_path
+        self.modsconfig_path = modsconfig_path
+        self.root = mod_path.parent / PROFILE_DIR
+        self.store = self.root / "store"
+        self.profiles = self.root / "profiles"
+
+    def _path(self, name: str) -> Path:
+        if not NAME.match(name) or name.startswith("."):
+            raise ProfileError(f"Invalid profile name '{name}'")
+        return self.profiles / name
+
+    def _target(self, name: str) -> str:
+        # Relative, so the links survive the game folder moving.
+        return os.path.join(PROFILE_DIR, "profiles", name, "Mods")
+
+    def active(self) -> Optional[str]:
+        if not self.mod_path.is_symlink():
+            return None
+        target = Path(os.readlink(self.mod_path))
+        if target.parent.parent.name == "profiles":
+            return target.parent.name
+        return None
+
+    def list(self) -> List[ProfileInfo]:
+        active = self.active()
+        try:
+            names = sorted(n.name for n in os.scandir(self.profiles) if n.is_dir())
+        except OSError:
+            return []
+        return [
+            ProfileInfo(
+                n,
+                sum(m.is_dir() for m in os.scandir(self.profiles / n / "Mods")),
+                n == active,
+            )
+            for n in names
+            if not n.startswith(".")
+        ]
+
+    def all_mods(self) -> List[str]:
+        # Every mod folder a profile can link: those in the store and those
+        # still in Mods, which saving moves into it.
+        names = set()
+        for path in (self.store, self.mod_path):
+            try:
+                with os.scandir(path) as it:
+                    names.update(
+                        n.name
+                        for n in it
+                        if n.is_dir(follow_symlinks=False)
+                        and not n.name.startswith(".")
+                    )
+            except OSError:
+                continue
+        return sorted(names)
+
+    def _adopt(self, entry: Path):
+        # Moves a mod folder into the store, leaving a link behind. A folder
+        # already in the store is replaced, so every profile sees the update.
+        stored = self.store / entry.name
+        if stored.exists():
+            old = self.store / f".{entry.name}.rmm-old"
+            _clear(old)
+            os.replace(stored, old)
+            os.replace(entry, stored)
+            util.remove(old)
+        else:
+            os.replace(entry, stored)
+        os.symlink(
+            os.path.relpath(stored.resolve(), entry.parent.resolve()),
+            entry,
+            target_is_directory=True,
+        )
+
+    def save(self, name: str, dirnames: List[str]):
+        # Stores every mod folder in Mods, then makes a profile linking the
+        # given ones and switches to it.
+        path = self._path(name)
+        self.store.mkdir(parents=True, exist_ok=True)
+        self.profiles.mkdir(parents=True, exist_ok=True)
+        extra_files = []
+        for entry in list(self.mod_path.iterdir()):
+            if entry.is_symlink():
+                continue
+            if entry.is_dir():
+                self._adopt(entry)
+            else:
+                extra_files.append(entry)
+
+        tmp = self.profiles / f".{name}.rmm-tmp"
+        _clear(tmp)
+        (tmp / "Mods").mkdir(parents=True)
+        for dirname in dirnames:
+            if not (self.store / dirname).is_dir():
+                raise ProfileError(f"{dirname} is not in the profile store")
+            os.symlink(
+                os.path.join("..", "..", "..", "store", dirname),
+                tmp / "Mods" / dirname,
+                target_is_directory=True,
+            )
+        for entry in extra_files:
+            shutil.copy2(entry, tmp / "Mods" / entry.name)
+        if self.modsconfig_path and self.modsconfig_path.is_file():
+            shutil.copy2(self.modsconfig_path, tmp / "ModsConfig.xml")
+
+        if path.exists():
+            old = self.profiles / f".{name}.rmm-old"
+            _clear(old)
+            os.replace(path, old)
+            os.replace(tmp, path)
+            util.remove(old)
+        else:
+            os.replace(tmp, path)
+        self._switch(name)
+
+    def _switch(self, name: str):
+        if self.mod_path.is_symlink() or not self.mod_path.exists():
+            _link(self._target(name), self.mod_path)
+            return
+        # Mods is still a real folder, holding only links to the store and
+        # files copied into the profile by save.
+        old = self.root / "Mods.rmm-old"
+        _clear(old)
+        os.replace(self.mod_path, old)
+        _link(self._target(name), self.mod_path)
+        util.remove(old)
+
+    def use(self, name: str):
+        path = self._path(name)
+        if not path.is_dir():
+            raise ProfileError(f"No profile named '{name}'")
+        if not self.mod_path.is_symlink() and any(
+            not n.is_symlink() and n.is_dir() for n in self.mod_path.iterdir()
+        ):
+            raise ProfileError(
+                f"{self.mod_path} holds mods outside the profile store; "
+                "keep them with 'rmm profile save <name>' first"
+            )
+        # Keep what was enabled or sorted since the last save with the
+        # profile being left.
+        active = self.active()
+        if active and self.modsconfig_path and self.modsconfig_path.is_file():
+            util.atomic_write(
+                self.profiles / active / "ModsConfig.xml",
+                [self.modsconfig_path.read_text(encoding="utf-8")],
+            )
+        self._switch(name)
+        snapshot = path / "ModsConfig.xml"
+        if self.modsconfig_path and snapshot.is_file():
+            util.atomic_write(
+                self.modsconfig_path, [snapshot.read_text(encoding="utf-8")]
+            )
+
+    def delete(self, name: str):
+        path = self._path(name)
+        if not path.is_dir():
+            raise ProfileError(f"No profile named '{name}'")
+        if name == self.active():
+            raise ProfileError(f"Profile '{name}' is in use")
+        # The links go; the mods stay in the store for other profiles.
+        util.remove(path)
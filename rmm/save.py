@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List
+
+from .modlist import ModListEntry
+
+# RimWorld suffixes the package id of Workshop copies that clash with a local
+# copy of the same mod.
+STEAM_SUFFIX = "_steam"
+
+
+class SaveFile:
+    META_LISTS = ("modIds", "modSteamIds", "modNames")
+
+    @classmethod
+    def read_meta(cls, path: Path) -> Dict[str, List[str]]:
+        lists: Dict[str, List[str]] = {n: [] for n in cls.META_LISTS}
+        current = None
+        # Only the <meta> block at the top of the save is read; parsing stops
+        # as soon as it closes, so the size of the save does not matter.
+        with path.open("rb") as f:
+            context = ET.iterparse(f, events=("start", "end"))
+            for event, element in context:
+                if event == "start":
+                    if element.tag in lists:
+                        current = element.tag
+                    elif element.tag == "game":
+                        break
+                    continue
+                if element.tag == "li" and current:
+                    lists[current].append((element.text or "").strip())
+                elif element.tag in lists:
+                    current = None
+                    element.clear()
+                elif element.tag == "meta":
+                    break
+        return lists
+
+    @classmethod
+    def read_modlist(cls, path: Path) -> List[ModListEntry]:
+        meta = cls.read_meta(path)
+        entries = []
+        for n, packageid in enumerate(meta["modIds"]):
+            if packageid.endswith(STEAM_SUFFIX):
+                packageid = packageid[: -len(STEAM_SUFFIX)]
+            try:
+                steamid = int(meta["modSteamIds"][n]) or None
+            except (IndexError, ValueError):
+                steamid = None
+            try:
+                name = meta["modNames"][n] or None
+            except IndexError:
+                name = None
+            entries.append(
+                ModListEntry(packageid=packageid.lower(), steamid=steamid, name=name)
+            )
+        return entries
@@ -5,14 +5,10 @@ import re
 import subprocess
 import tempfile
 import urllib.error
-import urllib.request
-import zipfile
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from bs4 import BeautifulSoup
-
-from . import util
+from . import timing, util
 from .mod import Mod, ModFolder
 
 STEAMCMD_WINDOWS_URL = "https://steamcdn-a.akamaihd.net/client/installer/steamcmd.zip"
@@ -21,12 +17,16 @@ STEAMCMD_WINDOWS_URL = "https://steamcdn-a.akamaihd.net/client/installer/steamcm
 class SteamDownloader:
     @staticmethod
     def download_steamcmd_windows(path):
+        import urllib.request
+        import zipfile
+
         download_path = path / "steamcmd.zip"
         max_retries = 10
         print("Installing SteamCMD")
         for count in range(max_retries + 1):
             try:
                 urllib.request.urlretrieve(STEAMCMD_WINDOWS_URL, download_path)
+                break
             except urllib.error.URLError as e:
                 if count < max_retries:
                     continue
@@ -85,24 +85,24 @@ class SteamDownloader:
         if not home_path:
             raise Exception("Error could not get temporary directory")
 
-        workshop_item_arg = " +workshop_download_item 294100 "
+        from .steamcmd import download_items
+
         if util.platform() == "win32":
-            os.chdir(home_path)
             if not (home_path / "steamcmd.exe").exists():
                 SteamDownloader.download_steamcmd_windows(home_path)
-
-            query = "steamcmd +login anonymous {} +quit".format(
-                workshop_item_arg + workshop_item_arg.join(str(m) for m in mods),
-            )
-            print()
-            for n in util.execute(query):
-                print(n, end="")
+            steamcmd = [str(home_path / "steamcmd.exe")]
+            env = None
         else:
-            query = 'env HOME="{}" steamcmd +login anonymous {} +quit >&2'.format(
-                str(home_path),
-                workshop_item_arg + workshop_item_arg.join(str(m) for m in mods),
+            steamcmd = ["steamcmd"]
+            env = {**os.environ, "HOME": str(home_path)}
+
+        print()
+        with timing.phase("steamcmd", len(mods)):
+            _, failed = download_items(
+                steamcmd, [int(m) for m in mods], env=env, cwd=str(home_path)
             )
-            util.run_sh(query)
+        for steamid, reason in failed.items():
+            print(f"Unable to download {steamid}: {reason}")
 
         # TODO: ugly work around for weird steam problem
         if util.platform() == "linux" and not mod_path.exists():
@@ -177,6 +177,8 @@ class WorkshopWebScraper:
 
     @classmethod
     def _request(cls, url: str, term: str):
+        import urllib.request
+
         max_retries = 5
         for n in range(max_retries + 1):
             try:
@@ -193,6 +195,8 @@ class WorkshopWebScraper:
 
     @classmethod
     def detail(cls, steamid: int) -> WorkshopResult:
+        from bs4 import BeautifulSoup
+
         results = BeautifulSoup(
             cls._request(cls.detail_query, str(steamid)),
             "html.parser",
@@ -243,8 +247,15 @@ class WorkshopWebScraper:
             rating=rating,
         )
 
+    @classmethod
+    def revision(cls, steamid: int) -> Optional[str]:
+        result = cls.detail(steamid)
+        return result.update_time or result.create_time
+
     @classmethod
     def search(cls, term: str, reverse: bool = False) -> List[WorkshopResult]:
+        from bs4 import BeautifulSoup
+
         page_result = BeautifulSoup(
             cls._request(cls.index_query, term),
             "html.parser",
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+from . import util
+from .process import ProcessTimeout, run_lines
+
+RIMWORLD_APPID = 294100
+
+# Seconds one item may take before it is abandoned, and for the whole run.
+ITEM_TIMEOUT = 600.0
+TOTAL_TIMEOUT = 4 * 3600.0
+
+START = re.compile(r"Downloading item (\d+)")
+PROGRESS = re.compile(r"progress: [\d.]+ \((\d+) / (\d+)\)")
+SUCCESS = re.compile(r"Success\. Downloaded item (\d+)[^(]*(?:\((\d+) bytes\))?")
+FAILURE = re.compile(r"ERROR! Download item (\d+) failed \(([^)]*)\)")
+
+
+class SteamEvent(NamedTuple):
+    kind: str  # started, progress, success, failure or timeout
+    steamid: Optional[int]
+    done: int = 0
+    total: int = 0
+    message: str = ""
+
+
+def parse_line(line: str, current: Optional[int] = None) -> Optional[SteamEvent]:
+    # Progress lines don't name the item, so they belong to the current one.
+    if m := SUCCESS.search(line):
+        size = int(m.group(2) or 0)
+        return SteamEvent("success", int(m.group(1)), size, size)
+    if m := FAILURE.search(line):
+        return SteamEvent("failure", int(m.group(1)), message=m.group(2))
+    if m := START.search(line):
+        return SteamEvent("started", int(m.group(1)))
+    if m := PROGRESS.search(line):
+        return SteamEvent("progress", current, int(m.group(1)), int(m.group(2)))
+    return None
+
+
+class DownloadProgress:
+    # One status line, rewritten in place on a terminal. Elsewhere only
+    # finished items are printed, one per line.
+    def __init__(self, total: int, stream: Optional[TextIO] = None):
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.total = total
+        self.finished = 0
+        self.bytes = 0
+        self.current: Optional[int] = None
+        self.current_bytes = 0
+        self.started = time.monotonic()
+        self.width = 0
+
+    def eta(self, elapsed: float) -> Optional[float]:
+        if not self.finished:
+            return None
+        return elapsed / self.finished * (self.total - self.finished)
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = (self.bytes + self.current_bytes) / elapsed
+        eta = self.eta(elapsed)
+        parts = [f"[{self.finished}/{self.total}]"]
+        if self.current:
+            parts.append(str(self.current))
+        parts.append(util.format_bytes(self.bytes + self.current_bytes))
+        parts.append(f"{util.format_bytes(rate)}/s")
+        if eta is not None:
+            parts.append("ETA {}:{:02d}".format(*divmod(int(eta), 60)))
+        return "  ".join(parts)
+
+    def _status(self, text: str):
+        self.stream.write("\r" + text.ljust(self.width))
+        self.width = len(text)
+        self.stream.flush()
+
+    def event(self, event: SteamEvent):
+        if event.kind == "started":
+            self.current, self.current_bytes = event.steamid, 0
+        elif event.kind == "progress":
+            self.current_bytes = event.done
+        elif event.kind in ("success", "failure", "timeout"):
+            self.finished += 1
+            self.bytes += event.done
+            self.current, self.current_bytes = None, 0
+            if self.tty:
+                self._status("")
+                self.stream.write("\r")
+            if event.kind == "success":
+                self.stream.write(f"Downloaded {event.steamid}\n")
+            else:
+                self.stream.write(f"Failed {event.steamid}: {event.message}\n")
+        if self.tty:
+            self._status(self.line())
+
+    def close(self):
+        if self.tty:
+            self._status(self.line())
+            self.stream.write("\n")
+        self.stream.flush()
+
+
+def _timeout(name: str, default: float) -> float:
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def download_items(
+    steamcmd: List[str],
+    steamids: List[int],
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+    item_timeout: Optional[float] = None,
+    total_timeout: Optional[float] = None,
+    progress: Optional[DownloadProgress] = None,
+) -> Tuple[List[int], Dict[int, str]]:
+    # Returns (downloaded, failed) where failed maps steamid to a reason. An
+    # item that stalls past item_timeout is dropped and steamcmd restarted
+    # for the items still pending.
+    item_timeout = item_timeout or _timeout("RMM_STEAMCMD_ITEM_TIMEOUT", ITEM_TIMEOUT)
+    total_timeout = total_timeout or _timeout("RMM_STEAMCMD_TIMEOUT", TOTAL_TIMEOUT)
+    progress = progress or DownloadProgress(len(steamids))
+    run_deadline = time.monotonic() + total_timeout
+
+    pending = list(dict.fromkeys(steamids))
+    downloaded: List[int] = []
+    failed: Dict[int, str] = {}
+    state = {"current": None, "deadline": 0.0}
+
+    def settle(event: SteamEvent):
+        if event.steamid in pending:
+            pending.remove(event.steamid)
+            if event.kind == "success":
+                downloaded.append(event.steamid)
+            else:
+                failed[event.steamid] = event.message
+            progress.event(event)
+
+    def on_line(line: str):
+        event = parse_line(line, state["current"])
+        if not event:
+            return
+        # Any sign of life from steamcmd restarts the per-item clock.
+        state["deadline"] = time.monotonic() + item_timeout
+        if event.kind == "started":
+            state["current"] = event.steamid
+        if event.kind in ("success", "failure"):
+            state["current"] = None
+            settle(event)
+        else:
+            progress.event(event)
+
+    while pending:
+        args = [
+            a
+            for n in pending
+            for a in ("+workshop_download_item", str(RIMWORLD_APPID), str(n))
+        ]
+        state["current"] = None
+        state["deadline"] = time.monotonic() + item_timeout
+        try:
+            code = run_lines(
+                steamcmd + ["+login", "anonymous"] + args + ["+quit"],
+                on_line,
+                lambda: min(state["deadline"], run_deadline),
+                env=env,
+                cwd=cwd,
+            )
+        except FileNotFoundError:
+            for n in list(pending):
+                settle(SteamEvent("failure", n, message=f"{steamcmd[0]} not found"))
+            break
+        except ProcessTimeout:
+            if time.monotonic() >= run_deadline:
+                for n in list(pending):
+                    settle(SteamEvent("timeout", n, message="run timed out"))
+                break
+            stalled = state["current"] or pending[0]
+            settle(SteamEvent("timeout", stalled, message="timed out"))
+            continue
+
+        # Older steamcmd builds don't report each item, so a clean exit
+        # counts whatever is left as downloaded; the caller reads the folder.
+        for n in list(pending):
+            if code == 0:
+                settle(SteamEvent("success", n))
+            else:
+                settle(SteamEvent("failure", n, message=f"steamcmd exited with {code}"))
+
+    progress.close()
+    return downloaded, failed
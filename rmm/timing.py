@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Phase timing behind --profile / RMM_PROFILE. Phases are inclusive, so a
+# phase nested in another is counted in both. Work done inside pool workers
+# is only seen from the parent, as the wall time of the phase around it.
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, TextIO
+
+FORMATS = ["table", "json"]
+TRACEMALLOC_TOP = 25
+
+ENABLED = False
+_output_format = "table"
+_phases: Dict[str, List[float]] = {}
+_started = (0.0, 0.0)
+_profiler = None
+_cprofile_path: Optional[str] = None
+_tracemalloc_path: Optional[str] = None
+
+
+@contextmanager
+def phase(name: str, items: int = 0) -> Iterator[None]:
+    if not ENABLED:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        stats = _phases.setdefault(name, [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += items
+        stats[2] += time.perf_counter() - wall
+        stats[3] += time.process_time() - cpu
+
+
+def count(name: str, items: int):
+    # Adds items to a phase once the number is known, e.g. mods parsed.
+    if ENABLED:
+        _phases.setdefault(name, [0, 0, 0.0, 0.0])[1] += items
+
+
+def start(
+    output_format: str = "table",
+    cprofile_path: Optional[str] = None,
+    tracemalloc_path: Optional[str] = None,
+):
+    global ENABLED, _output_format, _started, _profiler
+    global _cprofile_path, _tracemalloc_path
+
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown profile format {output_format}")
+    ENABLED = True
+    _output_format = output_format
+    _cprofile_path = cprofile_path
+    _tracemalloc_path = tracemalloc_path
+    _phases.clear()
+
+    if tracemalloc_path:
+        import tracemalloc
+
+        tracemalloc.start()
+    if cprofile_path:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    _started = (time.perf_counter(), time.process_time())
+
+
+def start_from_env(output_format: Optional[str] = None):
+    # output_format comes from --profile and wins over RMM_PROFILE.
+    mode = output_format or os.environ.get("RMM_PROFILE", "")
+    if not mode or mode == "0":
+        return
+    start(
+        mode if mode in FORMATS else "table",
+        os.environ.get("RMM_PROFILE_CPROFILE"),
+        os.environ.get("RMM_PROFILE_TRACEMALLOC"),
+    )
+
+
+def rows() -> List[dict]:
+    return [
+        {
+            "phase": name,
+            "calls": int(calls),
+            "items": int(items),
+            "wall_ms": round(wall * 1000, 3),
+            "cpu_ms": round(cpu * 1000, 3),
+        }
+        for name, (calls, items, wall, cpu) in _phases.items()
+    ]
+
+
+def finish(stream: Optional[TextIO] = None):
+    global ENABLED, _profiler
+
+    if not ENABLED:
+        return
+    ENABLED = False
+    total = {
+        "phase": "total",
+        "calls": 1,
+        "items": 0,
+        "wall_ms": round((time.perf_counter() - _started[0]) * 1000, 3),
+        "cpu_ms": round((time.process_time() - _started[1]) * 1000, 3),
+    }
+
+    if _profiler:
+        _profiler.disable()
+        _profiler.dump_stats(_cprofile_path)
+        _profiler = None
+
+    peak = None
+    if _tracemalloc_path:
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        with open(_tracemalloc_path, "w", encoding="utf-8") as f:
+            f.write(f"peak {peak} bytes\n")
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                f.write(f"{stat}\n")
+
+    # stderr, so --json output on stdout stays parseable.
+    stream = stream or sys.stderr
+    if _output_format == "json":
+        report = {"phases": rows() + [total]}
+        if peak is not None:
+            report["peak_bytes"] = peak
+        stream.write(json.dumps(report) + "\n")
+    else:
+        from tabulate import tabulate
+
+        stream.write("\n" + tabulate(rows() + [total], headers="keys") + "\n")
+        if peak is not None:
+            stream.write(f"peak memory: {peak} bytes\n")
+    stream.flush()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Disk usage of installed mods by kind of file. Sizes are cached with the
+# mtime of every directory in a mod: adding, removing or renaming a file
+# changes its directory's mtime, so a mod is only walked again when one of
+# those differs, and checking costs a stat per directory rather than per file.
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .cache import JsonCache
+
+CATEGORIES = ["textures", "assemblies", "xml", "sounds", "other"]
+
+EXTENSIONS = {
+    ".png": "textures",
+    ".dds": "textures",
+    ".jpg": "textures",
+    ".jpeg": "textures",
+    ".psd": "textures",
+    ".tga": "textures",
+    ".dll": "assemblies",
+    ".xml": "xml",
+    ".wav": "sounds",
+    ".ogg": "sounds",
+    ".mp3": "sounds",
+}
+
+
+def category(name: str) -> str:
+    return EXTENSIONS.get(os.path.splitext(name)[1].lower(), "other")
+
+
+def empty() -> Dict[str, int]:
+    return dict.fromkeys(CATEGORIES, 0)
+
+
+class DiskUsage:
+    _cache = JsonCache("sizes")
+
+    @staticmethod
+    def walk(path: Path) -> Tuple[Dict[str, int], Dict[str, int]]:
+        # Returns (directory mtimes, bytes per category).
+        dirs: Dict[str, int] = {}
+        sizes = empty()
+        stack = [""]
+        while stack:
+            relative = stack.pop()
+            directory = os.path.join(path, relative)
+            dirs[relative] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(os.path.join(relative, entry.name))
+                    elif entry.is_file():
+                        sizes[category(entry.name)] += entry.stat().st_size
+        return dirs, sizes
+
+    @classmethod
+    def _cached(cls, path: Path):
+        entry = cls._cache.get(str(path))
+        if not entry:
+            return None
+        try:
+            for relative, mtime in entry["dirs"].items():
+                if os.stat(os.path.join(path, relative)).st_mtime_ns != mtime:
+                    return None
+        except OSError:
+            return None
+        return entry["sizes"]
+
+    @classmethod
+    def measure(cls, path: Path) -> Dict[str, int]:
+        # Safe to call from several threads; each path has its own cache key.
+        sizes = cls._cached(path)
+        if sizes is not None:
+            return sizes
+        try:
+            dirs, sizes = cls.walk(path)
+        except OSError:
+            return empty()
+        cls._cache.set(str(path), {"dirs": dirs, "sizes": sizes})
+        return sizes
+
+    @classmethod
+    def save(cls, roots: List[Path], installed: List[Path]):
+        # Forgets mods under the roots that are no longer installed.
+        prefixes = tuple(os.path.join(n, "") for n in roots)
+        keep = {str(n) for n in installed}
+        for key in list(cls._cache.data):
+            if key.startswith(prefixes) and key not in keep:
+                cls._cache.delete(key)
+        cls._cache.save()
@@ -1,11 +1,17 @@
+import hashlib
+import os
 import re
 import shutil
 import subprocess
 import sys
+import tempfile
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Generator, List, Optional, Union, cast
-from xml.dom import minidom
+from typing import Generator, Iterable, List, Optional, Tuple, Union, cast
+
+# Files rmm writes into mod directories; excluded from content hashes.
+RMM_FILE_PREFIX = ".rmm"
+HASH_CHUNK_SIZE = 1 << 20
 
 
 def platform() -> Optional[str]:
@@ -22,12 +28,11 @@ def execute(cmd) -> Generator[str, None, None]:
         close_fds=True,
         shell=True,
     ) as proc:
-        for line in iter(proc.stdout.readline, b""):
-            yield line
-            if (r := proc.poll()) is not None:
-                if r != 0:
-                    raise subprocess.CalledProcessError(r, cmd)
-                break
+        assert proc.stdout
+        # Text mode: readline returns "" at EOF, never b"".
+        yield from iter(proc.stdout.readline, "")
+        if (r := proc.wait()) != 0:
+            raise subprocess.CalledProcessError(r, cmd)
 
 
 def run_sh(cmd: str) -> str:
@@ -35,9 +40,13 @@ def run_sh(cmd: str) -> str:
     return subprocess.check_output(cmd, text=True, shell=True).strip()
 
 
-def copy(source: Path, destination: Path, recursive: bool = False):
+def copy(
+    source: Path, destination: Path, recursive: bool = False, exist_ok: bool = False
+):
     if recursive:
-        shutil.copytree(source, destination)
+        from .fileops import copy_tree
+
+        copy_tree(source, destination, dirs_exist_ok=exist_ok)
     else:
         shutil.copy2(source, destination, follow_symlinks=True)
 
@@ -47,7 +56,116 @@ def move(source: Path, destination: Path):
 
 
 def remove(dest: Path):
-    shutil.rmtree(dest)
+    from .fileops import remove_tree
+
+    # A mod linked into a profile only loses its link.
+    if dest.is_symlink():
+        dest.unlink()
+        return
+    remove_tree(dest)
+
+
+def atomic_write(path: Path, chunks: Iterable[str], encoding: str = "utf-8"):
+    # Write to a sibling temp file and swap it in, so readers never see a
+    # partially written file and a crash leaves the original intact.
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{path.name}.", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with os.fdopen(fd, "w", encoding=encoding, newline="\n") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            shutil.copymode(path, tmp_name)
+        except OSError:
+            pass
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def tree_files(path: Path) -> Generator[Tuple[str, os.stat_result], None, None]:
+    # Yields (relative posix path, stat) for every regular file under path.
+    stack = [("", path)]
+    while stack:
+        prefix, directory = stack.pop()
+        with os.scandir(directory) as it:
+            entries = list(it)
+        for entry in entries:
+            relative = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                stack.append((relative + "/", Path(entry.path)))
+            elif entry.is_file() and not (
+                not prefix and entry.name.startswith(RMM_FILE_PREFIX)
+            ):
+                yield relative, entry.stat()
+
+
+def tree_size(path: Path) -> int:
+    return sum(st.st_size for _, st in tree_files(path))
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_tree(path: Path) -> Tuple[int, str]:
+    size = 0
+    h = hashlib.sha256()
+    for relative, st in sorted(tree_files(path)):
+        size += st.st_size
+        h.update(f"{relative}\0{hash_file(path / relative)}\n".encode())
+    return size, h.hexdigest()
+
+
+def format_bytes(n: float) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def batched(iterable: Iterable, n: int) -> Generator[list, None, None]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def short_version(text: str) -> Optional[str]:
+    # "1.4.3901 rev20" becomes "1.4", the form mods use in supportedVersions.
+    m = re.match(r"\s*(\d+\.\d+)", text)
+    return m.group(1) if m else None
+
+
+def game_version(game_path: Path) -> Optional[str]:
+    try:
+        text = (game_path / "Version.txt").read_text(encoding="utf-8")
+    except OSError:
+        return None
+    return short_version(text)
+
+
+def version_key(version: str) -> Tuple[int, ...]:
+    try:
+        return tuple(int(n) for n in version.split("."))
+    except ValueError:
+        return ()
 
 
 def list_set_intersection(a: list, b: list) -> list:
@@ -79,16 +197,6 @@ def element_grab(element: str, root: ET.Element) -> Optional[str]:
         return None
 
 
-def et_pretty_xml(root: ET.Element) -> str:
-    return minidom.parseString(
-        re.sub(
-            r"[\n\t\s]*",
-            "",
-            (ET.tostring(cast(ET.Element, root), "utf-8").decode()),
-        )
-    ).toprettyxml(indent="  ", newl="\n")
-
-
 def sanitize_path(path: Union[str, Path]):
     if isinstance(path, Path):
         path = str(path)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Minimal reader for Valve's KeyValues (VDF/ACF) text format, enough for
+# libraryfolders.vdf and appmanifest_*.acf. Keys are lower-cased since Steam
+# treats them case-insensitively and has changed their case between releases.
+
+import re
+from pathlib import Path
+from typing import Iterator, Union
+
+TOKEN = re.compile(
+    r'"((?:[^"\\]|\\.)*)"'  # quoted string
+    r"|([{}])"  # braces
+    r"|//[^\n]*"  # comment
+    r"|([^\s{}\"]+)"  # bare word
+)
+ESCAPES = {"n": "\n", "t": "\t", "\\": "\\", '"': '"'}
+
+VdfValue = Union[str, dict]
+
+
+class VdfParseError(Exception):
+    pass
+
+
+def _unescape(s: str) -> str:
+    return re.sub(r"\\(.)", lambda m: ESCAPES.get(m.group(1), m.group(1)), s)
+
+
+def _tokens(text: str) -> Iterator[str]:
+    for match in TOKEN.finditer(text):
+        quoted, brace, bare = match.groups()
+        if quoted is not None:
+            yield _unescape(quoted)
+        elif brace is not None:
+            yield brace
+        elif bare is not None:
+            yield bare
+
+
+def loads(text: str) -> dict:
+    root: dict = {}
+    stack = [root]
+    tokens = _tokens(text)
+    for token in tokens:
+        if token == "}":
+            if len(stack) == 1:
+                raise VdfParseError("Unbalanced '}'")
+            stack.pop()
+            continue
+        if token == "{":
+            raise VdfParseError("Section without a key")
+        try:
+            value = next(tokens)
+        except StopIteration:
+            raise VdfParseError(f"Missing value for key {token}")
+        if value == "{":
+            section: dict = {}
+            stack[-1][token.lower()] = section
+            stack.append(section)
+        elif value == "}":
+            raise VdfParseError(f"Missing value for key {token}")
+        else:
+            stack[-1][token.lower()] = value
+    if len(stack) != 1:
+        raise VdfParseError("Unterminated section")
+    return root
+
+
+def load(path: Path) -> dict:
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        return loads(f.read())
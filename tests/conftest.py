@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Caches are opened when rmm is imported; keep them away from the user's.
+os.environ["RMM_CACHE_PATH"] = tempfile.mkdtemp(prefix="rmm-test-cache-")
+
+from benchmarks import fixtures  # noqa: E402
+from rmm.config import Config  # noqa: E402
+from rmm.manager import Manager  # noqa: E402
+from rmm.modsconfig import COMMUNITY_RULES_PATH  # noqa: E402
+
+
+@pytest.fixture
+def specs():
+    return fixtures.mod_specs(20)
+
+
+@pytest.fixture
+def manager(tmp_path: Path, specs) -> Manager:
+    game = tmp_path / "game"
+    mod_path = fixtures.write_mods(game, specs)
+    (game / "Version.txt").write_text("1.4.3901 rev20")
+    fixtures.write_community_rules(mod_path / COMMUNITY_RULES_PATH, specs)
+    config = Config(path=mod_path, config_path=tmp_path / "config")
+    config.modsconfig_path = fixtures.write_modsconfig(
+        tmp_path / "config" / "ModsConfig.xml", specs[:10]
+    )
+    return Manager(config)
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+from rmm.batch import BatchRunner
+from rmm.modsconfig import ModsConfig
+
+
+def test_sort_then_enable(manager, specs):
+    target = specs[15].packageid
+    assert BatchRunner(manager).run(["sort", f"enable {target}"])
+
+    written = ModsConfig(manager.config.modsconfig_path)
+    assert target in written.mods
+    assert specs[0].packageid in written.mods
+
+
+def test_failed_line_leaves_modsconfig(manager):
+    before = manager.config.modsconfig_path.read_text()
+    assert not BatchRunner(manager).run(["sort", "enable no.such.mod"])
+    assert manager.config.modsconfig_path.read_text() == before
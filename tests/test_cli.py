@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def rmm(manager, tmp_path):
+    user = tmp_path / "user"
+    (user / "Config").mkdir(parents=True)
+    (user / "Saves").mkdir()
+    shutil.copy(manager.config.modsconfig_path, user / "Config" / "ModsConfig.xml")
+    (manager.config.mod_path / "broken").mkdir()
+    env = {
+        **os.environ,
+        "RMM_SOCKET": str(tmp_path / "no-daemon.sock"),
+        "RMM_CACHE_PATH": str(tmp_path / "cache"),
+    }
+    game = manager.config.mod_path.parent
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, "-m", "rmm.cli", "-p", str(game), "-u", str(user), *args],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+
+    return run
+
+
+def test_json_list_keeps_messages_off_stdout(rmm):
+    result = rmm("--json", "list")
+    assert "No About.xml found" in result.stderr
+    rows = json.loads(result.stdout)
+    assert "bench.author0.mod0" in {n["packageid"] for n in rows}
+
+
+def test_json_check_keeps_messages_off_stdout(rmm, manager, specs):
+    texture = manager.config.mod_path / specs[2].packageid / "Textures" / "a.png"
+    texture.parent.mkdir()
+    texture.write_bytes(b"png")
+    assert rmm("check", "-i").returncode == 0
+    texture.write_bytes(b"changed")
+
+    result = rmm("--json", "check")
+    assert result.returncode == 1
+    assert "rmm check -r" in result.stderr
+    rows = {n["packageid"]: n for n in json.loads(result.stdout)}
+    assert rows[specs[2].packageid]["status"] == "broken"
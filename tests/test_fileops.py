@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+import os
+
+from rmm.fileops import copy_tree, remove_tree
+
+
+def test_copy_tree_keeps_links(tmp_path):
+    source = tmp_path / "mod"
+    (source / "Textures").mkdir(parents=True)
+    (source / "Textures" / "a.png").write_bytes(b"png")
+    os.symlink("..", source / "Textures" / "loop")
+    os.symlink("a.png", source / "Textures" / "b.png")
+
+    copy_tree(source, tmp_path / "copy")
+
+    copied = tmp_path / "copy" / "Textures"
+    assert (copied / "a.png").read_bytes() == b"png"
+    assert os.readlink(copied / "loop") == ".."
+    assert os.readlink(copied / "b.png") == "a.png"
+
+    remove_tree(tmp_path / "copy")
+    assert not (tmp_path / "copy").exists()
+    assert (source / "Textures" / "a.png").exists()
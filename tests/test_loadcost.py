@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import struct
+
+from rmm.loadcost import image_size
+
+
+def _segment(marker: int, body: bytes) -> bytes:
+    return struct.pack(">BBH", 0xFF, marker, len(body) + 2) + body
+
+
+def test_jpeg_size(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(
+        b"\xff\xd8"
+        + _segment(0xE0, b"JFIF\x00" + bytes(9))
+        + _segment(0xC0, struct.pack(">BHHB", 8, 48, 64, 3) + bytes(9))
+    )
+    assert image_size(str(path)) == (64, 48)
+
+
+def test_corrupt_jpeg_segment(tmp_path):
+    for length in (0, 1):
+        path = tmp_path / f"{length}.jpg"
+        path.write_bytes(b"\xff\xd8\xff\xe0" + struct.pack(">H", length) + bytes(32))
+        assert image_size(str(path)) == (0, 0)
+
+
+def test_truncated_jpeg(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"\xff\xd8" + _segment(0xE0, bytes(100))[:20])
+    assert image_size(str(path)) == (0, 0)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import shutil
+
+from rmm import manager as manager_module
+
+
+def test_sync_skips_workshop_subscriptions(manager, specs, tmp_path, monkeypatch):
+    workshop = tmp_path / "workshop"
+    workshop.mkdir()
+    subscribed = specs[3]
+    shutil.move(
+        str(manager.config.mod_path / subscribed.packageid),
+        str(workshop / str(subscribed.steamid)),
+    )
+    manager.config.workshop_path = workshop
+    manager.invalidate_index()
+
+    requested = []
+
+    def download(steamids):
+        requested.extend(steamids)
+        return [], tmp_path / "steam"
+
+    monkeypatch.setattr(manager_module.SteamDownloader, "download", download)
+    manager.sync_mods([m for m in manager.installed_mods() if m.steamid])
+
+    assert subscribed.steamid not in requested
+    assert specs[4].steamid in requested
+    assert not (manager.config.mod_path / subscribed.packageid).exists()
+
+
+def test_unpack_leaves_workshop_subscriptions(manager, specs, tmp_path):
+    pack = tmp_path / "mods.pack"
+    packed = {s.packageid for s in specs[:5]}
+    manager.pack_mods(
+        pack, [m for m in manager.installed_mods() if m.packageid in packed]
+    )
+    workshop = tmp_path / "workshop"
+    workshop.mkdir()
+    subscribed = specs[3]
+    folder = workshop / str(subscribed.steamid)
+    shutil.move(str(manager.config.mod_path / subscribed.packageid), str(folder))
+    (folder / "About" / "changed.txt").write_text("newer upload")
+    manager.config.workshop_path = workshop
+    manager.invalidate_index()
+
+    manager.unpack_mods(pack)
+    assert not (manager.config.mod_path / subscribed.packageid).exists()
+
+    manager.unpack_mods(pack, local=True)
+    assert (manager.config.mod_path / subscribed.packageid).exists()
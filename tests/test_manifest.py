@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from rmm import fileops
+from rmm.manifest import Manifest
+
+
+@pytest.fixture
+def steam_cache(tmp_path, specs):
+    cache = tmp_path / "steam"
+    source = cache / str(specs[0].steamid)
+    (source / "About").mkdir(parents=True)
+    (source / "About" / "About.xml").write_text(
+        f"<ModMetaData><packageId>{specs[0].packageid}</packageId></ModMetaData>"
+    )
+    (source / "Textures").mkdir()
+    for n in range(200):
+        (source / "Textures" / f"{n}.png").write_bytes(bytes(n) * 100)
+    return cache
+
+
+def test_install_records_manifest(manager, specs, steam_cache):
+    manager.remove_mod(manager.installed_mods_dict()[specs[0].packageid])
+    assert manager.install_mod(steam_cache, specs[0].steamid)
+
+    result = Manifest.check(manager.config.mod_path / specs[0].packageid)
+    assert result.status == "ok"
+    assert result.rehashed == 0
+
+
+def test_interrupted_install_is_broken(manager, specs, steam_cache, monkeypatch):
+    manager.remove_mod(manager.installed_mods_dict()[specs[0].packageid])
+    copy_file = fileops._copy_file
+
+    def truncated(src, dst, size):
+        if src.endswith("150.png"):
+            with open(dst, "wb") as f:
+                f.write(b"partial")
+            raise OSError("No space left on device")
+        copy_file(src, dst, size)
+
+    monkeypatch.setattr(fileops, "_copy_file", truncated)
+    with pytest.raises(OSError):
+        manager.install_mod(steam_cache, specs[0].steamid)
+
+    result = Manifest.check(manager.config.mod_path / specs[0].packageid)
+    assert result.status == "broken"
+    assert "Textures/150.png" in result.changed
+
+
+def test_install_interrupted_before_about(manager, specs, steam_cache, monkeypatch):
+    manager.remove_mod(manager.installed_mods_dict()[specs[0].packageid])
+    copy_file = fileops._copy_file
+
+    def failing(src, dst, size):
+        if src.endswith("About.xml"):
+            raise OSError("No space left on device")
+        copy_file(src, dst, size)
+
+    monkeypatch.setattr(fileops, "_copy_file", failing)
+    with pytest.raises(OSError):
+        manager.install_mod(steam_cache, specs[0].steamid)
+
+    results = {str(m.dirname): (m, r) for m, r in manager.check_mods()}
+    mod, result = results[specs[0].packageid]
+    assert result.status == "broken"
+    assert "About/About.xml" in result.missing
+    assert mod.steamid == specs[0].steamid
+
+    monkeypatch.setattr(fileops, "_copy_file", copy_file)
+    assert manager.install_mod(steam_cache, specs[0].steamid)
+    assert Manifest.check(manager.config.mod_path / specs[0].packageid).status == "ok"
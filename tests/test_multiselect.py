@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+from rmm.multiselect import OrderMenu
+
+
+class Screen:
+    def getmaxyx(self):
+        return 24, 80
+
+    def erase(self):
+        pass
+
+
+class Constraints:
+    def __init__(self, positions: dict):
+        self.positions = positions
+
+    def valid_position(self, pid: str):
+        return self.positions[pid]
+
+    def update(self, data, pids, start, end):
+        pass
+
+
+def test_snap_to_neighbour_keeps_filter():
+    data = [("a.first", True), ("b.other", True), ("a.second", True)]
+    menu = OrderMenu(Screen(), data, Constraints({"a.first": 1}))
+    menu.apply_filter("a.")
+    menu.selection = 0
+
+    menu.snap()
+
+    assert [k for k, _ in menu.data] == ["b.other", "a.first", "a.second"]
+    assert menu.filter == "a."
+    assert menu.view == [1, 2]
+    assert menu.data[menu.view[menu.selection]][0] == "a.first"
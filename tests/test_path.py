@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+from rmm.path import PathFinder
+
+
+def test_finds_game_under_dev(tmp_path):
+    game = tmp_path / "dev" / "games" / "RimWorld"
+    (game / "Mods").mkdir(parents=True)
+    (game / "Version.txt").write_text("1.4.3901 rev20")
+
+    assert PathFinder._search_root(tmp_path, PathFinder._is_game_dir) == game / "Mods"
+
+
+def test_prunes_tool_dirs(tmp_path):
+    game = tmp_path / "node_modules" / "RimWorld"
+    (game / "Mods").mkdir(parents=True)
+    (game / "Version.txt").write_text("1.4.3901 rev20")
+
+    assert PathFinder._search_root(tmp_path, PathFinder._is_game_dir) is None
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+from rmm.modsconfig import ModsConfig
+
+
+def _enabled(manager):
+    return list(ModsConfig(manager.config.modsconfig_path).mods)
+
+
+def test_use_keeps_changes_of_the_profile_left(manager, specs):
+    manager.save_profile("a")
+    manager.save_profile("b")
+    manager.disable_mods([manager.installed_mods_dict()[specs[5].packageid]])
+    manager.write_modsconfig()
+
+    manager.use_profile("a")
+    assert specs[5].packageid in _enabled(manager)
+    manager.use_profile("b")
+    assert specs[5].packageid not in _enabled(manager)
+
+
+def test_save_all_links_the_whole_store(manager, specs):
+    manager.save_profile("a")
+    manager.disable_mods([manager.installed_mods_dict()[specs[1].packageid]])
+    manager.save_profile("b")
+    assert specs[1].packageid not in manager.installed_mods_dict()
+
+    manager.save_profile("everything", all_mods=True)
+    installed = manager.installed_mods_dict()
+    assert {n.packageid for n in specs} <= set(installed)